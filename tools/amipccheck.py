@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+# Loopback check of amipc on CPython asyncio: an AsyncServiceManager serves
+# a service in a thread and mipc clients talk with it over TCP. It covers
+# the negotiation of mipc.client (packers, msgid and inflate), a plain call,
+# a coroutine handler, a reply large enough to be deflated, pipelined calls
+# (imap), a JSON client which doesn't negotiate, and that a port handles
+# its requests one at a time while a slow coroutine holds back no other
+# port. Exits 1 on a failure.
+
+import asyncio
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import amipc
+import mipc
+
+BLOB = b'0123456789abcdef' * 256		# 4KB, compressible
+SLOW_s = 0.3
+
+@mipc.autoreply
+class CheckService(mipc.ServiceBase):
+
+    @mipc.autoreply
+    def echo(self, v):
+        return v
+
+    @mipc.autoreply
+    async def later(self, v):
+        await asyncio.sleep(0.01)
+        return v * 2
+
+    @mipc.autoreply
+    async def slow(self, v):
+        await asyncio.sleep(SLOW_s)
+        return v
+
+    @mipc.autoreply
+    def blob(self):
+        return BLOB
+
+def serve():
+    manager = amipc.AsyncServiceManager()
+    server = mipc.AcceptablePort(('127.0.0.1', 0))
+    manager.register(server, CheckService())
+    th = threading.Thread(target=manager.run_forever)
+    th.daemon = True
+    th.start()
+    return server.socket.getsockname()
+
+def main():
+    addr = serve()
+    failures = []
+
+    def check(name, got, expect):
+        ok = got == expect
+        print('%-24s %s' % (name, 'ok' if ok else 'NG: %r' % (got,)))
+        if not ok:
+            failures.append(name)
+
+    cli = mipc.client(addr)
+    check('negotiate packer', cli._packer.NAME, 'msgpack')
+    check('negotiate msgid', cli._pipelining, True)
+    check('negotiate inflate', cli.peer_inflate, mipc._inflate is not None)
+    check('call', cli.echo([1, 'a', b'b']), [1, 'a', b'b'])
+    check('coroutine handler', cli.later(21), 42)
+    check('deflated reply', cli.blob(), BLOB)
+    check('pipelined calls', list(cli.imap('echo', [(i,) for i in range(20)])),
+          list(range(20)))
+    cli.close()
+
+    cli = mipc.IOPort(packer=mipc.JSONPacker()).connect(addr).negotiate()
+    check('json client', cli.echo('x'), 'x')
+    cli.close()
+
+    # pipelined on one port: the echo is handled after the slow one, so the
+    # reply of slow has come when the one of echo is there
+    slow = mipc.client(addr)
+    first, second = slow.submit('slow', 1), slow.submit('echo', 2)
+    check('one at a time', (second.result(), first.done()), (2, True))
+    check('in order', first.result(), 1)
+    # another port is served while the slow one waits
+    fast = mipc.client(addr)
+    future = slow.submit('slow', 3)
+    tv = time.time()
+    fast.echo(4)
+    check('other ports not held', time.time() - tv < SLOW_s, True)
+    future.result()
+    slow.close()
+    fast.close()
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
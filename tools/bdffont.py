@@ -0,0 +1,544 @@
+#!/usr/bin/python3
+
+# Font build of display.py: a BDF font is parsed once into a glyph table,
+# and FCF (fixed color font, 2 bytes a pixel) and GCF (graphic composit
+# font, strokes drawn by lines) are compiled from it in one pass. Glyphs
+# are compiled in a process pool, and a build is skipped when the BDF and
+# the options are unchanged (outputs are cached by the content hash).
+#
+#   bdffont.py --fcf out.fcf --gcf out.gcf -w 5 -r 1:11 mplus_f10r.bdf
+#   bdffont.py --preset mplus_10x5 		# the fonts of fonts/
+#
+# Glyphs are placed in the cell of FONTBOUNDINGBOX by their BBX, and the
+# output takes the columns 0..width-1 and the rows row_beg..row_end-1 of the
+# cell. The files hold the glyphs of the codes 0..count-1 (a code without a
+# glyph is blank), display.py reads count of _FontBase.FONTNUM (128).
+#
+# --format 2 writes the v2 files of display.py: the glyphs of the codes
+# which have pixels only, indexed by the sorted codes, the FCF pixels run
+# length encoded and the GCF strokes of 2 bytes when the cell is up to 16x16.
+#
+#   bdffont.py --format 2 -c 0x3040-0x30ff --fcf kana.fcf -w 12 kana12.bdf
+
+import argparse
+import array
+import collections
+import concurrent.futures
+import hashlib
+import os
+import shutil
+import sys
+
+VERSION = 3			# of the compiler, a part of the cache key
+CACHE_DIR = os.path.expanduser('~/.cache/bdffont')
+FCF_COLORS = (b'\x00\x00', b'\xff\xff')
+
+# the fonts of fonts/: BDF, width, row_beg, row_end
+PRESETS = {
+    'misaki_7x4': ('misaki_4x8_iso8859.bdf', 4, 0, 7),
+    'mplus_10x5': ('mplus_f10r.bdf', 5, 1, 11),
+    'mplus_12x5': ('mplus_f12r.bdf', 5, 1, 13),
+}
+
+# width and row_end of None are the cell of the BDF. strokes is the GCF
+# encoder: 'greedy' (as bdf2gcf), 'cover' (fewest lines) or 'rects' (filled
+# rectangles too, when they take fewer strokes). version is of the files, 1
+# or 2 (count is not used).
+Options = collections.namedtuple('Options',
+                                 'width row_beg row_end first last count strokes version',
+                                 defaults=('cover', 1))
+STROKES = ('greedy', 'cover', 'rects')
+
+# v2 files (display.V2_HEADER_b, V2_PACKED)
+V2_KINDS = {'.fcf': b'F', '.gcf': b'G'}
+V2_PACKED = 0x01
+
+class BDFError(Exception):
+    pass
+
+#----------------------------------------------------------------------------
+#                                 BDF parser
+#----------------------------------------------------------------------------
+
+# glyph table of a BDF: cell width, height, and {code: rows}. A row is an int
+# of width bits, the most significant bit is the column 0.
+BDFFont = collections.namedtuple('BDFFont', 'width height glyphs')
+
+def parse_bdf(data):
+    lines = iter(data.decode('latin-1').splitlines())
+    fw = fh = fx = fy = None
+    glyphs = {}
+    code = bbx = None
+    for line in lines:
+        words = line.split()
+        if not words:
+            continue
+        key = words[0]
+        if key == 'FONTBOUNDINGBOX':
+            fw, fh, fx, fy = (int(v) for v in words[1:5])
+        elif key == 'STARTCHAR':
+            code = bbx = None
+        elif key == 'ENCODING':
+            code = int(words[1])
+        elif key == 'BBX':
+            bbx = tuple(int(v) for v in words[1:5])
+        elif key == 'BITMAP':
+            if fw is None:
+                raise BDFError('BITMAP before FONTBOUNDINGBOX')
+            w, h, x, y = bbx or (fw, fh, fx, fy)
+            rows = []
+            for line in lines:
+                if line.startswith('ENDCHAR'):
+                    break
+                rows.append(line.strip())
+            if code is None or code < 0:
+                continue
+            top = (fh + fy) - (h + y)	# rows above the glyph in the cell
+            left = x - fx
+            cell = [0] * fh
+            for r, hexs in enumerate(rows[:h]):
+                if not hexs or not 0 <= top + r < fh:
+                    continue
+                bits = int(hexs, 16) >> (len(hexs) * 4 - w)	# w bits
+                shift = fw - left - w
+                cell[top + r] = (bits << shift if shift >= 0 else bits >> -shift) & ((1 << fw) - 1)
+            glyphs[code] = cell
+    if fw is None:
+        raise BDFError('no FONTBOUNDINGBOX')
+    return BDFFont(fw, fh, glyphs)
+
+#----------------------------------------------------------------------------
+#                               glyph compiler
+#----------------------------------------------------------------------------
+
+# bitmap (rows of 0/1) of the output cell of a glyph
+def crop(font, rows, opts):
+    height = opts.row_end - opts.row_beg
+    bitmap = []
+    for r in range(opts.row_beg, opts.row_end):
+        row = rows[r] if 0 <= r < len(rows) else 0
+        bitmap.append([(row >> (font.width - 1 - c)) & 1 if c < font.width else 0
+                       for c in range(opts.width)])
+    return bitmap[:height]
+
+def fcf_glyph(bitmap):
+    return b''.join(FCF_COLORS[b] for row in bitmap for b in row)
+
+# strokes covering the pixels (bdf2gcf): the longest run of pixels not drawn
+# yet is taken, by a row or by a column, and the pixels already drawn can be
+# drawn again in a run.
+_YET, _SET, _DONT = 0, 1, -1
+
+def gcf_strokes(bitmap):
+    height = len(bitmap)
+    width = len(bitmap[0]) if bitmap else 0
+    m = [[_YET if b else _DONT for b in row] for row in bitmap]
+    strokes = []
+    while True:
+        hm = (0, -1, -1, -1)	# max-chg, row, col_beg, col_end
+        for r in range(height):
+            for b in range(width):
+                if m[r][b] == _YET:
+                    break
+            else:
+                continue
+            chg = 0
+            for e in range(b, width):
+                if m[r][e] == _YET:
+                    chg += 1
+                elif m[r][e] != _SET:
+                    break
+            else:
+                e = width
+            e -= 1
+            if chg > hm[0]:
+                hm = (chg, r, b, e)
+        if hm[0] == 0:
+            return strokes
+
+        vm = (0, -1, -1, -1)	# max-chg, col, row_beg, row_end
+        for c in range(width):
+            for b in range(height):
+                if m[b][c] == _YET:
+                    break
+            else:
+                continue
+            chg = 0
+            for e in range(b, height):
+                if m[e][c] == _YET:
+                    chg += 1
+                elif m[e][c] != _SET:
+                    break
+            else:
+                e = height
+            e -= 1
+            if chg > vm[0]:
+                vm = (chg, c, b, e)
+
+        if hm[0] < vm[0]:
+            _, c, b_row, e_row = vm
+            for i in range(b_row, e_row+1):
+                m[i][c] = _SET
+            strokes.append((c, b_row, c, e_row))
+        else:
+            _, r, b_col, e_col = hm
+            for i in range(b_col, e_col+1):
+                m[r][i] = _SET
+            strokes.append((b_col, r, e_col, r))
+
+# fewest lines covering the pixels. A pixel is covered by its run of the
+# row or of the column, and taking whole runs loses nothing, so this is the
+# minimum vertex cover of the bipartite graph of row runs and column runs
+# with a pixel as an edge: the maximum matching (Konig's theorem).
+def gcf_cover(bitmap):
+    height = len(bitmap)
+    width = len(bitmap[0]) if bitmap else 0
+    hruns, vruns = [], []
+    hid = [[None] * width for _ in range(height)]
+    vid = [[None] * width for _ in range(height)]
+    for r in range(height):
+        for c in range(width):
+            if bitmap[r][c] and hid[r][c] is None:
+                e = c
+                while e + 1 < width and bitmap[r][e+1]:
+                    e += 1
+                for i in range(c, e + 1):
+                    hid[r][i] = len(hruns)
+                hruns.append((c, r, e, r))
+    for c in range(width):
+        for r in range(height):
+            if bitmap[r][c] and vid[r][c] is None:
+                e = r
+                while e + 1 < height and bitmap[e+1][c]:
+                    e += 1
+                for i in range(r, e + 1):
+                    vid[i][c] = len(vruns)
+                vruns.append((c, r, c, e))
+    adj = [[] for _ in hruns]
+    for r in range(height):
+        for c in range(width):
+            if bitmap[r][c]:
+                adj[hid[r][c]].append(vid[r][c])
+
+    match_h = [None] * len(hruns)
+    match_v = [None] * len(vruns)
+    def augment(h, seen):
+        for v in adj[h]:
+            if v not in seen:
+                seen.add(v)
+                if match_v[v] is None or augment(match_v[v], seen):
+                    match_h[h] = v
+                    match_v[v] = h
+                    return True
+        return False
+    for h in range(len(hruns)):
+        augment(h, set())
+
+    # Konig: from the unmatched row runs by alternating paths, the cover is
+    # the row runs not reached and the column runs reached
+    reached_h = set(h for h in range(len(hruns)) if match_h[h] is None)
+    reached_v = set()
+    todo = list(reached_h)
+    while todo:
+        for v in adj[todo.pop()]:
+            if v not in reached_v:
+                reached_v.add(v)
+                h = match_v[v]
+                if h is not None and h not in reached_h:
+                    reached_h.add(h)
+                    todo.append(h)
+    strokes = [hruns[h] for h in range(len(hruns)) if h not in reached_h]
+    strokes += [vruns[v] for v in sorted(reached_v)]
+    strokes.sort(key=lambda s: (s[1], s[0], s[3], s[2]))
+    return strokes
+
+# strokes with filled rectangles (both columns and rows differ): the greedy
+# set cover of the maximal rectangles of pixels, taken when it is fewer than
+# the lines of gcf_cover
+def gcf_rects(bitmap):
+    lines = gcf_cover(bitmap)
+    height = len(bitmap)
+    width = len(bitmap[0]) if bitmap else 0
+    rects = {}
+    for r0 in range(height):
+        for c0 in range(width):
+            right = width
+            for r1 in range(r0, height):
+                c1 = c0
+                while c1 < right and bitmap[r1][c1]:
+                    c1 += 1
+                right = c1
+                if right == c0:
+                    break
+                mask = 0
+                for r in range(r0, r1 + 1):
+                    mask |= ((1 << (right - c0)) - 1) << (r * width + c0)
+                rects[mask] = (c0, r0, right - 1, r1)
+    # maximal ones only
+    masks = sorted(rects, key=lambda m: -bin(m).count('1'))
+    maximal = []
+    for m in masks:
+        if not any(m & big == m for big in maximal):
+            maximal.append(m)
+    todo = sum(1 << (r * width + c) for r in range(height) for c in range(width)
+               if bitmap[r][c])
+    strokes = []
+    while todo and len(strokes) < len(lines):
+        best = max(maximal, key=lambda m: bin(m & todo).count('1'))
+        strokes.append(rects[best])
+        todo &= ~best
+    if todo or len(strokes) >= len(lines):
+        return lines
+    strokes.sort(key=lambda s: (s[1], s[0], s[3], s[2]))
+    return strokes
+
+ENCODERS = {'greedy': gcf_strokes, 'cover': gcf_cover, 'rects': gcf_rects}
+
+def gcf_glyph(bitmap, strokes='cover'):
+    return b''.join(bytes(s) for s in ENCODERS[strokes](bitmap))
+
+def _compile_chunk(args):
+    font, opts, codes, fcf, gcf = args
+    out = []
+    for code in codes:
+        bitmap = crop(font, font.glyphs[code], opts)
+        out.append((code, fcf_glyph(bitmap) if fcf else None,
+                    gcf_glyph(bitmap, opts.strokes) if gcf else None))
+    return out
+
+# {code: (fcf record, gcf record)} of the glyphs in first..last (None for a
+# format not compiled). jobs > 1 compiles chunks of the glyphs in processes.
+def compile_glyphs(font, opts, jobs=1, fcf=True, gcf=True):
+    codes = sorted(c for c in font.glyphs if opts.first <= c <= opts.last)
+    if jobs <= 1 or len(codes) < 256:
+        results = [_compile_chunk((font, opts, codes, fcf, gcf))]
+    else:
+        n = max(64, len(codes) // (jobs * 4) + 1)
+        chunks = [codes[i:i+n] for i in range(0, len(codes), n)]
+        sub = BDFFont(font.width, font.height, None)
+        args = [(sub._replace(glyphs={c: font.glyphs[c] for c in chunk}), opts, chunk,
+                 fcf, gcf) for chunk in chunks]
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(_compile_chunk, args))
+    return {code: (fcf, gcf) for result in results for code, fcf, gcf in result}
+
+#----------------------------------------------------------------------------
+#                                 font files
+#----------------------------------------------------------------------------
+
+def _check_codes(records, opts, fmt):
+    over = [c for c in records if c >= opts.count]
+    if over:
+        raise BDFError('code %d does not fit the %s of %d glyphs (--count)'
+                       % (min(over), fmt, opts.count))
+
+def fcf_bytes(records, opts):
+    _check_codes(records, opts, 'FCF')
+    height = opts.row_end - opts.row_beg
+    blank = FCF_COLORS[0] * (opts.width * height)
+    return (bytes((opts.width, height)) +
+            b''.join(records[c][0] if c in records else blank
+                     for c in range(opts.count)))
+
+def gcf_bytes(records, opts):
+    _check_codes(records, opts, 'GCF')
+    index = array.array('H')
+    data = bytearray()
+    for c in range(opts.count):
+        index.append(len(data))
+        if c in records:
+            data += records[c][1]
+        if len(data) > 0xffff:
+            raise BDFError('GCF strokes exceed 64K bytes (16 bit index) at code %d' % c)
+    index.append(len(data))
+    if sys.byteorder != 'little':
+        index.byteswap()		# as array('H') of ESP32
+    return bytes((opts.width, opts.row_end - opts.row_beg)) + index.tobytes() + data
+
+# runs of the pixels of an FCF record, background first, each up to 255 (a
+# longer one is split by a run of 0), without the last background run
+def fcf_runs(record):
+    runs = []
+    on = False
+    n = 0
+    for i in range(0, len(record), 2):
+        if (record[i:i+2] == FCF_COLORS[1]) != on:
+            runs.append(n)
+            on = not on
+            n = 0
+        n += 1
+        if n == 256:
+            runs += [255, 0]
+            n = 1
+    if on:
+        runs.append(n)
+    else:
+        while len(runs) % 2 == 0 and runs[-2:] == [255, 0]:
+            del runs[-2:]	# splits of the last background run
+    return bytes(runs)
+
+def gcf_pack(record):
+    return bytes((record[i] << 4 | record[i+1]) for i in range(0, len(record), 2))
+
+def _v2_bytes(records, opts, kind, flags, encode):
+    height = opts.row_end - opts.row_beg
+    codes = array.array('H')
+    offsets = array.array('I')
+    data = bytearray()
+    for c in sorted(records):
+        rec = encode(records[c])
+        if not rec:
+            continue			# blank, as a code not in the file
+        if c > 0xffff:
+            raise BDFError('code %d does not fit the v2 index (16 bit)' % c)
+        codes.append(c)
+        offsets.append(len(data))
+        data += rec
+    offsets.append(len(data))
+    if len(codes) > 0xffff:
+        raise BDFError('%d glyphs exceed the v2 index' % len(codes))
+    if sys.byteorder != 'little':
+        codes.byteswap()
+        offsets.byteswap()
+    header = b'\x00\x02' + kind + bytes((opts.width, height, flags,
+                                          len(codes) & 0xff, len(codes) >> 8))
+    return header + codes.tobytes() + offsets.tobytes() + data
+
+def fcf_v2_bytes(records, opts):
+    return _v2_bytes(records, opts, V2_KINDS['.fcf'], 0,
+                     lambda rec: fcf_runs(rec[0]))
+
+def gcf_v2_bytes(records, opts):
+    height = opts.row_end - opts.row_beg
+    if opts.width <= 16 and height <= 16:
+        return _v2_bytes(records, opts, V2_KINDS['.gcf'], V2_PACKED,
+                         lambda rec: gcf_pack(rec[1]))
+    return _v2_bytes(records, opts, V2_KINDS['.gcf'], 0, lambda rec: rec[1])
+
+WRITERS = {(1, '.fcf'): fcf_bytes, (1, '.gcf'): gcf_bytes,
+           (2, '.fcf'): fcf_v2_bytes, (2, '.gcf'): gcf_v2_bytes}
+
+def _write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def cache_key(bdf_data, opts):
+    h = hashlib.sha256(bdf_data)
+    h.update(repr((VERSION, tuple(opts))).encode())
+    return h.hexdigest()
+
+# build fcf and/or gcf from a BDF. Return 'cached' when the outputs are
+# taken from the cache, 'built' otherwise.
+def build(bdf, opts, fcf=None, gcf=None, jobs=1, cache_dir=CACHE_DIR):
+    with open(bdf, 'rb') as f:
+        data = f.read()
+    outputs = [(path, ext) for path, ext in ((fcf, '.fcf'), (gcf, '.gcf')) if path]
+    key = cache_key(data, opts)
+    if cache_dir:
+        cached = [os.path.join(cache_dir, key + ext) for _, ext in outputs]
+        if all(os.path.exists(p) for p in cached):
+            for (path, _), p in zip(outputs, cached):
+                shutil.copyfile(p, path)
+            return 'cached'
+
+    font = parse_bdf(data)
+    opts = opts._replace(width=opts.width or font.width,
+                         row_end=opts.row_end or font.height)
+    records = compile_glyphs(font, opts, jobs, bool(fcf), bool(gcf))
+    for path, ext in outputs:
+        out = WRITERS[opts.version, ext](records, opts)
+        _write(path, out)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            _write(os.path.join(cache_dir, key + ext), out)
+    return 'built'
+
+# strokes of the GCF of the glyphs in first..last by each encoder: {encoder:
+# (strokes, of them rectangles, glyphs)}
+def stroke_report(font, opts):
+    opts = opts._replace(width=opts.width or font.width,
+                         row_end=opts.row_end or font.height)
+    report = {}
+    for name in STROKES:
+        n = n_rects = n_glyphs = 0
+        for code, rows in font.glyphs.items():
+            if opts.first <= code <= opts.last:
+                strokes = ENCODERS[name](crop(font, rows, opts))
+                n += len(strokes)
+                n_rects += sum(1 for c0, r0, c1, r1 in strokes if c0 != c1 and r0 != r1)
+                n_glyphs += 1
+        report[name] = (n, n_rects, n_glyphs)
+    return report
+
+def _range(s):
+    first, _, last = s.partition('-')
+    return int(first, 0), int(last or first, 0)
+
+def _rows(s):
+    beg, _, end = s.partition(':')
+    return int(beg), int(end)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build FCF/GCF fonts of display.py from a BDF')
+    parser.add_argument('bdf', nargs='?')
+    parser.add_argument('--preset', choices=sorted(PRESETS),
+                        help='BDF, size and outputs of a font of fonts/')
+    parser.add_argument('--fcf', help='FCF output')
+    parser.add_argument('--gcf', help='GCF output')
+    parser.add_argument('-w', '--width', type=int, help='columns of a glyph')
+    parser.add_argument('-r', '--rows', type=_rows,
+                        help='BEG:END rows of the cell (default all)')
+    parser.add_argument('-c', '--codes', type=_range, default=(0x20, 0x7f),
+                        help='FIRST-LAST codes (default 0x20-0x7f)')
+    parser.add_argument('--count', type=int, default=128,
+                        help='glyphs of the files (codes 0..count-1, default 128)')
+    parser.add_argument('--format', type=int, choices=(1, 2), default=1,
+                        help='file version, 2 for a sparse index and RLE (default 1)')
+    parser.add_argument('-s', '--strokes', choices=STROKES, default='cover',
+                        help='GCF encoder (default cover, fewest lines)')
+    parser.add_argument('--report', action='store_true',
+                        help='print the GCF strokes of each encoder')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--cache', default=CACHE_DIR, help='cache directory')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None)
+    args = parser.parse_args(argv)
+
+    bdf, fcf, gcf = args.bdf, args.fcf, args.gcf
+    width, rows = args.width, args.rows
+    if args.preset:
+        bdf_name, width, row_beg, row_end = PRESETS[args.preset]
+        bdf = bdf or bdf_name
+        rows = rows or (row_beg, row_end)
+        if not (fcf or gcf):
+            fontdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../fonts')
+            os.makedirs(fontdir, exist_ok=True)
+            fcf = os.path.join(fontdir, args.preset + '.fcf')
+            gcf = os.path.join(fontdir, args.preset + '.gcf')
+    if not bdf or not (fcf or gcf or args.report):
+        parser.error('a BDF and --fcf and/or --gcf (or --preset) are required')
+
+    rows = rows or (0, None)
+    opts = Options(width, rows[0], rows[1], args.codes[0], args.codes[1], args.count,
+                   args.strokes, args.format)
+    try:
+        if fcf or gcf:
+            result = build(bdf, opts, fcf, gcf, args.jobs, args.cache)
+            for path in (fcf, gcf):
+                if path:
+                    print('%s: %s' % (path, result))
+        if args.report:
+            with open(bdf, 'rb') as f:
+                report = stroke_report(parse_bdf(f.read()), opts)
+            base = report['greedy'][0]
+            print('%-8s %8s %8s %8s %7s' % ('strokes', 'glyphs', 'total', 'rects', 'vs greedy'))
+            for name in STROKES:
+                n, n_rects, n_glyphs = report[name]
+                print('%-8s %8d %8d %8d %6.1f%%' % (name, n_glyphs, n, n_rects,
+                                                    100.0 * n / base if base else 0))
+    except (OSError, BDFError) as e:
+        sys.exit('%s: %s' % (bdf, e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# SPI traffic of the ssd1331.Adaptor drawing with the command batch of the
+# driver (batching) and without: CS windows, writes and bytes counted by
+# fakemachine, for gcf_put and fcf_put of the SpO2 monitor strings and
+# draw_rect of a bar graph in a batch. The bus time is the bytes at the SPI
+# clock of ssd1331.vspi plus --tx-us for each write (the MicroPython calls
+# and the D/C of a write). Fonts are generated as bench_fonts.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+import fakemachine
+fakemachine.install()
+
+import display
+import ssd1331
+from bench_fonts import fcf_font, gcf_font
+
+SCK_HZ = 6 * 1000 * 1000		# ssd1331.vspi
+
+TEXT = ['  HR: ---.-', 'SpO2: ---.-%', 'conf: ---  %']
+
+def gcf_text(disp):
+    disp.gcf_bg_color = disp.Color(0, 0, 0)
+    for i, line in enumerate(TEXT):
+        disp.gcf_put(2, 10 + 15 * i, line, spacing=1)
+
+def fcf_text(disp):
+    for i, line in enumerate(TEXT):
+        disp.fcf_put(2, 10 + 8 * i, line)
+
+def bar_graph(disp):
+    color = disp.Color(0, 20, 0)
+    with disp._driver.batch():
+        for i in range(24):
+            h = 8 + (i * 7) % 40
+            disp.draw_rect(i * 4, 63 - h, i * 4 + 2, 63, color, color)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tx-us', type=float, default=50.0,
+                        help='us of a write on the device')
+    args = parser.parse_args()
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    with open(os.path.join(fontdir, 'misaki_7x4.fcf'), 'wb') as f:
+        f.write(fcf_font(4, 7, 1))
+    for i, name in enumerate(display.AdaptorBase.GCF_FILES):
+        with open(os.path.join(fontdir, name), 'wb') as f:
+            f.write(gcf_font(5, 10 + 2 * i, 2 + i))
+
+    driver = ssd1331.vspi()
+    driver.enable_fill()
+    disp = ssd1331.Adaptor(driver, fcf=True, gcf=True, framebuffer=False)
+    spi = fakemachine.buses[-1]
+    cs = driver._cs
+
+    print('%-10s %-8s %8s %8s %8s %8s %9s' % (
+        'drawing', 'batch', 'CS', 'writes', 'bytes', 'bus ms', 'host ms'))
+    for name, func in (('gcf_put', gcf_text), ('fcf_put', fcf_text),
+                       ('draw_rect', bar_graph)):
+        for batching in (False, True):
+            driver.batching = batching
+            spi.reset_counts()
+            falls = cs.falls
+            tv = time.perf_counter()
+            func(disp)
+            tv = time.perf_counter() - tv
+            bus = spi.bytes * 8.0 / SCK_HZ + spi.transactions * args.tx_us / 1e6
+            print('%-10s %-8s %8d %8d %8d %8.2f %9.2f' % (
+                name, 'on' if batching else 'off', cs.falls - falls,
+                spi.transactions, spi.bytes, bus * 1000, tv * 1000))
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+# Font build of bdffont.py on a large Unicode BDF: a 16x16 font of --glyphs
+# generated glyphs of random sizes (BBX) from U+0020 (no such font ships in
+# the repository). Timed are the parse, the glyph compile (FCF and GCF
+# records) by a process and by the pool of --jobs, the build by output as
+# bdf2fcf/bdf2gcf did (the BDF parsed for each of FCF and GCF),
+# and a build of the FCF of all the glyphs, cold and from the cache. GCF of
+# the whole font does not fit its 16 bit index, so it is not written.
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bdffont
+
+def generate_bdf(path, n_glyphs, seed=1):
+    rnd = random.Random(seed)
+    out = ['STARTFONT 2.1', 'FONT -bench-unicode-16', 'SIZE 16 75 75',
+           'FONTBOUNDINGBOX 16 16 0 -2', 'CHARS %d' % n_glyphs]
+    for code in range(0x20, 0x20 + n_glyphs):
+        w, h = rnd.randint(4, 16), rnd.randint(6, 16)
+        x, y = rnd.randint(0, 16 - w), rnd.randint(-2, 14 - h)
+        out += ['STARTCHAR U+%04X' % code, 'ENCODING %d' % code,
+                'SWIDTH 1000 0', 'DWIDTH 16 0', 'BBX %d %d %d %d' % (w, h, x, y),
+                'BITMAP']
+        nibbles = (w + 7) // 8 * 2
+        for _ in range(h):
+            bits = rnd.getrandbits(w) & rnd.getrandbits(w)
+            out.append('%0*X' % (nibbles, bits << (nibbles * 4 - w)))
+        out.append('ENDCHAR')
+    out.append('ENDFONT')
+    with open(path, 'w') as f:
+        f.write('\n'.join(out) + '\n')
+
+def timed(func, *args):
+    tv = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - tv
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--glyphs', type=int, default=8000)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    bdf = os.path.join(workdir, 'unicode16.bdf')
+    generate_bdf(bdf, args.glyphs)
+    with open(bdf, 'rb') as f:
+        data = f.read()
+    last = 0x20 + args.glyphs - 1
+    opts = bdffont.Options(16, 0, 16, 0x20, last, last + 1)
+
+    print('%d glyphs, %d bytes of BDF, %d jobs' % (args.glyphs, len(data), args.jobs))
+    font, t_parse = timed(bdffont.parse_bdf, data)
+    _, t_one = timed(bdffont.compile_glyphs, font, opts, 1)
+    _, t_pool = timed(bdffont.compile_glyphs, font, opts, args.jobs)
+    def by_output():
+        bdffont.compile_glyphs(bdffont.parse_bdf(data), opts, 1, True, False)
+        bdffont.compile_glyphs(bdffont.parse_bdf(data), opts, 1, False, True)
+    _, t_old = timed(by_output)
+    cache = os.path.join(workdir, 'cache')
+    fcf = os.path.join(workdir, 'unicode16.fcf')
+    _, t_cold = timed(bdffont.build, bdf, opts, fcf, None, args.jobs, cache)
+    result, t_hit = timed(bdffont.build, bdf, opts, fcf, None, args.jobs, cache)
+    assert result == 'cached'
+
+    for name, tv in (('parse', t_parse),
+                     ('compile, 1 process', t_one),
+                     ('compile, pool', t_pool),
+                     ('by output (FCF, then GCF)', t_old),
+                     ('build FCF, parse + pool', t_cold),
+                     ('build FCF, cached', t_hit)):
+        print('%-34s %9.1f ms' % (name, tv * 1000))
+    shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
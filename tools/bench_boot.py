@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+# Cost of importing boot.full, which blocks the REPL on a full mode boot:
+# the lazy imports of boot/full.py against the eager ones it had (ssd1331,
+# machine, mipc, wifi, service, and the poll thread started by importing
+# mipc). Each variant runs in a fresh CPython process with machine and
+# network replaced by empty modules. bootprof prints the imports done by
+# the lazy modules on first use for comparison.
+
+import os
+import subprocess
+import sys
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PRELUDE = '''
+import os, sys, time, types
+for name in ('machine', 'network'):
+    sys.modules[name] = types.ModuleType(name)
+sys.path += [%r, %r]
+n_modules = len(sys.modules)
+tv = time.perf_counter()
+''' % (os.path.join(_top, 'upy'), os.path.join(_top, 'upy/lib'))
+
+RESULT = '''
+tv = time.perf_counter() - tv
+print('%.1f %d %d' % (tv * 1000, len(sys.modules) - n_modules,
+                      len(os.listdir('/proc/self/task')) - 1))	# Linux
+'''
+
+EAGER = '''
+import os, _thread, ssd1331, mipc, wifi, service
+from config.boot_full import config
+mipc.manager._start()		# as importing mipc did
+'''
+
+LAZY = '''
+from boot.full import start
+'''
+
+FIRST_USE = '''
+import bootprof
+bootprof.enabled = True
+bootprof.install()
+import boot.full
+tv = time.perf_counter()
+boot.full.ssd1331.Adaptor
+boot.full.wifi.WifiNetwork
+bootprof.imp('service.admin')
+bootprof.report()
+'''
+
+def run(code, repeat=5):
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PRELUDE + code + RESULT],
+                             stdout=subprocess.PIPE, check=True).stdout.decode()
+        results.append(out.split('\n')[-2].split())
+    results.sort(key=lambda r: float(r[0]))
+    return results[len(results) // 2]		# median of the time
+
+def main():
+    print('%-26s %8s %8s %8s' % ('import boot.full', 'ms', 'modules', 'threads'))
+    for name, code in (('eager (ssd1331, mipc, ...)', EAGER), ('lazy', LAZY)):
+        ms, modules, threads = run(code)
+        print('%-26s %8s %8s %8s' % (name, ms, modules, threads))
+    print('')
+    print('lazy modules on first use (bootprof):')
+    out = subprocess.run([sys.executable, '-c', PRELUDE + FIRST_USE],
+                         stdout=subprocess.PIPE, check=True).stdout.decode()
+    print(out, end='')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+# Bytes on the wire and effective throughput of the compressed transfers:
+# VSRfs f_read replies (msgpack with deflate_min, over UDP and rudp units)
+# and the deflate codec of espadm put, against uncompressed ones. The link
+# is simulated by the wire bytes at --link MB/s plus the CPU time of this
+# host (the device decompresses slower). Python sources are the modules of
+# upy, fonts are FCF files generated like bdf2fcf (no font ships in the
+# repository), images are data/*.img, and a .gz shows the skip of already
+# compressed files.
+
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+
+import mipc
+import rudp
+from espadm import AdminCommand
+from vsrfsd import _STORED_SUFFIXES
+
+# packers and f_read sizes of upy/test/vsrfs.py (_unit_size) for UDP and
+# rudp ports
+UNITS = (('udp', mipc.UDPMsgPacker, mipc.UDPMsgPacker.MAXLEN - 64),
+         ('rudp', rudp.ReliableMsgPacker, 4 * 512 - 64))
+
+def python_sources():
+    paths = sorted(glob.glob(os.path.join(_top, 'upy', '**', '*.py'), recursive=True))
+    return [(os.path.relpath(p, _top), open(p, 'rb').read()) for p in paths]
+
+def fcf_font(width, height, seed):
+    rnd = random.Random(seed)
+    img = bytearray([width, height])
+    for code in range(128):
+        for _ in range(width * height):
+            on = 0x20 <= code and rnd.random() < 0.35
+            img += b'\xff\xff' if on else b'\x00\x00'
+    return bytes(img)
+
+def fonts():
+    return [('mplus_10x5.fcf', fcf_font(5, 10, 1)),
+            ('mplus_12x5.fcf', fcf_font(5, 12, 2)),
+            ('misaki_7x4.fcf', fcf_font(4, 7, 3))]
+
+def images():
+    paths = sorted(glob.glob(os.path.join(_top, 'data', '*.img')))
+    files = [(os.path.relpath(p, _top), open(p, 'rb').read()) for p in paths]
+    return files + [('data/sample.img.gz', zlib.compress(files[0][1], 9))]
+
+# size of the f_read replies of a file, as vsrfsd sends them
+def vsrfs_wire(name, data, packer_class, unit, deflate):
+    packer = packer_class()
+    packer.deflate_min = mipc.DEFLATE_MIN if deflate else 0
+    stored = name.endswith(_STORED_SUFFIXES)
+    total = 0
+    for pos in range(0, len(data), unit):
+        chunk = data[pos:pos + unit]
+        if stored:
+            chunk = memoryview(chunk)
+        total += packer.pack([7, 'f_read_reply', True, [pos + len(chunk), chunk]])[1]
+    return total
+
+# espadm put to a port which decodes the stream like AdminService.put_stream
+class StreamSink(object):
+
+    def __init__(self, peer_inflate):
+        self.peer_inflate = peer_inflate
+        self.wire = 0
+        self._raw = bytearray()
+        self._codec = None
+        self._started = False
+
+    def send(self, msg):
+        self._codec = msg[4] if len(msg) > 4 else None
+        return self
+
+    def send_raw(self, data):
+        self.wire += len(data)
+        self._raw += data
+
+    def result(self):
+        if not self._started:		# reply to put_stream
+            self._started = True
+            return None
+        data = self._raw
+        if self._codec:
+            out, i = bytearray(), 0
+            while i < len(data):
+                n = int.from_bytes(data[i:i+4], 'big')
+                out += zlib.decompress(data[i+4:i+4+n])
+                i += 4 + n
+            data = out
+        return zlib.crc32(data)
+
+def admin_wire(path, deflate):
+    admin = AdminCommand()
+    admin.cli = StreamSink(deflate)
+    admin.put(path)
+    return admin.cli.wire
+
+def measure(func, *args):
+    tv = time.time()
+    n = func(*args)
+    return n, time.time() - tv
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--link', type=float, default=1.0, help='MB/s of the link')
+    args = parser.parse_args()
+    link = args.link * 1000000
+    workdir = tempfile.mkdtemp()
+
+    print('%-8s %-10s %5s %9s %9s %9s %6s %8s %8s' % (
+        'kind', 'transfer', 'files', 'bytes', 'plain', 'deflate', 'ratio',
+        'MB/s', 'MB/s'))
+    for kind, files in (('python', python_sources()), ('font', fonts()),
+                        ('image', images())):
+        size = sum(len(d) for _, d in files)
+        rows = []
+        for via, cls, unit in UNITS:
+            rows.append(('vsrfs/' + via,
+                         [measure(vsrfs_wire, n, d, cls, unit, False) for n, d in files],
+                         [measure(vsrfs_wire, n, d, cls, unit, True) for n, d in files]))
+        plain, deflate = [], []
+        for name, data in files:
+            path = os.path.join(workdir, os.path.basename(name))
+            with open(path, 'wb') as f:
+                f.write(data)
+            plain.append(measure(admin_wire, path, False))
+            deflate.append(measure(admin_wire, path, True))
+            os.remove(path)
+        rows.append(('put', plain, deflate))
+        for via, plain, deflate in rows:
+            pw = sum(n for n, _ in plain)
+            dw = sum(n for n, _ in deflate)
+            dt = sum(t for _, t in deflate)
+            print('%-8s %-10s %5d %9d %9d %9d %5.0f%% %8.3f %8.3f' % (
+                kind, via, len(files), size, pw, dw, 100.0 * dw / pw,
+                size / (pw / link) / 1000000, size / (dw / link + dt) / 1000000))
+    os.rmdir(workdir)
+    print('(MB/s: effective throughput of plain and deflate at %.2f MB/s link)'
+          % args.link)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+
+# Display benchmarks on the emulated SSD1331 (ssd1331emu): text (gcf_put of
+# the SpO2 monitor and fcf_put), an image (a 96x64 picture by img2mp65k),
+# scrolling (TextBoard.putline of a log longer than the board) and sweeps
+# of the radar demo (upy/test/rader.py), each drawn by commands in batches,
+# by commands without batches and by the framebuffer. For each: the SPI
+# writes, bytes and CS windows, the modelled bus time (--write-us a write
+# plus the bits at 6 MHz) and the host time of the drawing without the
+# emulator. "same" tells the panel shows what the first mode drew. --png
+# DIR dumps the panel of each scene and mode. Fonts are generated as
+# bench_fonts (no font ships in the repository).
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+_tools = os.path.dirname(os.path.abspath(__file__))
+
+import fakemachine
+import ssd1331emu
+panel = ssd1331emu.install()
+sys.path.append(os.path.join(_tools, '../upy/test'))	# after upy/lib (servo)
+
+import display
+import ssd1331
+from bench_fonts import fcf_font, gcf_font
+
+MODES = (('batch', dict(framebuffer=False, batching=True)),
+         ('no batch', dict(framebuffer=False, batching=False)),
+         ('framebuffer', dict(framebuffer=True, batching=True)))
+MONITOR = ['  HR: ---.-', 'SpO2: ---.-%', 'conf: ---  %']
+LOG = ['boot: full', 'wifi: connecting', 'wifi: 192.168.10.123',
+       'admin: port 8022', 'vsrfs: mount /V', 'airterm: start',
+       'temp 23.5C hum 45%', 'HR 72 SpO2 98']
+
+def adaptor(framebuffer, batching, **fonts):
+    driver = ssd1331.vspi()
+    driver.batching = batching
+    disp = ssd1331.Adaptor(driver, framebuffer=framebuffer, **fonts)
+    disp.clear()
+    disp.flush()
+    return disp
+
+# scenes: setup(mode) returns the drawing to measure
+
+def text(framebuffer, batching):
+    disp = adaptor(framebuffer, batching, fcf=True, gcf=True)
+    def draw():
+        for i, line in enumerate(MONITOR):
+            disp.gcf_put(1, 1 + 12 * i, line, spacing=1)
+        disp.fcf_put(0, 40, 'temp 23.5C')
+        disp.fcf_put(0, 48, 'hum 45%')
+        disp.flush()
+    return draw
+
+def image(framebuffer, batching, img_file):
+    disp = adaptor(framebuffer, batching)
+    img = display.Image(img_file)
+    def draw():
+        disp.draw_image(0, 0, img)
+        disp.flush()
+    return draw
+
+def scroll(framebuffer, batching):
+    disp = adaptor(framebuffer, batching, fcf=True)
+    board = display.TextBoard(disp, 0, 0, 95, 63)
+    def draw():
+        for i in range(40):
+            board.putline(LOG[i % len(LOG)])
+    return draw
+
+def radar(framebuffer, batching):
+    import rader
+    ssd1331.config.framebuffer = framebuffer
+    drawer = rader.Drawer()
+    ssd1331.config.framebuffer = False
+    drawer._driver.batching = batching
+    cossin = rader.rader._mounter._cossin_tab
+    def draw():
+        rnd = random.Random(1)
+        update = drawer.get_updater(*cossin[0])
+        for sweep in range(2):
+            for cos, sin in (cossin if sweep % 2 == 0 else reversed(cossin)):
+                update(cos, sin, rnd.uniform(2.0, 60.0))
+    return draw
+
+def make_image(path):
+    from PIL import Image
+    import img2mp65k
+    r = Image.linear_gradient('L').resize((96, 64))
+    g = Image.radial_gradient('L').resize((96, 64))
+    b = r.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    with open(path, 'wb') as f:
+        f.write(img2mp65k.convert(Image.merge('RGB', (r, g, b)), '65k', 'ordered'))
+
+def run(scene, mode):
+    fakemachine.attach(panel)
+    draw = scene(**mode)
+    panel.reset_counts()
+    draw()
+    stats = panel.stats()
+    shown = panel.snapshot()
+    fakemachine.attach(None)			# the host time of the drivers only
+    draw = scene(**mode)
+    tv = time.perf_counter()
+    draw()
+    stats['host ms'] = (time.perf_counter() - tv) * 1000
+    return stats, shown
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write-us', type=float, default=ssd1331emu.WRITE_US,
+                        help='us of a write on the device')
+    parser.add_argument('--png', metavar='DIR', help='dump the panel of each run')
+    args = parser.parse_args()
+    panel.write_us = args.write_us
+    workdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = workdir + '/'
+    for name, data in (('misaki_7x4.fcf', fcf_font(4, 7, 1)),
+                       ('mplus_10x5.gcf', gcf_font(5, 10, 2)),
+                       ('mplus_12x5.gcf', gcf_font(5, 12, 3))):
+        with open(os.path.join(workdir, name), 'wb') as f:
+            f.write(data)
+    img_file = os.path.join(workdir, 'gradient-65k.img')
+    make_image(img_file)
+    if args.png:
+        os.makedirs(args.png, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import rader			# prints the usage of its demo
+
+    scenes = (('text', text), ('image', lambda **m: image(img_file=img_file, **m)),
+              ('scroll x 40', scroll), ('radar, 2 sweeps', radar))
+    print('%-16s %-12s %7s %8s %6s %8s %8s %5s' % (
+        'scene', 'mode', 'writes', 'bytes', 'CS', 'bus ms', 'host ms', 'same'))
+    for scene_name, scene in scenes:
+        first = None
+        for mode_name, mode in MODES:
+            stats, shown = run(scene, mode)
+            first = first or shown
+            print('%-16s %-12s %7d %8d %6d %8.1f %8.1f %5s' % (
+                scene_name, mode_name, stats['writes'], stats['bytes'],
+                stats['cs windows'], stats['bus ms'], stats['host ms'],
+                'yes' if shown == first else 'NO'))
+            if args.png:
+                name = '%s-%s.png' % (scene_name.split()[0].rstrip(','), mode_name.replace(' ', '_'))
+                panel.write_png(os.path.join(args.png, name), scale=4)
+    shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
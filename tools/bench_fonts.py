@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# Render speed and resident memory of the fonts of display.py, loaded whole
+# (font_cache 0) against streamed through glyph caches of some budgets. The
+# strings are the ones the boot progress and the SpO2 monitor draw, and a
+# text of all the printable characters. Fonts are generated in a temporary
+# FONTDIR (no font ships in the repository): FCF like bench_compress, and
+# GCF of random strokes with the sizes of bdf2gcf output. "font" is the
+# bytes of glyph data and index the font holds after the strings are
+# rendered, as the device allocates them. "python" and "peak" are what
+# tracemalloc sees on CPython, which includes the 8K buffer of an open file
+# (the device has none).
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+
+import display
+
+TEXTS = {
+    'progress': ['STA', 'my-access-point', '192.168.10.123', 'AP', 'Wi-Fi'],
+    'monitor': ['  HR: ---.-', 'SpO2: ---.-%', 'conf: ---  %',
+                ' 72.5', ' 98.1', ' 95'],
+    'ascii': [''.join(chr(c) for c in range(0x20, 0x7f))],
+}
+BUDGETS = (0, 256, 1024, 4096)
+
+def fcf_font(width, height, seed):
+    rnd = random.Random(seed)
+    img = bytearray([width, height])
+    for code in range(128):
+        for _ in range(width * height):
+            on = 0x20 <= code and rnd.random() < 0.35
+            img += b'\xff\xff' if on else b'\x00\x00'
+    return bytes(img)
+
+def gcf_font(width, height, seed):
+    rnd = random.Random(seed)
+    index, data = [], bytearray()
+    for code in range(128):
+        index.append(len(data))
+        for _ in range(rnd.randint(6, 14) if 0x20 < code < 0x7f else 0):
+            c, r = rnd.randrange(width), rnd.randrange(height)
+            data += bytes((c, r, c, min(height - 1, r + rnd.randint(0, 3))))
+    index.append(len(data))
+    return (bytes((width, height)) +
+            b''.join(i.to_bytes(2, sys.byteorder) for i in index) + data)
+
+def render_fcf(font, lines):
+    n = 0
+    for line in lines:
+        for c in line:
+            pixels, size = font.pixels(c)
+            n += size
+    return n
+
+def render_gcf(font, lines):
+    n = 0
+    for line in lines:
+        for c in line:
+            for stroke in font.get_line(c):
+                n += 1
+    return n
+
+def font_bytes(font):
+    n = len(getattr(font, '_index', ())) * 2
+    if font._cache:
+        return n + font._cache.size
+    return n + len(font._fontarray if hasattr(font, '_fontarray') else font._data)
+
+def measure(cls, fontfile, budget, lines, render, repeat):
+    tracemalloc.start()
+    font = cls(fontfile, cache_size=budget)
+    render(font, lines)			# warm up the cache
+    resident, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n_chars = sum(len(line) for line in lines) * repeat
+    tv = time.perf_counter()
+    for _ in range(repeat):
+        render(font, lines)
+    tv = time.perf_counter() - tv
+    held = font_bytes(font)
+    cache = font._cache
+    hit = 100.0 * cache.hits / (cache.hits + cache.misses) if cache else 100.0
+    font.close()
+    return tv / n_chars * 1e6, held, resident, peak, hit
+
+def main():
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    fonts = (('misaki_7x4.fcf', fcf_font(4, 7, 1), display.FixedColorFont, render_fcf),
+             ('mplus_10x5.gcf', gcf_font(5, 10, 2), display.GraphicCompositFont, render_gcf),
+             ('mplus_12x5.gcf', gcf_font(5, 12, 3), display.GraphicCompositFont, render_gcf))
+    for name, data, _, _ in fonts:
+        with open(os.path.join(fontdir, name), 'wb') as f:
+            f.write(data)
+
+    print('%-15s %-9s %7s %9s %7s %9s %9s %7s' % (
+        'font', 'text', 'cache', 'us/char', 'font', 'python', 'peak', 'hit'))
+    for name, _, cls, render in fonts:
+        for text, lines in TEXTS.items():
+            for budget in BUDGETS:
+                us, held, resident, peak, hit = measure(cls, name, budget,
+                                                        lines, render, 200)
+                print('%-15s %-9s %7s %9.2f %7d %9d %9d %6.1f%%' % (
+                    name, text, budget or 'whole', us, held, resident, peak, hit))
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
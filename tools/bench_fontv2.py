@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+# v1 against v2 font files of display.py (bdffont.py --format 2): the size
+# of the files and the bytes a font holds, loaded whole (font_cache 0) and
+# streamed through a glyph cache of 1024 bytes, and the render time. The
+# fonts are generated like bench_gcf_strokes (no BDF ships in the
+# repository): the ASCII sizes of fonts/ and a 12x12 kana font (hiragana
+# and katakana, U+3041..U+30FA), which v1 can only hold as a dense file of
+# the codes up to U+30FF (display reads it with FONTNUM raised). Every glyph
+# of v2 is checked to render as of v1.
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bdffont
+import display
+from bench_gcf_strokes import glyph
+
+KANA = list(range(0x3041, 0x3097)) + list(range(0x30a1, 0x30fb))
+FONTS = (('4x7', 4, 7, list(range(0x21, 0x7f)), 128),
+         ('5x10', 5, 10, list(range(0x21, 0x7f)), 128),
+         ('12x12 kana', 12, 12, KANA, 0x3100))
+TEXT = {128: ['  HR: ---.-', 'SpO2: ---.-%', 'conf: ---  %', 'Wi-Fi 192.168.10.1'],
+        0x3100: [''.join(chr(c) for c in KANA[i:i+16]) for i in range(0, 64, 16)]}
+CACHE = 1024
+
+def font(w, h, codes, seed):
+    rnd = random.Random(seed)
+    rows = {code: [int(''.join(map(str, row)), 2) for row in glyph(rnd, w, h)]
+            for code in codes}
+    return bdffont.BDFFont(w, h, rows)
+
+def font_bytes(font):
+    n = 0
+    if font.version == 2:
+        n += len(font._codes) * 2
+        if font._offsets:
+            n += len(font._offsets) * 4 + len(font._data)
+        for name in ('_runs', '_pixbuf'):
+            n += len(getattr(font, name, b''))
+        n += sum(len(s) for s in getattr(font, '_spans', ()))
+    else:
+        n += len(getattr(font, '_index', ())) * 2
+        if not font._cache:
+            n += len(font._fontarray if hasattr(font, '_fontarray') else font._data)
+    if font._cache:
+        n += font._cache.size
+    return n
+
+def render(font, lines):
+    out = []
+    for line in lines:
+        for c in line:
+            if isinstance(font, display.FixedColorFont):
+                pixels, size = font.pixels(c)
+                out.append(bytes(pixels[:size]))
+            else:
+                out.append([tuple(s) for s in font.get_line(c)])
+    return out
+
+def measure(cls, name, cache, lines, repeat=50):
+    font = cls(name, cache_size=cache)
+    render(font, lines)			# warm up the cache
+    tv = time.perf_counter()
+    for _ in range(repeat):
+        render(font, lines)
+    tv = time.perf_counter() - tv
+    n_chars = sum(len(line) for line in lines) * repeat
+    held = font_bytes(font)
+    font.close()
+    return tv / n_chars * 1e6, held
+
+def main():
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    print('%-11s %-4s %-3s %9s %10s %9s %10s %9s' % (
+        'font', 'kind', 'ver', 'file', 'held whole', 'us/char', 'held cache', 'us/char'))
+    for i, (name, w, h, codes, count) in enumerate(FONTS):
+        bdf = font(w, h, codes, i)
+        records = bdffont.compile_glyphs(bdf, bdffont.Options(w, 0, h, codes[0], codes[-1],
+                                                              count, 'rects'))
+        display._FontBase.FONTNUM = count
+        for ext, cls in (('.fcf', display.FixedColorFont),
+                         ('.gcf', display.GraphicCompositFont)):
+            results = {}
+            for version in (1, 2):
+                opts = bdffont.Options(w, 0, h, codes[0], codes[-1], count, 'rects', version)
+                fname = 'v%d%s' % (version, ext)
+                data = bdffont.WRITERS[version, ext](records, opts)
+                with open(os.path.join(fontdir, fname), 'wb') as f:
+                    f.write(data)
+                whole = measure(cls, fname, 0, TEXT[count])
+                cached = measure(cls, fname, CACHE, TEXT[count])
+                print('%-11s %-4s %-3d %9d %10d %9.2f %10d %9.2f' % (
+                    name, ext[1:], version, len(data), whole[1], whole[0],
+                    cached[1], cached[0]))
+                every = [''.join(chr(c) for c in range(count))]
+                results[version] = (render(cls(fname, cache_size=0), every),
+                                    render(cls(fname, cache_size=CACHE), every))
+            assert results[1][0] == results[2][0] == results[2][1], name + ext
+        display._FontBase.FONTNUM = 128
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
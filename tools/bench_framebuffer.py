@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+# SPI traffic of ssd1331.Adaptor drawing command by command against the
+# framebuffer mode (FrameBuffer and flush), counted by the SPI of
+# fakemachine: TextBoard.putline of a scrolling log, and sweeps of the
+# radar demo (upy/test/rader.py). The bus time is the bytes at the SPI
+# clock of ssd1331.vspi plus --tx-us for each transaction (the MicroPython
+# calls, CS and D/C of a write). The fcf font is generated as bench_fonts.
+# The radar draws sparse lines, which flush sends as line commands rather
+# than the pixels of their thin, tall dirty rectangles.
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy/test'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+import fakemachine
+fakemachine.install()
+
+import display
+import ssd1331
+from bench_fonts import fcf_font
+
+SCK_HZ = 6 * 1000 * 1000		# ssd1331.vspi
+
+LOG = ['boot: full', 'wifi: connecting', 'wifi: 192.168.10.123',
+       'admin: port 8022', 'vsrfs: mount /V', 'airterm: start',
+       'temp 23.5C hum 45%', 'HR 72 SpO2 98']
+
+def textboard(framebuffer, n_lines):
+    driver = ssd1331.vspi()
+    disp = ssd1331.Adaptor(driver, fcf=True, framebuffer=framebuffer)
+    board = display.TextBoard(disp, 0, 0, 95, 63)
+    disp.clear()
+    disp.flush()
+    spi = fakemachine.buses[-1]
+    spi.reset_counts()
+    tv = time.perf_counter()
+    for i in range(n_lines):
+        board.putline(LOG[i % len(LOG)])
+    return spi, time.perf_counter() - tv
+
+def radar(framebuffer, n_sweeps):
+    import rader
+    ssd1331.config.framebuffer = framebuffer
+    drawer = rader.Drawer()
+    ssd1331.config.framebuffer = False
+    cossin = rader.rader._mounter._cossin_tab
+    spi = fakemachine.buses[-1]
+    spi.reset_counts()
+    rnd = random.Random(1)
+    tv = time.perf_counter()
+    update = drawer.get_updater(*cossin[0])
+    for sweep in range(n_sweeps):
+        for cos, sin in (cossin if sweep % 2 == 0 else reversed(cossin)):
+            update(cos, sin, rnd.uniform(2.0, 60.0))
+    return spi, time.perf_counter() - tv
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tx-us', type=float, default=50.0,
+                        help='us of a transaction on the device')
+    args = parser.parse_args()
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    with open(os.path.join(fontdir, 'misaki_7x4.fcf'), 'wb') as f:
+        f.write(fcf_font(4, 7, 1))
+
+    print('%-26s %-12s %8s %9s %9s %9s' % (
+        'scene', 'mode', 'writes', 'bytes', 'bus ms', 'host ms'))
+    for scene, func, n in (('TextBoard.putline x 40', textboard, 40),
+                           ('radar, 4 sweeps', radar, 4)):
+        for mode in (False, True):
+            spi, tv = func(mode, n)
+            bus = spi.bytes * 8.0 / SCK_HZ + spi.transactions * args.tx_us / 1e6
+            print('%-26s %-12s %8d %9d %9.1f %9.1f' % (
+                scene, 'framebuffer' if mode else 'command', spi.transactions,
+                spi.bytes, bus * 1000, tv * 1000))
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# GCF strokes of the encoders of bdffont.py: greedy (bdf2gcf), cover (the
+# fewest lines) and rects (filled rectangles too), over generated fonts of
+# the sizes of fonts/ and a 16x16 one (no BDF ships in the repository; the
+# glyphs are drawn by random lines, diagonals and dots like letters). For
+# the 5x10 font, the SPI traffic of gcf_put of the SpO2 monitor text
+# (batched, counted by fakemachine) shows what the strokes cost on the
+# device: a line is an 8 byte command, a rectangle an 11 byte one.
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+import fakemachine
+fakemachine.install()
+
+import bdffont
+import display
+import ssd1331
+
+FONTS = (('4x7', 4, 7, 95), ('5x10', 5, 10, 95), ('5x12', 5, 12, 95),
+         ('16x16', 16, 16, 1500))
+TEXT = ['  HR: ---.-', 'SpO2: ---.-%', 'conf: ---  %', 'Wi-Fi 192.168.10.1']
+
+def glyph(rnd, w, h):
+    cell = [[0] * w for _ in range(h)]
+    for _ in range(rnd.randint(2, 3 + w // 3)):
+        kind = rnd.random()
+        c, r = rnd.randrange(w), rnd.randrange(h)
+        if kind < 0.35:			# vertical
+            for i in range(r, min(h, r + rnd.randint(2, h))):
+                cell[i][c] = 1
+        elif kind < 0.7:		# horizontal
+            for i in range(c, min(w, c + rnd.randint(2, w))):
+                cell[r][i] = 1
+        elif kind < 0.9:		# diagonal
+            d = rnd.choice((-1, 1))
+            for i in range(rnd.randint(2, h)):
+                if 0 <= c + i * d < w and r + i < h:
+                    cell[r + i][c + i * d] = 1
+        else:				# bold block
+            for i in range(r, min(h, r + 2)):
+                for j in range(c, min(w, c + 2)):
+                    cell[i][j] = 1
+    return cell
+
+def font(w, h, n, seed):
+    rnd = random.Random(seed)
+    rows = {code: [int(''.join(map(str, row)), 2) for row in glyph(rnd, w, h)]
+            for code in range(0x21, 0x21 + n)}
+    return bdffont.BDFFont(w, h, rows)
+
+def render(fontdir, gcf_data):
+    with open(os.path.join(fontdir, display.AdaptorBase.GCF_FILES[0]), 'wb') as f:
+        f.write(gcf_data)
+    driver = ssd1331.vspi()
+    disp = ssd1331.Adaptor(driver, gcf=True, framebuffer=False)
+    spi = fakemachine.buses[-1]
+    spi.reset_counts()
+    for i, line in enumerate(TEXT):
+        disp.gcf_put(1, 1 + 12 * i, line, spacing=1)
+    disp.gcf.close()
+    return spi.transactions, spi.bytes
+
+def main():
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    print('%-6s %-7s %7s %8s %7s %8s %10s %8s' % (
+        'font', 'strokes', 'glyphs', 'total', 'rects', 'ratio', 'compile ms', 'SPI bytes'))
+    for i, (name, w, h, n) in enumerate(FONTS):
+        bdf = font(w, h, n, i)
+        base = None
+        for encoder in bdffont.STROKES:
+            opts = bdffont.Options(w, 0, h, 0x20, 0x7f if n < 128 else 0x20 + n,
+                                   128 if n < 128 else 0x21 + n, encoder)
+            tv = time.perf_counter()
+            records = bdffont.compile_glyphs(bdf, opts, 1, False, True)
+            tv = time.perf_counter() - tv
+            strokes = [rec[1][i:i+4] for rec in records.values()
+                       for i in range(0, len(rec[1]), 4)]
+            total = len(strokes)
+            rects = sum(1 for s in strokes if s[0] != s[2] and s[1] != s[3])
+            base = base or total
+            spi = ''
+            if name == '5x10':
+                spi = '%d' % render(fontdir, bdffont.gcf_bytes(records, opts))[1]
+            print('%-6s %-7s %7d %8d %7d %7.1f%% %10.1f %8s' % (
+                name, encoder, len(records), total, rects, 100.0 * total / base,
+                tv * 1000, spi))
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+# Conversion time of img2mp65k against the pixel by pixel converter it had
+# (getpixel and an append a byte), over generated images of some sizes
+# (gradients, noise and shapes). The legacy converter does not resize, so
+# both convert the pixels of the image as it is (pack_pixels, larger images
+# than a file can hold are timed too), and the output is checked to be the
+# same as the truncation (-d none) of 65k. The dithering and 256 colors,
+# and the conversion to a file with the default resize to the panel are
+# timed too.
+
+import array
+import os
+import random
+import sys
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'tools'))
+
+from PIL import Image, ImageDraw
+import img2mp65k
+
+SIZES = ((96, 64), (320, 240), (640, 480), (1280, 720))
+
+def generate(size, seed):
+    rnd = random.Random(seed)
+    w, h = size
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.ROTATE_180),
+                              Image.effect_noise(size, 40)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rnd.randrange(w), rnd.randrange(h)
+        draw.ellipse((x, y, x + w // 6, y + h // 6),
+                     fill=tuple(rnd.randrange(256) for _ in range(3)))
+    return img
+
+def legacy(org):
+    width, height = org.size
+    buf = array.array('B')
+    for y in range(height):
+        for x in range(width):
+            r, g, b = org.getpixel((x, y))[:3]
+            r, g, b = r >> 3, g >> 2, b >> 3
+            buf.append(((0x1f & r)<<3)|((0x3f & g)>>3))
+            buf.append(((0x7 & g)<<5)|(0x1f & b))
+    return buf.tobytes()
+
+def timeit(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        tv = time.perf_counter()
+        out = func(*args)
+        tv = time.perf_counter() - tv
+        best = tv if best is None else min(best, tv)
+    return out, best
+
+def main():
+    print('%-10s %10s %10s %8s %10s %10s %10s %10s' % (
+        'size', 'legacy ms', '65k ms', 'speedup', 'ordered', 'fs', '256 fs',
+        'fit 96x64'))
+    for i, size in enumerate(SIZES):
+        img = generate(size, i)
+        old, t_old = timeit(legacy, img, repeat=1)
+        new, t_new = timeit(img2mp65k.pack_pixels, img)
+        if old != new:
+            raise SystemExit('%dx%d: output differs from the legacy converter' % size)
+        _, t_ord = timeit(img2mp65k.pack_pixels, img, '65k', 'ordered')
+        _, t_fs = timeit(img2mp65k.pack_pixels, img, '65k', 'fs')
+        _, t_256 = timeit(img2mp65k.pack_pixels, img, '256', 'fs')
+        _, t_fit = timeit(lambda: img2mp65k.convert(img2mp65k.fit(img, img2mp65k.PANEL_SIZE)))
+        print('%-10s %10.1f %10.2f %7.0fx %10.2f %10.2f %10.2f %10.2f' % (
+            '%dx%d' % size, t_old * 1000, t_new * 1000, t_old / t_new,
+            t_ord * 1000, t_fs * 1000, t_256 * 1000, t_fit * 1000))
+
+if __name__ == '__main__':
+    main()
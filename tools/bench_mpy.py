@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+# Import the modules of upy/lib through a loopback vsrfsd: the sources, the
+# .mpy compiled by vsrfsd -m, and the .mpy from the device side cache
+# (mpy_cache) on the next boot. Requests, fetched bytes, time and the peak
+# heap of compiling or loading a module are reported. CPython stands in for
+# the device: the compiler given to vsrfsd is this script with --cross,
+# which writes marshalled code objects instead of MicroPython bytecode, and
+# "loading" is marshal.loads against compile of the source. genstream is
+# replaced by a plain base class as bench_vsrfs. MicroPython takes a tab in
+# the indentation to the next multiple of 8 columns, where CPython raises
+# TabError on a mix of tabs and spaces (hd44780.py), so the indentation is
+# expanded the same way before CPython compiles it.
+
+import gc
+import marshal
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy/test'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+# source with the tabs of the indentation expanded as MicroPython reads them
+def upy_source(data):
+    lines = data.split(b'\n')
+    for i, line in enumerate(lines):
+        body = line.lstrip(b' \t')
+        lines[i] = line[:len(line) - len(body)].expandtabs(8) + body
+    return b'\n'.join(lines)
+
+# mpy-cross stand-in: bench_mpy.py --cross -s NAME -o OUTPUT SOURCE
+def cross(args):
+    name = args[args.index('-s') + 1]
+    out = args[args.index('-o') + 1]
+    with open(args[-1], 'rb') as f:
+        code = compile(upy_source(f.read()), name, 'exec')
+    with open(out, 'wb') as f:
+        marshal.dump(code, f)
+
+if __name__ == '__main__' and sys.argv[1:2] == ['--cross']:
+    cross(sys.argv[2:])
+    sys.exit(0)
+
+genstream = types.ModuleType('genstream')
+genstream.genstream = object
+sys.modules['genstream'] = genstream
+
+import mipc
+import vsrfs
+import vsrfsd
+
+n_requests = 0
+_send_udp = mipc.IOPort._send_udp
+def _counting_send_udp(self, msg):
+    global n_requests
+    name = msg[1] if isinstance(msg[0], int) else msg[0]
+    if not name.endswith('_reply'):
+        n_requests += 1
+    return _send_udp(self, msg)
+mipc.IOPort._send_udp = _counting_send_udp
+
+# modules of upy/lib which CPython can compile (some are Python 2)
+def module_names(lib):
+    names = []
+    for f in sorted(os.listdir(lib)):
+        if not f.endswith('.py'):
+            continue
+        with open(os.path.join(lib, f), 'rb') as fobj:
+            try:
+                compile(upy_source(fobj.read()), f, 'exec')
+            except SyntaxError:
+                continue
+        names.append(f[:-3])
+    return names
+
+# find a module as MicroPython's import (X.py, then X.mpy) and read it
+def fetch_module(fs, name):
+    for path in ('/' + name + '.py', '/' + name + '.mpy'):
+        if fs.stat(path)[0] & 0x8000:
+            break
+    with fs.open(path, 'rb') as f:
+        return path, f.read()
+
+# compile or load a module. Return seconds and peak heap, the smaller of two
+# tries (tracemalloc also sees the threads of mipc.manager).
+def load_module(path, data):
+    result = None
+    for _ in range(2):
+        gc.collect()
+        tracemalloc.start()
+        tv = time.time()
+        if path.endswith('.mpy'):
+            marshal.loads(data)
+        else:
+            compile(upy_source(data), path, 'exec')
+        tv = time.time() - tv
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if result is None or peak < result[1]:
+            result = (tv, peak)
+    return result
+
+def run(label, addr, names, mpy_cache):
+    global n_requests
+    vsrfs._config.mpy_cache = mpy_cache
+    fs = vsrfs.VSRfs(addr)
+    fs.mount(None, '/V')
+    n_requests = 0
+    tv = time.time()
+    modules = [fetch_module(fs, name) for name in names]
+    tv = time.time() - tv
+    fs.umount()
+    loads = [load_module(path, data) for path, data in modules]
+    t_load = sum(t for t, _ in loads)
+    print('%-22s %9d %9d %9.1f %9.1f %9d' % (
+        label, n_requests, sum(len(data) for _, data in modules),
+        tv * 1000, t_load * 1000, max(p for _, p in loads)))
+
+def main():
+    lib = os.path.join(_top, 'upy/lib')
+    names = module_names(lib)
+    build = tempfile.mkdtemp()
+    device = tempfile.mkdtemp()
+    cache = os.path.join(device, 'mpy')
+    stand_in = '%s %s --cross' % (sys.executable, os.path.abspath(__file__))
+    addr_py = ('127.0.0.1', random.randint(20000, 30000))
+    addr_mpy = ('127.0.0.1', random.randint(30001, 40000))
+    vsrfsd.main(addr_py, lib, foreground=False)
+    vsrfsd.main(addr_mpy, lib, foreground=False, workers=0,
+                mpy_cross=stand_in, mpy_cache=build)
+    time.sleep(0.1)
+
+    print('%d modules of upy/lib' % len(names))
+    print('%-22s %9s %9s %9s %9s %9s' % (
+        'import', 'requests', 'bytes', 'fetch ms', 'load ms', 'peak'))
+    run('.py', addr_py, names, None)
+    run('.mpy (compiling)', addr_mpy, names, None)
+    run('.mpy', addr_mpy, names, None)
+    run('.mpy, fill mpy_cache', addr_mpy, names, cache)
+    run('.mpy, mpy_cache', addr_mpy, names, cache)
+    shutil.rmtree(build)
+    shutil.rmtree(device)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+# Compare JSON and binary (MessagePack style) packers of mipc on CPython:
+# encode/decode throughput and message size for admin and VSRfs messages.
+
+import binascii
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import mipc
+
+CHUNK = bytes(range(256)) * 4		# 1KB, espadm put chunk
+SRC = (b'import os\nimport mipc\n\ndef f(x):\n    return x * 2\n' * 6)[:256]
+
+def messages(binary):
+    def blob(data, hexlify=False):
+        if binary:
+            return data
+        if hexlify:
+            return str(binascii.hexlify(data), 'ascii')
+        return str(data, 'latin-1')
+    return [
+        ('admin put_data', ['put_data', blob(CHUNK, True)]),
+        ('admin get_data reply', ['get_data_reply', True, blob(CHUNK * 2, True)]),
+        ('admin ls reply', ['ls_reply', True,
+                            ['boot.py', 'main.py', 'lib', 'fonts', 'data', 'config',
+                             'service', 'display.py', 'ssd1331.py', 'mipc.py']]),
+        ('admin reply (None)', ['put_data_reply', True, None]),
+        ('vsrfs f_read', ['f_read', 3, 12288, 256]),
+        ('vsrfs f_read reply', ['f_read_reply', True, [12544, blob(SRC)]]),
+        ('vsrfs stat reply', ['stat_reply', True,
+                              [0x8000, 1837261, 2049, 1, 1000, 1000, 4711,
+                               1528268800, 1528268800, 1528268800]]),
+        ('vsrfs ilistdir_next reply', ['ilistdir_next_reply', True,
+                                       ['ssd1331.py', 0x8000, 1837261, 14023]]),
+    ]
+
+def bench(packer, msg, duration=0.2):
+    pack = packer.pack
+    loads = packer.loads
+    _, size = pack(msg)
+    body = packer.dumps(msg)
+
+    n = 0
+    tv = time.time()
+    while time.time() - tv < duration:
+        for _ in range(100):
+            pack(msg)
+        n += 100
+    enc = n / (time.time() - tv)
+
+    n = 0
+    tv = time.time()
+    while time.time() - tv < duration:
+        for _ in range(100):
+            loads(body)
+        n += 100
+    dec = n / (time.time() - tv)
+    return size, enc, dec
+
+def main():
+    json_packer = mipc.JSONPacker()
+    msg_packer = mipc.MsgPacker()
+    print('%-26s %12s %13s %13s' % ('message', 'size(B)', 'encode/s', 'decode/s'))
+    for (name, jmsg), (_, bmsg) in zip(messages(False), messages(True)):
+        js, je, jd = bench(json_packer, jmsg)
+        bs, be, bd = bench(msg_packer, bmsg)
+        print('%-26s %5d %6d %5.0fk %5.0fk %5.0fk %5.0fk' % (
+            name, js, bs, je/1000, be/1000, jd/1000, bd/1000))
+    print('(each column: json msgpack)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+# Count receive buffer allocations of mipc packers on CPython, comparing
+# DumpPackerBase.unpack with a fresh bytes object per read and the reusable
+# buffer mode (RECV_BUFSIZE). A socketpair stands in for a TCP connection.
+
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import mipc
+
+# socket wrapper counting receive calls which allocate a new buffer.
+class CountingSocket(object):
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.n_alloc = 0
+        self.n_alloc_bytes = 0
+
+    def recv(self, n):
+        data = self._sock.recv(n)
+        self.n_alloc += 1
+        self.n_alloc_bytes += len(data)
+        return data
+
+    def recv_into(self, buf, n=0):
+        return self._sock.recv_into(buf, n)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+class BufferedMsgPacker(mipc.MsgPacker):
+    RECV_BUFSIZE = 512
+
+class UnbufferedMsgPacker(mipc.MsgPacker):
+    RECV_BUFSIZE = 0
+
+def run(packer_class, msgs, repeat):
+    rsock, wsock = socket.socketpair()
+    sender = packer_class()
+    frames = [sender.pack(msg)[0] for msg in msgs]
+
+    def writer():
+        for _ in range(repeat):
+            for data in frames:
+                wsock.sendall(data)
+        wsock.close()
+    th = threading.Thread(target=writer)
+
+    sock = CountingSocket(rsock)
+    packer = packer_class()
+    n = 0
+    tracemalloc.start()
+    tv = time.time()
+    th.start()
+    try:
+        while True:
+            packer.unpack(sock)
+            n += 1
+    except mipc.SocketClosed:
+        pass
+    tv = time.time() - tv
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    th.join()
+    rsock.close()
+    return n, tv, sock.n_alloc, sock.n_alloc_bytes, peak
+
+def main():
+    msgs = [['put_data', bytes(1024)],
+            ['f_read_reply', True, [12544, bytes(256)]],
+            ['stat_reply', True, [0x8000, 1837261, 2049, 1, 1000, 1000, 4711,
+                                  1528268800, 1528268800, 1528268800]],
+            ['get_data_reply', True, bytes(2048)]]
+    repeat = 5000
+    print('%-12s %8s %10s %10s %12s %10s' % (
+        'mode', 'msgs', 'msgs/s', 'allocs', 'alloc bytes', 'peak'))
+    for name, cls in (('bytes', UnbufferedMsgPacker),
+                      ('reuse', BufferedMsgPacker)):
+        n, tv, n_alloc, n_bytes, peak = run(cls, msgs, repeat)
+        print('%-12s %8d %10.0f %10d %12d %10d' % (
+            name, n, n/tv, n_alloc, n_bytes, peak))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# Goodput of the reliable datagram port (rudp) on loopback with loss. A
+# lossy stand-in wraps the UDP sockets of both sides in this process and
+# drops sent datagrams at random. 1MB is read by 4KB messages (fragmented
+# into datagrams) with 4 requests in flight. Plain mipc UDP is shown for
+# comparison: it reads 448 bytes per request and has no retransmission.
+# Datagram counts are of both sides.
+
+import os
+import random
+import socket
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import mipc
+import rudp
+
+BLOB = os.urandom(1024 * 1024)
+
+@mipc.autoreply
+class BlobService(mipc.ServiceBase):
+
+    @mipc.autoreply
+    def read(self, offset, size):
+        return BLOB[offset:offset + size]
+
+# UDP socket which drops sent datagrams at the rate of loss.
+class LossySocket(object):
+
+    def __init__(self, sock, loss, rng):
+        self._sock = sock
+        self._loss = loss
+        self._rng = rng
+        self.n_dropped = 0
+
+    def sendto(self, data, addr):
+        if self._rng.random() < self._loss:
+            self.n_dropped += 1
+            return len(data)
+        return self._sock.sendto(data, addr)
+
+    def send(self, data):
+        if self._rng.random() < self._loss:
+            self.n_dropped += 1
+            return len(data)
+        return self._sock.send(data)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+def udp_socket(addr=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(addr or ('127.0.0.1', 0))
+    return sock
+
+def read_all(port, unit, window=4):
+    args = [(off, unit) for off in range(0, len(BLOB), unit)]
+    tv = time.time()
+    data = b''.join(port.imap('read', args, window))
+    tv = time.time() - tv
+    if data != BLOB:
+        raise Exception('broken data')
+    return tv
+
+def run_rudp(loss, seed):
+    rng = random.Random(seed)
+    addr = ('127.0.0.1', random.randint(20000, 40000))
+    ssock = LossySocket(udp_socket(addr), loss, rng)
+    server = rudp.ReliableUDPPort(ssock)
+    mipc.manager.register(server, BlobService())
+    csock = LossySocket(udp_socket(), loss, rng)
+    cli = rudp.ReliableUDPPort(csock, addr).negotiate([rudp.ReliableMsgPacker.NAME])
+    try:
+        tv = read_all(cli, 4096)
+    finally:
+        channels = [cli._channel] + list(server._channels.values())
+        cli.close()
+        mipc.manager.unregister(server)
+        server.close()
+    print('%-6s %5.1f%% %10.3f %10.3f %8d %8d %8d' % (
+        'rudp', loss * 100, tv, len(BLOB) / tv / 1000000,
+        sum(ch.n_sent for ch in channels),
+        sum(ch.n_retransmit for ch in channels),
+        csock.n_dropped + ssock.n_dropped))
+
+def run_udp(loss, seed):
+    rng = random.Random(seed)
+    addr = ('127.0.0.1', random.randint(20000, 40000))
+    server = mipc.udp_server(addr)
+    server.socket = LossySocket(server.socket, loss, rng)
+    mipc.manager.register(server, BlobService())
+    cli = mipc.udp_client(addr)
+    cli.socket = LossySocket(cli.socket, loss, rng)
+    try:
+        tv = read_all(cli, mipc.UDPDumpPackerBase.MAXLEN - 64)
+        print('%-6s %5.1f%% %10.3f %10.3f' % (
+            'udp', loss * 100, tv, len(BLOB) / tv / 1000000))
+    except OSError as e:
+        print('%-6s %5.1f%%  failed: %s' % ('udp', loss * 100, repr(e)))
+    finally:
+        cli.close()
+        mipc.manager.unregister(server)
+        server.close()
+
+def main():
+    print('%-6s %6s %10s %10s %8s %8s %8s' % (
+        'port', 'loss', 's', 'MB/s', 'sent', 'resent', 'dropped'))
+    for loss in (0.0, 0.01, 0.05):
+        run_rudp(loss, 1)
+    for loss in (0.0, 0.01):
+        run_udp(loss, 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+# Loopback benchmark of espadm sync on CPython: a full deploy of a tree, a
+# redeploy after one file is edited, and sequential put of every file.
+
+import os
+import random
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+import mipc
+from service.admin import AdminService
+from espadm import AdminCommand, local_manifest
+
+def make_tree(top, n_dirs, n_files, size):
+    for d in range(n_dirs):
+        os.makedirs(os.path.join(top, 'dir%d' % d, 'sub'))
+        for i in range(n_files):
+            for sub in ('', 'sub'):
+                with open(os.path.join(top, 'dir%d' % d, sub, 'f%d.py' % i), 'wb') as f:
+                    f.write(os.urandom(size))
+
+def main():
+    device = tempfile.mkdtemp()
+    local = tempfile.mkdtemp()
+    make_tree(local, 4, 10, 8192)
+    os.chdir(device)
+
+    port = random.randint(20000, 40000)
+    mipc.manager.register_server(('127.0.0.1', port), AdminService())
+    time.sleep(0.1)
+    admin = AdminCommand()
+    admin.start('127.0.0.1', port)
+
+    def run(name, func):
+        tv = time.time()
+        n_files, n_bytes = func()
+        print('%-24s %4d files %8d bytes %8.3f s' % (name, n_files, n_bytes, time.time() - tv))
+
+    def put_all():
+        _, files = local_manifest(local, 'sha256')
+        for rel in sorted(files):
+            admin.put(os.path.join(local, rel), remote_path=rel)
+        return len(files), sum(size for size, _ in files.values())
+
+    run('sync (full)', lambda: admin.sync(local, connections=3))
+    with open(os.path.join(local, 'dir2', 'sub', 'f3.py'), 'ab') as f:
+        f.write(b'# edited\n')
+    run('sync (one file edited)', lambda: admin.sync(local, connections=3))
+    run('sync (unchanged)', lambda: admin.sync(local, connections=3))
+    run('put every file', put_all)
+
+    _, lfiles = local_manifest(local, 'sha256')
+    _, dfiles = local_manifest(device, 'sha256')
+    if lfiles != dfiles:
+        raise Exception('device tree differs')
+    print('device tree verified')
+    admin.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+# Lines per second of TextBoard on the emulated SSD1331 (ssd1331emu): a log
+# of --lines lines put one by one, and the same log in bursts of 10 lines
+# in hold(), on a board of the whole display. The boards draw a character
+# by fcf_put and scroll by copy (char), draw a line at once (line), scroll
+# by the display start line too (hw scroll), and draw the lines put within
+# refresh_ms of a refresh at the next putline after it (line auto, as a
+# burst of log lines without hold), on the adaptor drawing by commands
+# (batch) and by the framebuffer. Each put ends by refresh(), as the admin
+# service does when its client disconnects. Lines/s of the device is by
+# the modelled bus time (--write-us a write, the bits at 6 MHz), of the
+# host by the time of the drivers without the emulator. "same" tells the
+# panel shows what the char board of the mode drew. The fcf font is
+# generated as bench_fonts.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fakemachine
+import ssd1331emu
+panel = ssd1331emu.install()
+
+import display
+import ssd1331
+from bench_fonts import fcf_font
+
+BOARDS = (('char', dict(line_buffer=False, hw_scroll=False)),
+          ('line', dict(line_buffer=True, hw_scroll=False, refresh_ms=0)),
+          ('hw scroll', dict(line_buffer=True, hw_scroll=True, refresh_ms=0)),
+          ('line auto', dict(line_buffer=True, hw_scroll=False, refresh_ms=20)))
+LOG = ['boot: full', 'wifi: connecting', 'wifi: 192.168.10.123',
+       'admin: port 8022', 'vsrfs: mount /V', 'airterm: start',
+       'put /lib/display.py ... OK', 'temp 23.5C hum 45%', 'HR 72 SpO2 98']
+BURST = 10
+
+def board(framebuffer, kwargs):
+    driver = ssd1331.vspi()
+    disp = ssd1331.Adaptor(driver, fcf=True, framebuffer=framebuffer)
+    disp.clear()
+    disp.flush()
+    return display.TextBoard(disp, 0, 0, 95, 63, **kwargs)
+
+def one_by_one(tb, n):
+    for i in range(n):
+        tb.putline(LOG[i % len(LOG)])
+    tb.refresh()
+
+def bursts(tb, n):
+    for i in range(0, n, BURST):
+        with tb.hold():
+            for j in range(i, min(n, i + BURST)):
+                tb.putline(LOG[j % len(LOG)])
+    tb.refresh()
+
+def run(framebuffer, kwargs, put, n):
+    fakemachine.attach(panel)
+    tb = board(framebuffer, kwargs)
+    panel.reset_counts()
+    put(tb, n)
+    stats = panel.stats()
+    shown = panel.snapshot()
+    fakemachine.attach(None)
+    tb = board(framebuffer, kwargs)
+    tv = time.perf_counter()
+    put(tb, n)
+    stats['host s'] = time.perf_counter() - tv
+    return stats, shown
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=60)
+    parser.add_argument('--write-us', type=float, default=ssd1331emu.WRITE_US,
+                        help='us of a write on the device')
+    parser.add_argument('--png', metavar='DIR', help='dump the panel of each run')
+    args = parser.parse_args()
+    panel.write_us = args.write_us
+    fontdir = tempfile.mkdtemp()
+    display._FontBase.FONTDIR = fontdir + '/'
+    with open(os.path.join(fontdir, 'misaki_7x4.fcf'), 'wb') as f:
+        f.write(fcf_font(4, 7, 1))
+    if args.png:
+        os.makedirs(args.png, exist_ok=True)
+
+    n = args.lines
+    print('%-11s %-12s %-10s %7s %8s %6s %8s %9s %9s %5s' % (
+        'put', 'adaptor', 'board', 'writes', 'bytes', 'CS', 'bus ms',
+        'lines/s', 'host l/s', 'same'))
+    for put_name, put in (('one by one', one_by_one), ('bursts', bursts)):
+        for fb_name, framebuffer in (('batch', False), ('framebuffer', True)):
+            first = None
+            for board_name, kwargs in BOARDS:
+                stats, shown = run(framebuffer, kwargs, put, n)
+                first = first or shown
+                print('%-11s %-12s %-10s %7d %8d %6d %8.1f %9.0f %9.0f %5s' % (
+                    put_name, fb_name, board_name, stats['writes'], stats['bytes'],
+                    stats['cs windows'], stats['bus ms'], n / (stats['bus ms'] / 1000),
+                    n / stats['host s'], 'yes' if shown == first else 'NO'))
+                if args.png:
+                    name = '%s-%s-%s.png' % tuple(v.replace(' ', '_') for v in
+                                                  (put_name, fb_name, board_name))
+                    panel.write_png(os.path.join(args.png, name), scale=4)
+    shutil.rmtree(fontdir)
+
+if __name__ == '__main__':
+    main()
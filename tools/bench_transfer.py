@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+# Loopback benchmark of the admin file transfer on CPython: the chunked
+# (hexlified) put/get against the streaming transfer, verifying the contents
+# of the transferred files, and resume of an interrupted put.
+
+import os
+import random
+import sys
+import tempfile
+import time
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+import mipc
+from service.admin import AdminService
+from espadm import AdminCommand
+
+def check(path1, path2):
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        if f1.read() != f2.read():
+            raise Exception('%s and %s differ.' % (path1, path2))
+
+def measure(name, func, size):
+    tv = time.time()
+    func()
+    tv = time.time() - tv
+    print('%-16s %8d bytes %8.3f s %8.2f MB/s' % (name, size, tv, size / tv / 1000000))
+
+def main():
+    size = 2 * 1024 * 1024
+    os.chdir(tempfile.mkdtemp())		# directory of the "device"
+    localdir = tempfile.mkdtemp()
+    local = os.path.join(localdir, 'local.bin')
+    with open(local, 'wb') as f:
+        f.write(os.urandom(size))
+
+    port = random.randint(20000, 40000)
+    mipc.manager.register_server(('127.0.0.1', port), AdminService())
+    time.sleep(0.1)
+    admin = AdminCommand()
+    admin.start('127.0.0.1', port)
+
+    l1 = os.path.join(localdir, 'l1.bin')
+    l2 = os.path.join(localdir, 'l2.bin')
+    measure('put (chunked)', lambda: admin.put_chunked(local, 'r0.bin'), size)
+    check(local, 'r0.bin')
+    measure('put (stream)', lambda: admin.put(local, remote_path='r1.bin'), size)
+    check(local, 'r1.bin')
+    measure('get (chunked)', lambda: admin.get_chunked('r1.bin', l1), size)
+    check(local, l1)
+    measure('get (stream)', lambda: admin.get('r1.bin', l2), size)
+    check(local, l2)
+
+    # interrupted put: only the first half reached the device
+    with open(local, 'rb') as f, open('r2.bin', 'wb') as g:
+        g.write(f.read(size // 2))
+    n = admin.put(local, resume=True, remote_path='r2.bin')
+    check(local, 'r2.bin')
+    print('resume: %d bytes sent' % n)
+    admin.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+
+# Import a module of several KB through a loopback vsrfsd and count the
+# VSRfs requests, with and without the client block cache. MicroPython reads
+# source through the VFS reader in 24 byte chunks, which is emulated by an
+# import hook here. genstream (a firmware module) is replaced by a plain
+# base class. Requests are counted on the client side, replies of the
+# in-process server are not. The stat part emulates the path probing of
+# MicroPython's import. The write part compares the write-behind buffer
+# with a synchronous request per write. The open part compares a new port
+# per file with the port pool.
+
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+_top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(_top, 'upy/lib'))
+sys.path.append(os.path.join(_top, 'upy/test'))
+sys.path.append(os.path.join(_top, 'upy'))
+
+genstream = types.ModuleType('genstream')
+genstream.genstream = object
+sys.modules['genstream'] = genstream
+
+import mipc
+import vsrfs
+import vsrfsd
+
+READER_CHUNK = 24
+
+n_requests = 0
+_send_udp = mipc.IOPort._send_udp
+def _counting_send_udp(self, msg):
+    global n_requests
+    name = msg[1] if isinstance(msg[0], int) else msg[0]
+    if not name.endswith('_reply'):
+        n_requests += 1
+    return _send_udp(self, msg)
+mipc.IOPort._send_udp = _counting_send_udp
+
+def make_module(path, n_funcs):
+    with open(path, 'w') as f:
+        f.write('# generated module for bench_vsrfs\n\n')
+        for i in range(n_funcs):
+            f.write('def func%d(x, y=%d):\n' % (i, i))
+            f.write('    """function %d of the generated module"""\n' % i)
+            f.write('    return [x * y + n for n in range(%d)]\n\n' % (i % 7))
+    return os.path.getsize(path)
+
+def import_by_read(fs, path, name):
+    with fs.open(path) as f:
+        chunks = []
+        while True:
+            data = f.read(READER_CHUNK)
+            if not data:
+                break
+            chunks.append(data)
+    mod = types.ModuleType(name)
+    exec(compile(b''.join(chunks), path, 'exec'), mod.__dict__)
+    return mod
+
+def import_by_line(fs, path, name):
+    with fs.open(path) as f:
+        source = b''.join(f)
+    mod = types.ModuleType(name)
+    exec(compile(source, path, 'exec'), mod.__dict__)
+    return mod
+
+# stat calls of MicroPython's import for each of names: a package
+# directory and a .py file are probed on each path entry until found.
+def import_stats(fs, path_entries, names):
+    for name in names:
+        for top in path_entries:
+            if fs.stat(top + '/' + name)[0] & 0x4000:
+                break
+            if fs.stat(top + '/' + name + '.py')[0] & 0x8000:
+                break
+
+def run_stat(name, addr, ttl, path_entries, names):
+    global n_requests
+    vsrfs._config.stat_ttl = ttl
+    fs = vsrfs.VSRfs(addr)
+    fs.mount(None, '/V')
+    n_requests = 0
+    tv = time.time()
+    import_stats(fs, path_entries, names)
+    tv = time.time() - tv
+    fs.umount()
+    print('%-22s %6d %10d %10.3f' % (name, ttl, n_requests, tv * 1000))
+
+# VSRfsFile.write before write-behind: a synchronous f_write per call, and
+# per unit for large data (with the slicing fixed).
+class UnbufferedFile(vsrfs.VSRfsFile):
+
+    def write(self, data):
+        n = 0
+        while n < len(data):
+            self._pos, r = self._port.f_write(self._oh, self._pos,
+                                              data[n:n + self._unit])
+            n += r
+        return n
+
+def run_write(name, addr, root, file_class, size, count):
+    global n_requests
+    fs = vsrfs.VSRfs(addr)
+    fs.mount(None, '/V')
+    data = os.urandom(size)
+    n_requests = 0
+    tv = time.time()
+    with file_class(fs._pool, '/out.bin', 'w', fs._cache) as f:
+        for _ in range(count):
+            f.write(data)
+    tv = time.time() - tv
+    fs.umount()
+    with open(os.path.join(root, 'out.bin'), 'rb') as f:
+        if f.read() != data * count:
+            raise Exception('broken file')
+    print('%-22s %6d %10d %10.0f %10.3f' % (
+        name, size, n_requests, count / tv, size * count / tv / 1000000))
+
+# VSRfs.open before the port pool: a new port with a negotiation per file.
+class NoPool(object):
+
+    def __init__(self, addr):
+        self._addr = addr
+
+    def get(self):
+        return vsrfs._udp_client(self._addr)
+
+    def put(self, port):
+        port.close()
+
+    def close(self):
+        pass
+
+def run_open(name, addr, pool, names, repeat):
+    global n_requests
+    fs = vsrfs.VSRfs(addr)
+    fs.mount(None, '/V')
+    if not pool:
+        fs._pool = NoPool(addr)
+    n_requests = 0
+    tv = time.time()
+    for _ in range(repeat):
+        for mod in names:
+            with fs.open('/lib/' + mod + '.py') as f:
+                f.read(24)
+    tv = time.time() - tv
+    fs.umount()
+    n = repeat * len(names)
+    print('%-22s %6d %10d %10.0f' % (name, n, n_requests, n / tv))
+
+def run(name, addr, block_size, importer):
+    global n_requests
+    vsrfs._config.block_size = block_size
+    fs = vsrfs.VSRfs(addr)
+    fs.mount(None, '/V')
+    n_requests = 0
+    tv = time.time()
+    mod = importer(fs, '/big.py', 'big')
+    tv = time.time() - tv
+    fs.umount()
+    if mod.func5(2) != [10 + n for n in range(5)]:
+        raise Exception('broken module')
+    print('%-22s %6d %10d %10.3f' % (name, block_size, n_requests, tv * 1000))
+
+def main():
+    root = tempfile.mkdtemp()
+    size = make_module(os.path.join(root, 'big.py'), 120)
+    os.mkdir(os.path.join(root, 'sub'))
+    os.mkdir(os.path.join(root, 'lib'))
+    names = ['mod%d' % i for i in range(20)]
+    for i, name in enumerate(names):
+        make_module(os.path.join(root, 'lib', name + '.py'), i)
+    addr = ('127.0.0.1', random.randint(20000, 40000))
+    vsrfsd.main(addr, root, foreground=False)
+    time.sleep(0.1)
+    print('module: %d bytes' % size)
+    print('%-22s %6s %10s %10s' % ('mode', 'block', 'requests', 'ms'))
+    run('read(24), no cache', addr, 0, import_by_read)
+    run('readline, no cache', addr, 0, import_by_line)
+    for block_size in (512, 1024, 2048):
+        run('read(24), cache', addr, block_size, import_by_read)
+    run('readline, cache', addr, 1024, import_by_line)
+    print('')
+    print('import of %d modules from the 3rd path entry' % len(names))
+    print('%-22s %6s %10s %10s' % ('mode', 'ttl', 'requests', 'ms'))
+    path_entries = ['', '/sub', '/lib']
+    run_stat('stat, no cache', addr, 0, path_entries, names)
+    run_stat('stat, cache', addr, 2, path_entries, names)
+    print('')
+    print('%-22s %6s %10s %10s' % ('open + read(24)', 'opens', 'requests', 'opens/s'))
+    run_open('new port', addr, False, names, 10)
+    run_open('port pool', addr, True, names, 10)
+    print('')
+    print('%-22s %6s %10s %10s %10s' % ('write', 'size', 'requests', 'writes/s', 'MB/s'))
+    for size, count in ((32, 4000), (200, 1000), (65536, 16)):
+        run_write('unbuffered', addr, root, UnbufferedFile, size, count)
+        run_write('write-behind', addr, root, vsrfs.VSRfsFile, size, count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+# Aggregate throughput of mipc services with several concurrent clients while
+# one client keeps calling a deliberately slow handler, with and without the
+# worker pool of the service manager.
+
+import os
+import random
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import mipc
+
+SLOW_s = 0.1
+
+@mipc.autoreply
+class BenchService(mipc.ServiceBase):
+
+    @mipc.autoreply
+    def fast(self, v):
+        return v
+
+    @mipc.autoreply
+    @mipc.worker
+    def slow(self, v):
+        time.sleep(SLOW_s)		# e.g. flash write, motor move
+        return v
+
+def run(workers, n_clients, duration):
+    manager = mipc._ServiceManager()
+    if workers:
+        manager.start_workers(workers)
+    addr = ('127.0.0.1', random.randint(20000, 40000))
+    manager.register_server(addr, BenchService())
+
+    counts = [0] * (n_clients + 1)
+    stop = time.time() + duration
+
+    def client(i, name):
+        cli = mipc.client(addr)
+        call = getattr(cli, name)
+        n = 0
+        while time.time() < stop:
+            if call(n) != n:
+                raise Exception('unexpected reply')
+            n += 1
+        counts[i] = n
+        cli.close()
+
+    threads = [threading.Thread(target=client, args=(0, 'slow'))]
+    threads.extend(threading.Thread(target=client, args=(i, 'fast'))
+                   for i in range(1, n_clients + 1))
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return counts[0], sum(counts[1:])
+
+def main():
+    duration = 2.0
+    print('%-8s %-8s %10s %12s' % ('workers', 'clients', 'slow/s', 'fast/s'))
+    for workers in (0, 1, 2):
+        for n_clients in (1, 4):
+            slow, fast = run(workers, n_clients, duration)
+            print('%-8d %-8d %10.1f %12.1f' % (
+                workers, n_clients, slow/duration, fast/duration))
+
+if __name__ == '__main__':
+    main()
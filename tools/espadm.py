@@ -1,9 +1,19 @@
-#!/usr/bin/python2
+#!/usr/bin/python3
 
 import binascii
+import hashlib
 import os
+import struct
 import sys
-from tpp import mipc
+import threading
+import time
+import zlib
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+import mipc
+
+STREAM_UNIT = 16 * 1024
+DEFLATE_UNIT = 4 * 1024		# chunk decompressed by the device at once
+STORED_SUFFIXES = ('.gz', '.zip', '.png', '.jpg', '.jpeg')
 
 class AdminCommand(object):
 
@@ -11,13 +21,14 @@ class AdminCommand(object):
         self.cli = None
         self.on_close = None
 
-    def start(self, ip_address):
-        self.cli = mipc.client((ip_address, 2000))
+    def start(self, ip_address, port=2000):
+        self.addr = (ip_address, port)
+        self.cli = mipc.client(self.addr)
 
     def stop(self):
         self.cli.close()
         if self.on_close:
-            self.on_cloase()
+            self.on_close()
 
     def reset(self):
         self.cli.reset()
@@ -28,9 +39,9 @@ class AdminCommand(object):
             data = binascii.hexlify(f.read())
             self.cli.put(path, data)
 
-    def put(self, path):
+    def put_chunked(self, path, remote_path=None):
         with open(path, 'rb') as f:
-            self.cli.put_beg(path)
+            self.cli.put_beg(remote_path or path)
             while True:
                 data = f.read(1024)
                 if not data:
@@ -39,8 +50,9 @@ class AdminCommand(object):
                 self.cli.put_data(data)
             self.cli.put_end()
 
-    def get(self, path):
-        with open(path+'.tmp', 'wb') as f:
+    def get_chunked(self, path, local_path=None):
+        local_path = local_path or path
+        with open(local_path+'.tmp', 'wb') as f:
             self.cli.get_beg(path)
             while True:
                 data = self.cli.get_data()
@@ -48,9 +60,126 @@ class AdminCommand(object):
                     break
                 data = binascii.unhexlify(data)
                 f.write(data)
-        if os.path.exists(path):
-            os.rename(path, path+'.bck')
-        os.rename(path+'.tmp', path)
+        if os.path.exists(local_path):
+            os.rename(local_path, local_path+'.bck')
+        os.rename(local_path+'.tmp', local_path)
+
+    # Streaming transfer (see AdminService.put_stream). Return the number of
+    # transferred bytes. put compresses the data if the device can decompress
+    # it, unless the file is already compressed (compress=None).
+
+    def put(self, path, resume=False, remote_path=None, compress=None):
+        remote_path = remote_path or path
+        cli = self.cli
+        size = os.path.getsize(path)
+        offset = 0
+        if resume:
+            offset = cli.filesize(remote_path)
+            if offset < 0 or offset > size:
+                offset = 0
+        if compress is None:
+            compress = cli.peer_inflate and not path.endswith(STORED_SUFFIXES)
+        if compress:
+            cli.send(['put_stream', remote_path, size, offset, 'deflate']).result()
+        else:
+            cli.send(['put_stream', remote_path, size, offset]).result()
+        crc = 0
+        level = 6
+        frames = bytearray()	# sent together, small writes wait for ACK
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                data = f.read(DEFLATE_UNIT if compress else STREAM_UNIT)
+                if not data:
+                    break
+                crc = binascii.crc32(data, crc)
+                if not compress:
+                    cli.send_raw(data)
+                    continue
+                z = zlib.compress(data, level)
+                if len(z) > len(data) - (len(data) >> 3):
+                    level = 0		# incompressible, store the rest
+                frames += struct.pack('>I', len(z))
+                frames += z
+                if len(frames) >= STREAM_UNIT:
+                    cli.send_raw(frames)
+                    frames = bytearray()
+        if frames:
+            cli.send_raw(frames)
+        if cli.result() != crc:
+            raise Exception('%s: CRC mismatch.' % path)
+        return size - offset
+
+    def get(self, path, local_path=None):
+        local_path = local_path or path
+        cli = self.cli
+        size = cli.send(['get_stream', path, 0]).result()
+        crc = 0
+        buf = memoryview(bytearray(STREAM_UNIT))
+        with open(local_path+'.tmp', 'wb') as f:
+            rest = size
+            while rest:
+                mv = buf[:rest] if rest < len(buf) else buf
+                if cli.recv_into(mv) != len(mv):
+                    raise mipc.SocketUnexpectedClosed()
+                f.write(mv)
+                crc = binascii.crc32(mv, crc)
+                rest -= len(mv)
+        if cli.result() != crc:
+            os.remove(local_path+'.tmp')
+            raise Exception('%s: CRC mismatch.' % path)
+        if os.path.exists(local_path):
+            os.rename(local_path, local_path+'.bck')
+        os.rename(local_path+'.tmp', local_path)
+        return size
+
+    # Upload files under local_dir which differ from the device in size or
+    # hash, over several connections in parallel. Files only on the device
+    # are left as they are. Return the number of files and bytes.
+    def sync(self, local_dir, remote_dir='', connections=3):
+        remote = self.cli.manifest(remote_dir)
+        rfiles = dict((path, (size, digest)) for path, size, digest in remote['files'])
+        rdirs = set(remote['dirs'])
+        ldirs, lfiles = local_manifest(local_dir, remote['hash'])
+
+        def rpath(rel):
+            return (remote_dir + '/' + rel) if remote_dir else rel
+
+        for rel in ldirs:
+            if rel not in rdirs:
+                self.mkdir(rpath(rel))
+        changed = [rel for rel, ent in sorted(lfiles.items()) if rfiles.get(rel) != ent]
+        changed.reverse()
+        lock = threading.Lock()
+        errors = []
+
+        def upload():
+            admin = AdminCommand()
+            admin.start(*self.addr)
+            try:
+                while True:
+                    with lock:
+                        if not changed or errors:
+                            return
+                        rel = changed.pop()
+                    admin.put(os.path.join(local_dir, rel), remote_path=rpath(rel))
+                    print('%s ... %d bytes' % (rel, lfiles[rel][0]))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                admin.stop()
+
+        n_files = len(changed)
+        n_bytes = sum(lfiles[rel][0] for rel in changed)
+        threads = [threading.Thread(target=upload)
+                   for _ in range(min(connections, n_files))]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        if errors:
+            raise errors[0]
+        return n_files, n_bytes
 
     def mkdir(self, path):
         self.cli.mkdir(path)
@@ -59,8 +188,8 @@ class AdminCommand(object):
         self.cli.rmdir(path)
 
     def ls(self, path):
-        print path
-        print ' ', self.cli.ls(path)
+        print(path)
+        print(' ', self.cli.ls(path))
 
     def remove(self, path):
         self.cli.remove(path)
@@ -77,71 +206,128 @@ class AdminCommand(object):
     def service(self, modname):
         return self.cli.service(modname)
 
-if len(sys.argv) == 1:
-    print 'Usage: espadm put[small] PATH ...'
-    print '              get PATH ...'
-    print '              mkdir DIR ...'
-    print '              rmdir DIR ...'
-    print '              ls DIR ...'
-    print '              remove PATH ...'
-    print '              rename OLD NEW'
-    print '              service SERVICE'
-    print '              display {on|off}'
-    print '              reset'
-    print ''
-    print ' environment: ESP32_ADDR'
-    exit()
-
-IP_ADDRESS = os.getenv('ESP32_ADDR', '192.168.0.151')
-
-admin = AdminCommand()
-admin.start(IP_ADDRESS)
-
-if sys.argv[1] == 'reset':
-    admin.reset()
-
-elif sys.argv[1] == 'putsmall':
-    for path in sys.argv[2:]:
-        admin.put_small(path)
-
-elif sys.argv[1] == 'put':
-    for path in sys.argv[2:]:
-        admin.put(path)
-
-elif sys.argv[1] == 'get':
-    for path in sys.argv[2:]:
-        admin.get(path)
-
-elif sys.argv[1] == 'mkdir':
-    for path in sys.argv[2:]:
-        admin.mkdir(path)
-
-elif sys.argv[1] == 'rmdir':
-    for path in sys.argv[2:]:
-        admin.rmdir(path)
-    
-elif sys.argv[1] == 'ls':
-    for path in sys.argv[2:]:
-        admin.ls(path)
-
-elif sys.argv[1] == 'remove':
-    for path in sys.argv[2:]:
-        admin.remove(path)
-
-elif sys.argv[1] == 'rename':
-    admin.rename(sys.argv[2], sys.argv[3])
-
-elif sys.argv[1] == 'display':
-    if sys.argv[2] == 'on':
-        admin.display_on()
-    elif sys.argv[2] == 'off':
-        admin.display_off()
-    else:
-        print 'display require on/off'
+def file_digest(path, hash_name):
+    h = hashlib.sha256() if hash_name == 'sha256' else None
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(STREAM_UNIT)
+            if not data:
+                break
+            if h:
+                h.update(data)
+            else:
+                crc = binascii.crc32(data, crc)
+    return h.hexdigest() if h else '%08x' % crc
+
+# directories and files (path: (size, digest)) under local_dir, in the same
+# form as AdminService.manifest.
+def local_manifest(local_dir, hash_name):
+    dirs = []
+    files = {}
+    for root, dnames, fnames in os.walk(local_dir):
+        dnames[:] = sorted(d for d in dnames
+                           if not d.startswith('.') and d != '__pycache__')
+        rel = os.path.relpath(root, local_dir).replace(os.sep, '/')
+        rel = '' if rel == '.' else rel + '/'
+        dirs.extend(rel + d for d in dnames)
+        for name in fnames:
+            if name.startswith('.') or name.endswith(('.pyc', '~')):
+                continue
+            path = os.path.join(root, name)
+            files[rel + name] = (os.path.getsize(path), file_digest(path, hash_name))
+    return dirs, files
+
+def transfer(func, paths):
+    total = 0
+    tv = time.time()
+    for path in paths:
+        n = func(path)
+        print('%s ... %d bytes' % (path, n))
+        total += n
+    tv = time.time() - tv
+    if tv > 0:
+        print('%d bytes, %.3f s, %.3f MB/s' % (total, tv, total / tv / 1000000))
+
+def main():
+    if len(sys.argv) == 1:
+        print('Usage: espadm put[small] PATH ...')
+        print('              resume PATH ...')
+        print('              get PATH ...')
+        print('              sync LOCAL_DIR [REMOTE_DIR]')
+        print('              mkdir DIR ...')
+        print('              rmdir DIR ...')
+        print('              ls DIR ...')
+        print('              remove PATH ...')
+        print('              rename OLD NEW')
+        print('              service SERVICE')
+        print('              display {on|off}')
+        print('              reset')
+        print('')
+        print(' environment: ESP32_ADDR')
+        exit()
 
-elif sys.argv[1] == 'service':
-    port = admin.service(sys.argv[2])
-    print 'port:', port
+    IP_ADDRESS = os.getenv('ESP32_ADDR', '192.168.0.151')
+
+    admin = AdminCommand()
+    admin.start(IP_ADDRESS)
+
+    if sys.argv[1] == 'reset':
+        admin.reset()
+
+    elif sys.argv[1] == 'putsmall':
+        for path in sys.argv[2:]:
+            admin.put_small(path)
+
+    elif sys.argv[1] == 'put':
+        transfer(admin.put, sys.argv[2:])
+
+    elif sys.argv[1] == 'resume':
+        transfer(lambda path: admin.put(path, resume=True), sys.argv[2:])
+
+    elif sys.argv[1] == 'get':
+        transfer(admin.get, sys.argv[2:])
+
+    elif sys.argv[1] == 'sync':
+        remote_dir = sys.argv[3] if len(sys.argv) > 3 else ''
+        tv = time.time()
+        n_files, n_bytes = admin.sync(sys.argv[2], remote_dir)
+        tv = time.time() - tv
+        print('%d files, %d bytes, %.3f s' % (n_files, n_bytes, tv))
+
+    elif sys.argv[1] == 'mkdir':
+        for path in sys.argv[2:]:
+            admin.mkdir(path)
+
+    elif sys.argv[1] == 'rmdir':
+        for path in sys.argv[2:]:
+            admin.rmdir(path)
+
+    elif sys.argv[1] == 'ls':
+        for path in sys.argv[2:]:
+            admin.ls(path)
+
+    elif sys.argv[1] == 'remove':
+        for path in sys.argv[2:]:
+            admin.remove(path)
+
+    elif sys.argv[1] == 'rename':
+        admin.rename(sys.argv[2], sys.argv[3])
+
+    elif sys.argv[1] == 'display':
+        if sys.argv[2] == 'on':
+            admin.display_on()
+        elif sys.argv[2] == 'off':
+            admin.display_off()
+        else:
+            print('display require on/off')
+
+    elif sys.argv[1] == 'service':
+        port = admin.service(sys.argv[2])
+        print('port:', port)
+
+    else:
+        print('Unknown command:', sys.argv[1])
 
-else:
-    print 'Unknown command:', sys.argv[1]
+if __name__ == '__main__':
+    main()
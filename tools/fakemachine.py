@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+# Host stand-in of the MicroPython machine module for the benchmarks of the
+# drivers in upy/lib. install() puts it as machine (and the ticks functions
+# of MicroPython into time). Pins keep their value and count the falls (CS
+# windows), PWM does nothing, and SPI counts the write transactions and
+# bytes. A device attached (attach) receives the writes of the buses, e.g.
+# the panel of ssd1331emu.
+
+import sys
+import time
+
+pins = {}			# id: the last Pin created
+
+class Pin(object):
+
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id_, mode=None, pull=None, value=None):
+        self.id = id_
+        self._value = value or 0
+        self.falls = 0
+        pins[id_] = self
+
+    def init(self, mode=None, pull=None, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        if self._value and not v:
+            self.falls += 1
+        self._value = v
+
+    def irq(self, handler=None, trigger=None):
+        pass
+
+class PWM(object):
+
+    def __init__(self, pin, freq=None, duty=None):
+        self._freq = freq or 0
+        self._duty = duty or 0
+
+    def freq(self, v=None):
+        if v is None:
+            return self._freq
+        self._freq = v
+
+    def duty(self, v=None):
+        if v is None:
+            return self._duty
+        self._duty = v
+
+    def deinit(self):
+        pass
+
+buses = []			# SPI created
+_device = None
+
+# a device receiving the writes of the SPI buses (receive(bus, buf)), None
+# detaches it
+def attach(device):
+    global _device
+    _device = device
+    for bus in buses:
+        bus.device = device
+
+class SPI(object):
+
+    def __init__(self, id_, **kwargs):
+        buses.append(self)
+        self.id = id_
+        self.baudrate = kwargs.get('baudrate', 1000000)
+        self.device = _device
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def write(self, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+        if self.device is not None:
+            self.device.receive(self, buf)
+
+    def read(self, nbytes, write=0):
+        self.transactions += 1
+        return bytes(nbytes)
+
+    def readinto(self, buf, write=0):
+        self.transactions += 1
+
+    def write_readinto(self, wbuf, rbuf):
+        self.transactions += 1
+        self.bytes += len(wbuf)
+
+def time_pulse_us(pin, level, timeout_us=1000000):
+    return -1			# timeout
+
+_T0 = time.time()
+
+def _ticks_ms():
+    return int((time.time() - _T0) * 1000)
+
+def _ticks_us():
+    return int((time.time() - _T0) * 1000000)
+
+def _ticks_diff(a, b):
+    return a - b
+
+def install():
+    sys.modules['machine'] = sys.modules[__name__]
+    for name, func in (('ticks_ms', _ticks_ms), ('ticks_us', _ticks_us),
+                       ('ticks_diff', _ticks_diff),
+                       ('sleep_ms', lambda ms: time.sleep(ms / 1000.0)),
+                       ('sleep_us', lambda us: time.sleep(us / 1000000.0))):
+        if not hasattr(time, name):
+            setattr(time, name, func)
@@ -1,37 +1,147 @@
+#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-import sys
-import array
-from PIL import Image
+# Convert images to the image files of display.Image: the width and the
+# height (a byte each) and the pixels in a color format of SSD1331, 65k
+# (RGB565, 2 bytes) or 256 (RGB332, a byte). Images larger than the panel
+# are resized to fit it (keeping the aspect ratio). The colors are reduced
+# by truncation, an ordered (4x4 Bayer) or Floyd-Steinberg dithering. The
+# conversion is done by the band operations of PIL, not pixel by pixel.
+#
+#   img2mp65k.py photo.jpg photo-65k.img
+#   img2mp65k.py -d fs -f 256 images/ out/	# images/X.png -> out/X-256.img
 
-if len(sys.argv) != 3:
-    print 'Usage: %s input_image 16bit_color_img' % sys.argv[0]
-    exit()
+import argparse
+import os
+from PIL import Image, ImageChops
 
-org = Image.open(sys.argv[1])
+FORMATS = {'65k': (5, 6, 5), '256': (3, 3, 2)}	# bits of R, G, B
+DITHERS = ('none', 'ordered', 'fs')
+PANEL_SIZE = (96, 64)
+SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
 
-width = org.size[0]
-height = org.size[1]
+BAYER4 = (0, 8, 2, 10,
+          12, 4, 14, 6,
+          3, 11, 1, 9,
+          15, 7, 13, 5)
 
-print 'size WxH:', width, height
+def fit(img, size):
+    w, h = img.size
+    if w <= size[0] and h <= size[1]:
+        return img
+    scale = min(size[0] / w, size[1] / h)
+    return img.resize((max(1, round(w * scale)), max(1, round(h * scale))),
+                      Image.LANCZOS)
 
-def conv_rgb(r, g, b):
-    return (r >> 3,
-            g >> 2,
-            b >> 3)
+# Bayer thresholds of a step tiled over size
+def _bayer(size, step):
+    w, h = size
+    rows = []
+    for y in range(4):
+        row = bytes(b * step // 16 for b in BAYER4[y*4:y*4+4])
+        rows.append((row * (w // 4 + 1))[:w])
+    return Image.frombytes('L', size, b''.join(rows[y % 4] for y in range(h)))
 
-def pixel_64k1(buf, r, g, b):
-    buf.append(((0x1f & r)<<3)|((0x3f & g)>>3))
-    buf.append(((0x7 & g)<<5)|(0x1f & b))
+# palette of the levels of bits, the padding entries are level 0
+def _gray_palette(bits):
+    n = 1 << bits
+    levels = [round(i * 255 / (n - 1)) for i in range(n)]
+    pal = Image.new('P', (1, 1))
+    pal.putpalette(b''.join(bytes((v, v, v)) for v in levels + [0] * (256 - n)))
+    return pal, [i if i < n else 0 for i in range(256)]
 
-buf = array.array('B')
-buf.append(width)
-buf.append(height)
+# a band (L) to the values of bits (0 .. 2**bits-1)
+def quantize(band, bits, dither, bayer=None):
+    shift = 8 - bits
+    if dither == 'ordered':
+        band = ImageChops.add(band, bayer[bits])
+    elif dither == 'fs':
+        pal, lut = _gray_palette(bits)
+        # quantize maps the values of L as they are, so as RGB gray
+        band = band.convert('RGB').quantize(palette=pal,
+                                            dither=Image.Dither.FLOYDSTEINBERG)
+        return Image.frombytes('L', band.size, band.tobytes()).point(lut)
+    return band.point(lambda v: v >> shift)
 
-for y in xrange(height):
-    for x in xrange(width):
-        px = org.getpixel((x, y))
-        pixel_64k1(buf, *conv_rgb(*px[:3]))
+# the pixels of an image in fmt
+def pack_pixels(img, fmt='65k', dither='none'):
+    img = img.convert('RGB')
+    bits = FORMATS[fmt]
+    bayer = None
+    if dither == 'ordered':
+        bayer = {n: _bayer(img.size, 1 << (8 - n)) for n in set(bits)}
+    r, g, b = (quantize(band, n, dither, bayer)
+               for band, n in zip(img.split(), bits))
+    if fmt == '65k':
+        # RRRRRGGG GGGBBBBB
+        hi = ImageChops.add(r.point(lambda v: (v << 3) & 0xff),
+                            g.point(lambda v: v >> 3))
+        lo = ImageChops.add(g.point(lambda v: (v << 5) & 0xff), b)
+        return Image.merge('LA', (hi, lo)).tobytes()
+    # RRRGGGBB
+    return ImageChops.add(ImageChops.add(r.point(lambda v: v << 5),
+                                         g.point(lambda v: v << 2)),
+                          b).tobytes()
 
-with open(sys.argv[2], 'wb') as f:
-    f.write(buf)
+# the image file of an image
+def convert(img, fmt='65k', dither='none'):
+    w, h = img.size
+    if w > 255 or h > 255:
+        raise ValueError('%dx%d is too large for the image file' % (w, h))
+    return bytes((w, h)) + pack_pixels(img, fmt, dither)
+
+def convert_file(src, dst, fmt='65k', dither='none', size=PANEL_SIZE):
+    img = Image.open(src)
+    if size:
+        img = fit(img, size)
+    data = convert(img, fmt, dither)
+    with open(dst, 'wb') as f:
+        f.write(data)
+    return img.size
+
+# images of a directory: src_dir/X.png -> dst_dir/X-65k.img
+def convert_dir(src_dir, dst_dir, fmt='65k', dither='none', size=PANEL_SIZE):
+    os.makedirs(dst_dir, exist_ok=True)
+    done = []
+    for name in sorted(os.listdir(src_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in SUFFIXES:
+            continue
+        dst = os.path.join(dst_dir, '%s-%s.img' % (stem, fmt))
+        done.append((name, convert_file(os.path.join(src_dir, name), dst,
+                                        fmt, dither, size)))
+    return done
+
+def _size(s):
+    w, h = s.lower().split('x')
+    return (int(w), int(h))
+
+def main():
+    parser = argparse.ArgumentParser(description='convert images to display.Image files')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS), default='65k')
+    parser.add_argument('-d', '--dither', choices=DITHERS, default='none')
+    parser.add_argument('-s', '--size', type=_size, default=PANEL_SIZE,
+                        help='WxH to fit larger images in (default 96x64)')
+    parser.add_argument('--no-resize', dest='size', action='store_const', const=None)
+    parser.add_argument('input', help='image file or directory')
+    parser.add_argument('output', nargs='?',
+                        help='image file or directory (default: by the input)')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        done = convert_dir(args.input, args.output or args.input,
+                           args.format, args.dither, args.size)
+        for name, (w, h) in done:
+            print('%s: %dx%d' % (name, w, h))
+        return
+    output = args.output
+    if output is None:
+        output = '%s-%s.img' % (os.path.splitext(args.input)[0], args.format)
+    try:
+        w, h = convert_file(args.input, output, args.format, args.dither, args.size)
+    except ValueError as e:
+        parser.error('%s: %s' % (args.input, e))
+    print('size WxH:', w, h)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+
+# Host emulator of the SSD1331 panel for the drivers of upy/lib. It is the
+# device of the SPI of fakemachine: the writes with D/C low are decoded as
+# commands (address window, draw line/rectangle, copy, clear, fill, remap,
+# start line, display modes) and the ones with D/C high are pixels written
+# at the address pointer, into a 96x64 GDDRAM of RGB565. snapshot() is what
+# the glass shows (remap mirrors, start line, display on/off and modes),
+# write_png() dumps it. The traffic is counted with a modelled bus time:
+# the bits at the SPI clock (6 MHz of ssd1331.vspi) and write_us for each
+# write (the MicroPython call, CS and D/C on the device). A pulse of RST
+# resets the registers (seen at the next write).
+#
+#   import ssd1331emu
+#   panel = ssd1331emu.install()	# fakemachine as machine, and the panel
+#   import ssd1331
+#   disp = ssd1331.Adaptor(ssd1331.vspi(), gcf=True)
+#   disp.gcf_put(0, 0, 'Hello')
+#   panel.write_png('hello.png', scale=4)
+#   print(panel.stats())
+#
+# Not emulated: the continuous scroll (27h, 2Fh, recorded only), dim mode,
+# the display offset, the COM split and the timing of the drawing commands.
+# The colors of the drawing commands are taken as C=R, B=G, A=B, as the
+# driver sends them, and BGR order is ignored (both swap the same way).
+
+import os
+import struct
+import sys
+import zlib
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fakemachine
+
+WIDTH = 96
+HEIGHT = 64
+WRITE_US = 50.0			# modelled cost of a write on the device
+
+# bytes of the arguments of the commands
+ARGS = {
+    0x15: 2, 0x75: 2,				# column, row address
+    0x21: 7, 0x22: 10, 0x23: 6, 0x24: 4,	# line, rectangle, copy, dim
+    0x25: 4, 0x26: 1, 0x27: 5,			# clear, fill, scrolling
+    0x2e: 0, 0x2f: 0,				# deactivate, activate scroll
+    0x81: 1, 0x82: 1, 0x83: 1, 0x87: 1,		# contrast, master current
+    0x8a: 1, 0x8b: 1, 0x8c: 1,			# second precharge
+    0xa0: 1, 0xa1: 1, 0xa2: 1,			# remap, start line, offset
+    0xa4: 0, 0xa5: 0, 0xa6: 0, 0xa7: 0,		# display modes
+    0xa8: 1, 0xab: 5, 0xad: 1,			# multiplex, dim, master config
+    0xac: 0, 0xae: 0, 0xaf: 0,			# dim, off, on
+    0xb0: 1, 0xb1: 1, 0xb3: 1, 0xb8: 32,	# power save, phases, clock, gray
+    0xb9: 0, 0xbb: 1, 0xbe: 1, 0xfd: 1,		# linear gray, precharge, Vcomh, lock
+}
+
+def rgb565(r, g, b):
+    return (r << 11) | (g << 5) | b
+
+# 6 bit color of a drawing command
+def _command_color(c, b, a):
+    return rgb565(c >> 1, b, a >> 1)
+
+def png_bytes(width, height, rows):
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
+
+class Panel(object):
+
+    def __init__(self, pin_cs=None, pin_dc=None, pin_rst=None, write_us=WRITE_US):
+        from config.ssd1331 import config
+        self.pin_cs = config.pin_cs if pin_cs is None else pin_cs
+        self.pin_dc = config.pin_dc if pin_dc is None else pin_dc
+        self.pin_rst = config.pin_rst if pin_rst is None else pin_rst
+        self.write_us = write_us
+        self._rst = (None, 0)		# the RST pin and its falls seen
+        self.reset()
+        self.reset_counts()
+
+    # the state after a reset, the GDDRAM is kept as the chip does
+    def reset(self):
+        self.ram = getattr(self, 'ram', None) or [0] * (WIDTH * HEIGHT)
+        self.window = (0, 0, WIDTH - 1, HEIGHT - 1)
+        self._col = 0
+        self._row = 0
+        self._cmd = bytearray()
+        self._pixel = bytearray()
+        self.remap = 0x40
+        self.start_line = 0
+        self.offset = 0
+        self.mode = 0xa4
+        self.on = False
+        self.fill = False
+        self.reverse_copy = False
+        self.scrolling = False
+
+    def reset_counts(self):
+        self.writes = 0
+        self.bytes = 0
+        self.bus_us = 0.0
+        self.commands = {}		# command: times
+        self.pixels = 0
+        self.unselected = 0		# writes with CS high, lost
+        self._cs_falls = self._falls()
+
+    def _falls(self):
+        cs = fakemachine.pins.get(self.pin_cs)
+        return cs.falls if cs else 0
+
+    @property
+    def cs_windows(self):
+        return self._falls() - self._cs_falls
+
+    def stats(self):
+        return {'writes': self.writes, 'bytes': self.bytes,
+                'cs windows': self.cs_windows, 'bus ms': self.bus_us / 1000.0,
+                'pixels': self.pixels, 'commands': sum(self.commands.values())}
+
+    # SPI
+
+    def receive(self, bus, buf):
+        rst = fakemachine.pins.get(self.pin_rst)
+        if rst and (rst, rst.falls) != self._rst:	# pulsed since
+            self._rst = (rst, rst.falls)
+            self.reset()
+        self.writes += 1
+        self.bytes += len(buf)
+        self.bus_us += len(buf) * 8e6 / bus.baudrate + self.write_us
+        if fakemachine.pins[self.pin_cs].value():
+            self.unselected += 1
+            return
+        if fakemachine.pins[self.pin_dc].value():
+            self._data(bytes(buf))
+        else:
+            for b in bytes(buf):
+                self._command_byte(b)
+
+    def _command_byte(self, b):
+        cmd = self._cmd
+        cmd.append(b)
+        if len(cmd) == ARGS.get(cmd[0], 0) + 1:
+            self._cmd = bytearray()
+            self.commands[cmd[0]] = self.commands.get(cmd[0], 0) + 1
+            self._execute(cmd[0], cmd[1:])
+
+    def _data(self, data):
+        fmt = self.remap >> 6
+        size = (1, 2, 3)[fmt] if fmt < 3 else 2
+        data = bytes(self._pixel) + data
+        n = len(data) - len(data) % size
+        self._pixel = bytearray(data[n:])
+        for i in range(0, n, size):
+            if size == 2:
+                v = (data[i] << 8) | data[i+1]
+            elif size == 1:
+                p = data[i]
+                r, g, b = p >> 5, (p >> 2) & 7, p & 3
+                v = rgb565((r << 2) | (r >> 1), (g << 3) | g,
+                           (b << 3) | (b << 1) | (b >> 1))
+            else:
+                v = rgb565(data[i] >> 1, data[i+1], data[i+2] >> 1)
+            self._put(v)
+        self.pixels += n // size
+
+    # a pixel at the address pointer, which moves in the window
+    def _put(self, v):
+        c0, r0, c1, r1 = self.window
+        col, row = self._col, self._row
+        if col < WIDTH and row < HEIGHT:
+            self.ram[row * WIDTH + col] = v
+        if self.remap & 0x01:			# vertical address increment
+            row += 1
+            if row > r1:
+                row = r0
+                col = col + 1 if col < c1 else c0
+        else:
+            col += 1
+            if col > c1:
+                col = c0
+                row = row + 1 if row < r1 else r0
+        self._col, self._row = col, row
+
+    # commands
+
+    def _execute(self, cmd, a):
+        if cmd == 0x15:
+            self.window = (a[0], self.window[1], a[1], self.window[3])
+            self._col = a[0]
+        elif cmd == 0x75:
+            self.window = (self.window[0], a[0], self.window[2], a[1])
+            self._row = a[0]
+        elif cmd == 0x21:
+            self.line(a[0], a[1], a[2], a[3], _command_color(*a[4:7]))
+        elif cmd == 0x22:
+            self.rectangle(a[0], a[1], a[2], a[3], _command_color(*a[4:7]),
+                           _command_color(*a[7:10]) if self.fill else None)
+        elif cmd == 0x23:
+            self.copy(*a)
+        elif cmd == 0x25:
+            self.rectangle(a[0], a[1], a[2], a[3], 0, 0)
+        elif cmd == 0x26:
+            self.fill = bool(a[0] & 0x01)
+            self.reverse_copy = bool(a[0] & 0x10)
+        elif cmd in (0x2e, 0x2f):
+            self.scrolling = cmd == 0x2f
+        elif cmd == 0xa0:
+            self.remap = a[0]
+            self._pixel = bytearray()
+        elif cmd == 0xa1:
+            self.start_line = a[0] % HEIGHT
+        elif cmd == 0xa2:
+            self.offset = a[0] % HEIGHT
+        elif 0xa4 <= cmd <= 0xa7:
+            self.mode = cmd
+        elif cmd in (0xae, 0xaf):
+            self.on = cmd == 0xaf
+
+    def _set(self, col, row, v):
+        if 0 <= col < WIDTH and 0 <= row < HEIGHT:
+            self.ram[row * WIDTH + col] = v
+
+    def line(self, c0, r0, c1, r1, v):
+        dc = abs(c1 - c0)
+        dr = -abs(r1 - r0)
+        sc = 1 if c0 < c1 else -1
+        sr = 1 if r0 < r1 else -1
+        err = dc + dr
+        while True:
+            self._set(c0, r0, v)
+            if c0 == c1 and r0 == r1:
+                return
+            e2 = 2 * err
+            if e2 >= dr:
+                err += dr
+                c0 += sc
+            if e2 <= dc:
+                err += dc
+                r0 += sr
+
+    def rectangle(self, c0, r0, c1, r1, line, fill):
+        c0, c1 = min(c0, c1), min(max(c0, c1), WIDTH - 1)
+        r0, r1 = min(r0, r1), min(max(r0, r1), HEIGHT - 1)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                if r in (r0, r1) or c in (c0, c1):
+                    self._set(c, r, line)
+                elif fill is not None:
+                    self._set(c, r, fill)
+
+    def copy(self, c0, r0, c1, r1, nc, nr):
+        ram = self.ram
+        src = [(r, c, ram[r * WIDTH + c]) for r in range(r0, min(r1, HEIGHT - 1) + 1)
+               for c in range(c0, min(c1, WIDTH - 1) + 1)]
+        for r, c, v in src:
+            self._set(nc + c - c0, nr + r - r0, v ^ 0xffff if self.reverse_copy else v)
+
+    # what the glass shows: rows of RGB bytes
+    def snapshot(self):
+        rows = []
+        for y in range(HEIGHT):
+            row = bytearray()
+            com = HEIGHT - 1 - y if self.remap & 0x10 else y
+            ram_row = (com + self.start_line) % HEIGHT
+            for x in range(WIDTH):
+                col = WIDTH - 1 - x if self.remap & 0x02 else x
+                v = self.ram[ram_row * WIDTH + col]
+                if not self.on or self.mode == 0xa6:
+                    v = 0
+                elif self.mode == 0xa5:
+                    v = 0xffff
+                elif self.mode == 0xa7:
+                    v ^= 0xffff
+                r, g, b = v >> 11, (v >> 5) & 0x3f, v & 0x1f
+                row += bytes(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)))
+            rows.append(bytes(row))
+        return rows
+
+    def write_png(self, path, scale=1):
+        rows = self.snapshot()
+        if scale > 1:
+            rows = [bytes(v for i in range(0, len(row), 3) for _ in range(scale)
+                          for v in row[i:i+3])
+                    for row in rows for _ in range(scale)]
+        with open(path, 'wb') as f:
+            f.write(png_bytes(WIDTH * scale, HEIGHT * scale, rows))
+
+# fakemachine as machine, and a panel on its SPI
+def install(write_us=WRITE_US):
+    fakemachine.install()
+    top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    for path in ('upy/lib', 'upy'):
+        path = os.path.join(top, path)
+        if path not in sys.path:
+            sys.path.append(path)
+    panel = Panel(write_us=write_us)
+    fakemachine.attach(panel)
+    return panel
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# Load generator for vsrfsd. Each simulated device has its own UDP port and
+# repeats the requests of an import: stat probing, listdir_stat, and
+# f_open/f_read/f_close of a module. Requests/second and latency are
+# reported. Without --addr, a vsrfsd on loopback is started in a child
+# process for each worker count of --workers (0: served on the poll thread),
+# optionally with a delay in f_read emulating slow storage.
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+
+import mipc
+
+N_MODULES = 20
+
+def make_root(root):
+    os.mkdir(os.path.join(root, 'lib'))
+    for i in range(N_MODULES):
+        with open(os.path.join(root, 'lib', 'mod%d.py' % i), 'w') as f:
+            for j in range(40):
+                f.write('def func%d(x):\n    return x * %d\n\n' % (j, j))
+
+def serve(addr, root, workers, delay):
+    import vsrfsd
+    if delay:
+        f_read = vsrfsd.VSRfsService.f_read
+        def slow_f_read(self, port, msg):
+            time.sleep(delay)
+            f_read(self, port, msg)
+        vsrfsd.VSRfsService.f_read = slow_f_read
+    vsrfsd.main(addr, root, workers=workers)
+
+def device(addr, deadline, latencies):
+    port = mipc.udp_client(addr)
+    unit = mipc.UDPDumpPackerBase.MAXLEN - 64
+
+    def call(name, *args):
+        tv = time.time()
+        ret = getattr(port, name)(*args)
+        latencies.append(time.time() - tv)
+        return ret
+
+    while time.time() < deadline:
+        name = 'mod%d' % random.randrange(N_MODULES)
+        call('stat', '/' + name)
+        call('stat', '/' + name + '.py')
+        call('listdir_stat', '/lib', 0, None)
+        oh, _ = call('f_open', '/lib/' + name + '.py', 'r')
+        pos = 0
+        while True:
+            pos, data = call('f_read', oh, pos, unit)
+            if len(data) < unit:
+                break
+        call('f_close', oh)
+    port.close()
+
+def run(addr, devices, duration):
+    deadline = time.time() + duration
+    results = [[] for _ in range(devices)]
+    threads = [threading.Thread(target=device, args=(addr, deadline, results[i]))
+               for i in range(devices)]
+    tv = time.time()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    tv = time.time() - tv
+    latencies = sorted(t for r in results for t in r)
+    n = len(latencies)
+    return n, n / tv, latencies[n // 2] * 1000, latencies[n * 99 // 100] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='vsrfsd load generator')
+    parser.add_argument('--addr', help='host:port of a running vsrfsd')
+    parser.add_argument('--devices', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--workers', default='0,4', help='e.g. 0,4')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='seconds added to f_read')
+    args = parser.parse_args()
+
+    print('%8s %8s %10s %10s %10s %10s' % (
+        'workers', 'devices', 'requests', 'req/s', 'p50 ms', 'p99 ms'))
+    if args.addr:
+        host, port = args.addr.split(':')
+        n, rate, p50, p99 = run((host, int(port)), args.devices, args.duration)
+        print('%8s %8d %10d %10.0f %10.2f %10.2f' % (
+            '-', args.devices, n, rate, p50, p99))
+        return
+
+    root = tempfile.mkdtemp()
+    make_root(root)
+    ctx = multiprocessing.get_context('spawn')
+    for workers in [int(w) for w in args.workers.split(',')]:
+        addr = ('127.0.0.1', random.randint(20000, 40000))
+        server = ctx.Process(target=serve, args=(addr, root, workers, args.delay))
+        server.start()
+        time.sleep(1.0)
+        try:
+            n, rate, p50, p99 = run(addr, args.devices, args.duration)
+        finally:
+            server.terminate()
+            server.join()
+        print('%8d %8d %10d %10.0f %10.2f %10.2f' % (
+            workers, args.devices, n, rate, p50, p99))
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,181 @@
-#!/bin/python
-# -*- coding: utf-8 -*-
+#!/usr/bin/python3
 
+import errno
 import functools
+import hashlib
+import itertools
 import os
+import shlex
 import stat
+import subprocess
 import sys
+import threading
 import time
-from tpp import mipc
-from tpp import toolbox as tb
-from tpp import threadutil as tu
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../upy/lib'))
+import mipc
 
 if os.getenv('DEBUG'):
     def debug(f):
         @functools.wraps(f)
         def _f(*args, **kwargs):
-            print f.__name__, args, kwargs, '...'
+            print(f.__name__, args, kwargs, '...')
             r = f(*args, **kwargs)
-            print f.__name__, '->', r
+            print(f.__name__, '->', r)
             return r
         return _f
 else:
     def debug(f):
         return f
 
+# listdir_stat reply: data size of entries and estimated size of an entry
+# except the name (JSON is larger than msgpack).
+_LISTDIR_ROOM = mipc.UDPDumpPackerBase.MAXLEN - 64
+_ENTRY_OVERHEAD = 48
+
+# Data of these files is already compressed, so it is sent as memoryview
+# which mipc does not try to compress.
+_STORED_SUFFIXES = ('.gz', '.zip', '.png', '.jpg', '.jpeg')
+
+# file type bits of MicroPython stat
+def _mode(s):
+    if stat.S_ISREG(s.st_mode):
+        return 0x8000
+    elif stat.S_ISDIR(s.st_mode):
+        return 0x4000
+    return 0
+
+# Table of open files and directory iterators, sharded by the handle so
+# that requests on different handles don't contend for one lock. A handle
+# is used by one client, whose requests are handled in order (per peer on
+# workers of mipc.manager).
+class _HandleTable(object):
+
+    def __init__(self, n_shards=16):
+        self._shards = [(threading.Lock(), {}) for _ in range(n_shards)]
+        self._next = functools.partial(next, itertools.count(1))
+
+    def _shard(self, oh):
+        return self._shards[oh % len(self._shards)]
+
+    def add(self, obj):
+        oh = self._next()
+        lock, objs = self._shard(oh)
+        with lock:
+            objs[oh] = obj
+        return oh
+
+    # An unknown handle (closed, or of a restarted server) raises EBADF, which
+    # the client gets as a RemoteHandlerError.
+    def get(self, oh):
+        lock, objs = self._shard(oh)
+        with lock:
+            obj = objs.get(oh)
+        if obj is None:
+            raise OSError(errno.EBADF, 'bad handle %r' % (oh,))
+        return obj
+
+    def pop(self, oh):
+        lock, objs = self._shard(oh)
+        with lock:
+            return objs.pop(oh, None)
+
+# .mpy files compiled from .py files by mpy-cross, or a stand-in taking the
+# same arguments (-s source_name -o output source). A compiled file is
+# kept in cache_dir with the mtime of its source, and rebuilt when the
+# source has another mtime.
+class _MpyCompiler(object):
+
+    def __init__(self, command, cache_dir):
+        self._command = shlex.split(command)
+        self._dir = cache_dir
+        self._lock = threading.Lock()
+        self._failed = {}		# source: mtime which failed to compile
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _out(self, src):
+        return os.path.join(self._dir, hashlib.sha1(src.encode()).hexdigest() + '.mpy')
+
+    # path of the .mpy compiled from src if it's up to date, without compiling
+    def cached(self, src):
+        out = self._out(src)
+        try:
+            if os.stat(out).st_mtime_ns == os.stat(src).st_mtime_ns:
+                return out
+        except OSError:
+            pass
+        return None
+
+    # True if src of this mtime failed to compile
+    def failed(self, src):
+        try:
+            return self._failed.get(src) == os.stat(src).st_mtime_ns
+        except OSError:
+            return False
+
+    # path of the .mpy compiled from src, or None if src can't be compiled
+    def compile(self, src, name):
+        try:
+            s = os.stat(src)
+        except OSError:
+            return None
+        out = self._out(src)
+        with self._lock:
+            try:
+                if os.stat(out).st_mtime_ns == s.st_mtime_ns:
+                    return out
+            except OSError:
+                pass
+            if self._failed.get(src) == s.st_mtime_ns:
+                return None
+            tmp = out + '.tmp'
+            r = subprocess.run(self._command + ['-s', name, '-o', tmp, src],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if r.returncode:
+                print('mpy-cross %s failed:' % name, r.stdout.decode(errors='replace'))
+                self._failed[src] = s.st_mtime_ns
+                return None
+            os.utime(tmp, ns=(s.st_atime_ns, s.st_mtime_ns))
+            os.replace(tmp, out)
+        return out
+
+@mipc.autoreply
 class VSRfsService(mipc.ServiceBase):
 
-    def __init__(self, root_dir):
+    # With mpy (_MpyCompiler), each X.py without X.mpy beside it has a
+    # read-only X.mpy compiled from it.
+    def __init__(self, root_dir, mpy=None):
         self._root = os.path.abspath(os.path.expanduser(root_dir))
         self._root_len = len(self._root)
         if not os.path.isdir(self._root):
             raise Exception('%s is not directory.' % root_dir)
-        self._obj_lock = tu.Lock()
-        self._objs = {}
-        self._oh = tb.Counter()
+        self._objs = _HandleTable()
+        self._mpy = mpy
+
+    # source of path if it's a .mpy compiled from a .py, or None
+    def _mpy_source(self, path):
+        if self._mpy and path.endswith('.mpy') and not os.path.exists(path):
+            src = path[:-4] + '.py'
+            if os.path.isfile(src):
+                return src
+        return None
+
+    # path of the file to be read for path, which is a compiled file for a
+    # .mpy of a .py (compiled here if it's not yet)
+    def _readable(self, path):
+        src = self._mpy_source(path)
+        if src:
+            return self._mpy.compile(src, src[self._root_len + 1:]) or path
+        return path
+
+    # path of the file listed for path: a .mpy of a .py is the compiled file
+    # if it's up to date, or the .py (same mtime, its size until compiled by
+    # stat or f_open), so that a listing runs no compiler. A .py which
+    # failed to compile has no .mpy.
+    def _listed(self, path):
+        src = self._mpy_source(path)
+        if src and not self._mpy.failed(src):
+            return self._mpy.cached(src) or src
+        return path
 
     def _fullpath(self, in_path):
         if in_path[0] == '/':
@@ -41,6 +184,7 @@ class VSRfsService(mipc.ServiceBase):
             return os.path.abspath(self._root + os.path.sep + in_path)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def check_chdir(self, in_path):
         path = self._fullpath(in_path)
@@ -49,50 +193,83 @@ class VSRfsService(mipc.ServiceBase):
         raise Exception('%s is not directory.' % in_path)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def ilistdir(self, in_path):
-        oh = self._oh()
         path = self._fullpath(in_path)
         it = iter(os.listdir(path))
-        with self._obj_lock:
-            self._objs[oh] = (path, it)
-        return oh
+        return self._objs.add((path, it))
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def ilistdir_next(self, oh):
-        with self._obj_lock:
-            path, it = self._objs[oh]
+        path, it = self._objs.get(oh)
         try:
-            f = it.next()
+            f = next(it)
         except StopIteration:
-            del self._objs[oh]
+            self._objs.pop(oh)
             return None
         except:
-            del self._objs[oh]
+            self._objs.pop(oh)
             raise
         s = os.stat(path + os.sep + f)
-        if stat.S_ISREG(s.st_mode):
-            mode = 0x8000
-        elif stat.S_ISDIR(s.st_mode):
-            mode = 0x4000
-        else:
-            mode = 0
-        return (f, mode, s.st_ino, s.st_size)
+        return (f, _mode(s), s.st_ino, s.st_size)
 
+    # Entries of directory path with stat data, sorted by name, and their
+    # version: a hash of the names, sizes and mtimes, so that it changes
+    # when a file is written in place as well as when the directory is.
+    def _scan(self, path):
+        names = os.listdir(path)
+        if self._mpy:
+            have = set(names)
+            names += [f[:-3] + '.mpy' for f in names
+                      if f.endswith('.py') and f[:-3] + '.mpy' not in have]
+        entries = []
+        h = hashlib.sha1()
+        for f in sorted(names):
+            try:
+                s = os.stat(self._listed(path + os.sep + f))
+            except OSError:
+                continue
+            entries.append((f, _mode(s), s.st_ino, s.st_size, int(s.st_mtime)))
+            h.update(('%s/%d/%d/' % (f, s.st_size, s.st_mtime_ns)).encode('utf-8'))
+        return int.from_bytes(h.digest()[:4], 'little') & 0x3fffffff, entries
+
+    # Entries of a directory with stat data, as many as fit in a datagram:
+    # (version, [(name, mode, ino, size, mtime), ...], next start or None).
+    # When the caller's version is still current, (version, None, None) is
+    # returned.
     @mipc.autoreply
+    @mipc.worker
+    @debug
+    def listdir_stat(self, in_path, start=0, version=None):
+        cur, entries = self._scan(self._fullpath(in_path))
+        if version == cur:
+            return (cur, None, None)
+        room = _LISTDIR_ROOM
+        for i in range(start, len(entries)):
+            room -= len(entries[i][0].encode('utf-8')) + _ENTRY_OVERHEAD
+            if room < 0 and i > start:
+                return (cur, entries[start:i], i)
+        return (cur, entries[start:], None)
+
+    @mipc.autoreply
+    @mipc.worker
     @debug
     def mkdir(self, in_path):
         path = self._fullpath(in_path)
         os.mkdir(path)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def remove(self, in_path):
         path = self._fullpath(in_path)
         os.remove(path)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def rename(self, in_path1, in_path2):
         path1 = self._fullpath(in_path1)
@@ -100,29 +277,26 @@ class VSRfsService(mipc.ServiceBase):
         os.rename(path1, path2)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def rmdir(self, in_path):
         path = self._fullpath(in_path)
         os.rmdir(path)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def stat(self, in_path):
         path = self._fullpath(in_path)
         try:
-            s = os.stat(path)
+            s = os.stat(self._readable(path))
         except OSError as e:
             return (0,)*10 
-        if stat.S_ISREG(s.st_mode):
-            mode = 0x8000
-        elif stat.S_ISDIR(s.st_mode):
-            mode = 0x4000
-        else:
-            mode = 0
-        return (mode, s.st_ino, s.st_dev, s.st_nlink, s.st_uid, s.st_gid,
+        return (_mode(s), s.st_ino, s.st_dev, s.st_nlink, s.st_uid, s.st_gid,
                 s.st_size, s.st_atime, s.st_mtime, s.st_ctime)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def statvfs(self, in_path):
         path = self._fullpath(in_path)
@@ -131,95 +305,115 @@ class VSRfsService(mipc.ServiceBase):
                 s.f_files, s.f_ffree, s.f_favail, s.f_flag, s.f_namemax)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_open(self, in_path, mode='r'):
         path = self._fullpath(in_path)
-        fobj = open(path, mode)
-        oh = self._oh()
-        with self._obj_lock:
-            self._objs[oh] = fobj
+        if 'b' not in mode:
+            mode += 'b'		# positions are byte offsets, data is bytes
+        if mode == 'rb':
+            fobj = open(self._readable(path), mode)
+        else:
+            fobj = open(path, mode)
+        oh = self._objs.add(fobj)
         return (oh, path[self._root_len:])
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_read(self, oh, pos, size):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return (None, None)
-            f = self._objs[oh]
+        f = self._objs.get(oh)
         f.seek(pos)
         data = f.read(size)
         pos = f.tell()
+        if f.name.endswith(_STORED_SUFFIXES):
+            data = memoryview(data)
         return (pos, data)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_readline(self, oh, pos, size):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return (None, None)
-            f = self._objs[oh]
+        f = self._objs.get(oh)
         f.seek(pos)
         data = f.readline()
         pos = f.tell()
         return (pos, data)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_write(self, oh, pos, data):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return None
-            f = self._objs[oh]
+        f = self._objs.get(oh)
         f.seek(pos)
         n = f.write(data)
         pos = f.tell()
         return (pos, n)
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_seek(self, oh, offset, whence=os.SEEK_SET):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return None
-            f = self._objs[oh]
+        f = self._objs.get(oh)
         f.seek(offset, whence)
         pos = f.tell()
         return pos
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_flush(self, oh):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return None
-            f = self._objs[oh]
+        f = self._objs.get(oh)
         f.flush()
         pos = f.tell()
         return pos
 
     @mipc.autoreply
+    @mipc.worker
     @debug
     def f_close(self, oh):
-        with self._obj_lock:
-            if oh not in self._objs:
-                return None
-            f = self._objs[oh]
-            del self._objs[oh]
+        f = self._objs.pop(oh)
+        if f is not None:
             f.close()
 
-def main(addr, root_dir, foreground=True):
-    port = mipc.udp_server(addr)
-    mipc.manager.register(port, VSRfsService(root_dir))
+def main(addr, root_dir, foreground=True, workers=4, reliable=False,
+         mpy_cross=None, mpy_cache=None):
+    mpy = None
+    if mpy_cross:
+        mpy_cache = mpy_cache or os.path.expanduser('~/.cache/vsrfsd/mpy')
+        mpy = _MpyCompiler(mpy_cross, mpy_cache)
+    if workers:
+        mipc.manager.start_workers(workers)
+    if reliable:
+        import rudp
+        port = rudp.server(addr)
+    else:
+        port = mipc.udp_server(addr)
+    mipc.manager.register(port, VSRfsService(root_dir, mpy))
     if foreground:
-        time.sleep(-1)
+        while True:
+            time.sleep(3600)
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print 'Usage: vsrfsd [host]:port root_dir'
+    args = sys.argv[1:]
+    reliable = False
+    mpy_cross = None
+    while args and args[0] in ('-r', '-m'):
+        if args[0] == '-r':
+            reliable = True
+            args = args[1:]
+        elif len(args) > 1:
+            mpy_cross = args[1]
+            args = args[2:]
+        else:
+            break
+    if len(args) not in (2, 3):
+        print('Usage: vsrfsd [-r] [-m mpy-cross] [host]:port root_dir [workers]')
         exit(1)
-    host, port = sys.argv[1].split(':')
-    root_dir = sys.argv[2]
+    host, port = args[0].split(':')
+    root_dir = args[1]
     if not os.path.isdir(root_dir):
         raise TypeError('%s is not directory.' % root_dir)
-    main((host, int(port)), root_dir)
+    workers = int(args[2]) if len(args) == 3 else 4
+    main((host, int(port)), root_dir, workers=workers, reliable=reliable,
+         mpy_cross=mpy_cross)
@@ -13,12 +13,17 @@ def _boot():
 
         if value == 0:
             print('boot: full mode ...')
-            from boot.full import start
+            import bootprof
+            bootprof.install()
+            with bootprof.step('import boot.full'):
+                from boot.full import start
             try:
-                from main import main
+                with bootprof.step('import main'):
+                    from main import main
             except:
                 main = None
             start(main)
+            bootprof.mark('REPL')
 
         else:
             import time
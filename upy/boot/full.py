@@ -1,14 +1,14 @@
-import os
-import sys
 import _thread
-import ssd1331
-import machine
-import mipc
-import wifi
-import service
+import bootprof
+import lazy
 
 from config.boot_full import config
 
+# imported on the first use, which depends on the configuration and pins
+machine = lazy.module('machine')
+ssd1331 = lazy.module('ssd1331')
+wifi = lazy.module('wifi')
+
         
 def setup_SSD1331():
     driver = ssd1331.vspi()
@@ -19,82 +19,11 @@ def setup_SSD1331():
     return ssd1331.Adaptor(driver, fcf=True, gcf=True)
     
 
-class WifiProgressSSD1331(wifi.WifiProgressBase):
-
-    def __init__(self, disp):
-        self._top_bg = disp.Color(0, 0, 2)
-        self._mode_bg1 = disp.Color(31, 0, 0) 
-        self._mode_bg2 = disp.Color(0, 54, 0)
-        self._ssid_fg1 = disp.Color(25, 50, 0)
-        self._ssid_fg2 = disp.Color(0, 54, 0)
-        self._ip_fg1 = disp.color_white
-
-        self._mode = None
-        self._message = ['' for _ in range(5)]
-        self._ssid = None
-
-        self._text = ssd1331.TextBoard(disp, 0, 26, 95, 63)
-
-        self._disp = disp
-        self._disp_init()
-
-    def _disp_init(self):
-        d = self._disp
-        d.clear()
-        w, _ = d.display_size
-        d.draw_rect(0, 0, w-1, 23, self._top_bg, self._top_bg)
-
-    def _disp_mode(self, mode, fix):
-        d = self._disp
-        fg = self._top_bg
-        bg = self._mode_bg2 if fix else self._mode_bg1
-        d.draw_rect(2, 1, 15, 11, bg, bg)
-        d.gcf_put(3, 2, mode, fg)
-
-    def _disp_ssid(self, ssid, fix):
-        d = self._disp
-        fg = self._ssid_fg2 if fix else self._ssid_fg1
-        d.draw_rect(19, 2, 93, 11, self._top_bg, self._top_bg)
-        d.gcf_put(19, 2, ssid, fg, spacing=1)
-
-    def _disp_ip(self, ip_address):
-        d = self._disp
-        d.draw_rect(1, 13, 95, 22, self._top_bg, self._top_bg)
-        d.gcf_put(2, 13, ip_address, self._ip_fg1, spacing=1)
-
-    def _disp_message(self, msg):
-        self._text.putline(msg)
-
-    def init_station_mode(self):
-        self._mode = 'ST'
-
-    def init_ap_mode(self):
-        d = self._disp
-        d.draw_rect(19, 2, 93, 11, self._top_bg, self._top_bg)
-        self._mode = 'AP'
-
-    def actived(self):
-        self._disp_mode(self._mode, False)
-
-    def scanning(self):		# STA mode
-        self._disp_message('Scanning ...')
-
-    def connecting(self, ssid):	# STA mode
-        self._ssid = ssid
-        self._disp_ssid(ssid, False)
-        self._disp_message('Connecting ...')
-
-    def ip_address(self, ip_address):
-        self._disp_ssid(self._ssid, True)
-        self._disp_mode(self._mode, True)
-        self._disp_ip(ip_address)
-        self._disp_message('Ready !!')
-
-
 def setup_Wifi(disp_ssd1331=None):
     progress = wifi.WifiProgressBase()
     if config.progress_ssd1331 and disp_ssd1331:
         try:
+            from boot.progress_ssd1331 import WifiProgressSSD1331
             progress = WifiProgressSSD1331(disp_ssd1331)
         except:
             pass
@@ -104,20 +33,25 @@ def setup_Wifi(disp_ssd1331=None):
         wlan.start_ap_mode()
     if wlan.ip_address:
         for svcname in config.services:
-            svcmod = __import__('service.'+svcname)
-            mod = getattr(svcmod, svcname)
-            register = getattr(mod, 'register')
-            register()
+            mod = bootprof.imp('service.'+svcname)
+            with bootprof.step('register '+svcname):
+                mod.register()
     
 
 def _start(main_func=None):
-    disp_ssd1331 = setup_SSD1331() if config.ssd1331 else None
+    disp_ssd1331 = None
+    if config.ssd1331:
+        with bootprof.step('setup SSD1331'):
+            disp_ssd1331 = setup_SSD1331()
 
     if config.enable_wifi_pin is not None:
         p = machine.Pin(config.enable_wifi_pin, machine.Pin.IN)
         if p.value() == 0:
-            setup_Wifi(disp_ssd1331)
+            with bootprof.step('setup Wi-Fi'):
+                setup_Wifi(disp_ssd1331)
+            bootprof.mark('Wi-Fi ready')
 
+    bootprof.report()
     if main_func:
         main_func()
 
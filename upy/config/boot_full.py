@@ -5,3 +5,4 @@ config.services = ['admin', 'airterm']
 config.ssd1331 = True
 config.progress_ssd1331 = True
 config.enable_wifi_pin = 36		# PIN Number or None
+config.profile = False			# print import/setup times of the boot (bootprof)
@@ -0,0 +1,7 @@
+from configobj import Config
+
+config = Config()
+config.font_cache = 1024	# bytes of glyphs cached per font, 0: load the whole font
+config.text_line_buffer = False	# TextBoard draws a line at once (putc shows at putline/refresh)
+config.text_hw_scroll = False	# a TextBoard of the whole display scrolls by the start line
+config.text_refresh_ms = 50	# lines put within it after a refresh wait for the next putline/refresh
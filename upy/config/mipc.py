@@ -0,0 +1,6 @@
+from configobj import Config
+
+config = Config()
+config.workers = 0			# worker threads for @mipc.worker handlers (0: poll thread)
+config.worker_queue = 4			# jobs queued per worker
+config.deflate_min = 256		# compress bytes of this size or more (0: never)
@@ -7,5 +7,7 @@ config.color_format = 1		# 0:256, 1:65k1, 2:65k2
 config.pin_dc = 4
 config.pin_rst = 15
 config.pin_cs = 5
+config.framebuffer = False	# draw in RAM and send the changes by flush()
+config.batch = True		# queue the commands of a drawing in a CS low window
 config.pin_sw = None
 #config.pin_sw = 36
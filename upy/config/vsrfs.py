@@ -0,0 +1,12 @@
+from configobj import Config
+
+config = Config()
+config.block_size = 1024		# cached block size, 0: no cache
+config.readahead = 2			# blocks read ahead on sequential read
+config.cache_size = 8192		# bytes of cached blocks per mount
+config.window = 4			# f_read requests in flight
+config.stat_ttl = 2			# seconds a directory listing is used, 0: no cache
+config.ports = 4			# idle ports kept for files
+config.reliable = False			# rudp port (vsrfsd -r)
+config.prefer_mpy = True		# import X.mpy rather than X.py (vsrfsd -m)
+config.mpy_cache = None			# local directory of fetched .mpy, e.g. '/mpy'
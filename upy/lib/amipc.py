@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# Coroutine based service manager for mipc services.
+#
+# It serves the same ServiceBase services as mipc.manager on an event loop
+# (uasyncio on MicroPython, asyncio on CPython) instead of the poll thread.
+# Sockets are non-blocking and a frame is assembled from partial reads, so
+# idle connections cost no thread stack. An autoreply handler may be a
+# coroutine (async def) which awaits I/O; its reply is sent when it finished.
+# Each port is served by a single coroutine which handles its requests one
+# at a time in order: the next message is not read before the handler (and
+# a scheduled coroutine of it) finished and the reply is sent, so a slow
+# handler holds back its own port but not the others.
+#
+#   import amipc
+#   manager = amipc.AsyncServiceManager()
+#   manager.register_server(2000, AdminService())
+#   manager.run_forever()
+
+import struct
+
+import mipc
+
+
+#----------------------------------------------------------------------------
+#                        machine dependent functions
+#----------------------------------------------------------------------------
+
+#### event loop
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+if hasattr(asyncio, 'IORead'):		# uasyncio of micropython-lib
+    def _wait_readable(sock):
+        yield asyncio.IORead(sock)
+
+    def _wait_writable(sock):
+        yield asyncio.IOWrite(sock)
+
+elif hasattr(asyncio, 'core'):		# uasyncio v3
+    def _wait_readable(sock):
+        yield asyncio.core._io_queue.queue_read(sock)
+
+    def _wait_writable(sock):
+        yield asyncio.core._io_queue.queue_write(sock)
+
+else:					# CPython
+    async def _wait_io(sock, add, remove):
+        future = asyncio.get_event_loop().create_future()
+        add(sock, future.set_result, None)
+        try:
+            await future
+        finally:
+            remove(sock)
+
+    def _wait_readable(sock):
+        loop = asyncio.get_event_loop()
+        return _wait_io(sock, loop.add_reader, loop.remove_reader)
+
+    def _wait_writable(sock):
+        loop = asyncio.get_event_loop()
+        return _wait_io(sock, loop.add_writer, loop.remove_writer)
+
+def _new_event_loop():
+    if hasattr(asyncio, 'new_event_loop'):
+        return asyncio.new_event_loop()
+    return asyncio.get_event_loop()
+
+
+#----------------------------------------------------------------------------
+#
+#----------------------------------------------------------------------------
+
+class AsyncPort(object):
+    acceptable = False
+    asynchronous = True
+
+    def __init__(self, sock, packer):
+        sock.setblocking(False)
+        self.socket = sock
+        self._packer = packer
+        self._udp = isinstance(packer, mipc.UDPDumpPackerBase)
+        self._rbuf = bytearray()
+        self._out = []
+        self._tasks = []
+        self.registered = True
+        self.peer_inflate = False
+
+    # see mipc.IOPort.set_deflate
+    def set_deflate(self, peer_inflate):
+        self.peer_inflate = peer_inflate
+        self._packer.deflate_min = (mipc.DEFLATE_MIN
+                                    if peer_inflate and mipc._deflate else 0)
+
+    def _parse(self):
+        rbuf = self._rbuf
+        if len(rbuf) < 4:
+            return None
+        n, = struct.unpack_from('<i', rbuf, 0)
+        if len(rbuf) < n + 4:
+            return None
+        data = bytes(rbuf[4:n+4])
+        del rbuf[:n+4]
+        return self._packer.loads(data)
+
+    async def recv(self):
+        sock = self.socket
+        if self._udp:
+            while True:
+                await _wait_readable(sock)
+                try:
+                    return self._packer.unpack(sock)
+                except OSError:
+                    pass			# not ready yet
+        while True:
+            msg = self._parse()
+            if msg is not None:
+                return msg
+            await _wait_readable(sock)
+            try:
+                data = sock.recv(1024)
+            except OSError:
+                continue			# not ready yet
+            if not data:
+                if self._rbuf:
+                    raise mipc.SocketUnexpectedClosed()
+                raise mipc.SocketClosed()
+            self._rbuf.extend(data)
+
+    # Messages are queued and sent by flush on the event loop.
+    def send(self, msg):
+        data, n = self._packer.pack(msg)
+        self._out.append(data)
+        return self
+
+    async def flush(self):
+        sock = self.socket
+        out = self._out
+        while out:
+            data = memoryview(out.pop(0))
+            if self._udp:
+                addr = self._packer.recv_addr
+                if addr:
+                    sock.sendto(data, addr)
+                else:
+                    sock.send(data)
+                continue
+            while data:
+                try:
+                    n = sock.send(data)
+                except OSError:
+                    n = 0
+                if n:
+                    data = data[n:]
+                else:
+                    await _wait_writable(sock)
+
+    def schedule(self, coro):
+        self._tasks.append(coro)
+
+    async def run_scheduled(self):
+        tasks = self._tasks
+        while tasks:
+            await tasks.pop(0)
+            await self.flush()
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+class AsyncServiceManager(object):
+
+    def __init__(self):
+        self.ip_address = '0.0.0.0'
+        self._loop = None
+        self._coros = []
+
+    def _spawn(self, coro):
+        if self._loop:
+            self._loop.create_task(coro)
+        else:
+            self._coros.append(coro)
+
+    def register_server(self, addr, service_object, packer=None):
+        if isinstance(addr, int):
+            addr = (self.ip_address, addr)
+        port = mipc.AcceptablePort(addr, packer=packer)
+        self.register(port, service_object)
+
+    # port is an mipc port: AcceptablePort, IOPort (TCP or UDP) or AsyncPort.
+    def register(self, port, service_object):
+        if port.acceptable:
+            self._spawn(self._serve_acceptable(port, service_object))
+        else:
+            if not port.asynchronous:
+                port = AsyncPort(port.socket, port._packer)
+            self._spawn(self._serve_port(port, service_object))
+
+    # Stop serving port without closing it (e.g. AirtermService).
+    def unregister(self, port):
+        port.registered = False
+
+    async def _serve_acceptable(self, port, service_object):
+        sock = port.socket
+        sock.setblocking(False)
+        while True:
+            await _wait_readable(sock)
+            try:
+                iosock, _ = sock.accept()
+            except OSError:
+                continue			# not ready yet
+            packer = port._packer
+            newport = AsyncPort(iosock, packer() if packer else mipc.MsgPacker())
+            try:
+                svc = service_object(port)
+                svc.on_accepted(newport)
+            except Exception as e:
+                mipc._print_exception(e)
+                newport.close()
+                continue
+            if newport.registered:
+                self._spawn(self._serve_port(newport, svc))
+
+    async def _serve_port(self, port, service_object):
+        on_close = None
+        try:
+            while port.registered:
+                msg = await port.recv()
+                service_object.mipc_received(port, msg)
+                await port.flush()
+                await port.run_scheduled()
+        except mipc.SocketClosed as e:
+            on_close = service_object.on_disconnected
+        except Exception as e:
+            mipc._print_exception(e)
+            on_close = service_object.on_exception
+        if on_close:
+            on_close(port)
+            port.close()
+
+    def run_forever(self):
+        self._loop = _new_event_loop()
+        for coro in self._coros:
+            self._loop.create_task(coro)
+        self._coros = []
+        self._loop.run_forever()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Boot profiler. With profile = True in config/boot_full.py, steps of the
+# boot (imports, setup functions) are recorded with the time since reset,
+# the duration and the heap delta (gc.mem_alloc, it can be negative when a
+# collection runs in the step), and report prints them. A mark after the
+# report (e.g. REPL, as boot.full reports on its thread) prints itself.
+#
+#   with bootprof.step('setup display'):
+#       disp = setup_SSD1331()
+#   mod = bootprof.imp('wifi')
+#   bootprof.mark('REPL')
+#   bootprof.report()
+#
+# Disabled, a step costs a call and a shared do-nothing context.
+
+import gc
+import sys
+import time
+
+from lazy import _import
+
+try:
+    from config.boot_full import config as _config
+except ImportError:
+    from configobj import empty_config as _config
+
+#### milliseconds from reset
+if hasattr(time, 'ticks_ms'):
+    _ticks_ms = time.ticks_ms
+    _ticks_diff = time.ticks_diff
+else:
+    _T0 = time.time()
+
+    def _ticks_ms():
+        return int((time.time() - _T0) * 1000)
+
+    def _ticks_diff(a, b):
+        return a - b
+
+#### allocated heap
+if hasattr(gc, 'mem_alloc'):
+    _mem_alloc = gc.mem_alloc
+else:
+    def _mem_alloc():
+        return 0
+
+enabled = bool(_config.profile)
+_records = []		# [name, start ms, duration ms or None, heap delta]
+_reported = False
+
+class _Step(object):
+
+    def __init__(self, name):
+        self._rec = [name, 0, None, 0]
+
+    def __enter__(self):
+        rec = self._rec
+        _records.append(rec)
+        rec[3] = _mem_alloc()
+        rec[1] = _ticks_ms()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        rec = self._rec
+        rec[2] = _ticks_diff(_ticks_ms(), rec[1])
+        rec[3] = _mem_alloc() - rec[3]
+
+class _NoStep(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_no_step = _NoStep()
+
+def step(name):
+    if enabled:
+        return _Step(name)
+    return _no_step
+
+# import a module (as lazy.importer), recorded unless it's already loaded
+def imp(name):
+    if enabled and name not in sys.modules:
+        with _Step('import ' + name):
+            return _import(name)
+    return _import(name)
+
+# a point of time, e.g. REPL is ready
+def mark(name):
+    if enabled:
+        _records.append([name, _ticks_ms(), None, 0])
+        if _reported:
+            _print(_records[-1])
+
+# record the imports by lazy modules
+def install():
+    import lazy
+    lazy.importer = imp
+
+def _print(rec):
+    name, start, duration, heap = rec
+    if duration is None:
+        print('%8d %8s %8s  %s' % (start, '', '', name))
+    else:
+        print('%8d %8d %8d  %s' % (start, duration, heap, name))
+
+def report():
+    global _reported
+    if not enabled:
+        return
+    _reported = True
+    print('%8s %8s %8s  %s' % ('at ms', 'ms', 'heap', 'step'))
+    for rec in sorted(_records, key=lambda r: r[1]):
+        _print(rec)
@@ -1,5 +1,28 @@
+import _thread
 import array
 import sys
+import time
+
+try:
+    from config.display import config as _config
+except ImportError:
+    from configobj import empty_config as _config
+
+FONT_CACHE = _config.get('font_cache', 1024)
+TEXT_LINE_BUFFER = _config.get('text_line_buffer', False)
+TEXT_HW_SCROLL = _config.get('text_hw_scroll', False)
+TEXT_REFRESH_MS = _config.get('text_refresh_ms', 50)
+
+#### milliseconds (for the refresh of TextBoard)
+if hasattr(time, 'ticks_ms'):
+    _ticks_ms = time.ticks_ms
+    _ticks_diff = time.ticks_diff
+else:
+    def _ticks_ms():
+        return int(time.time() * 1000)
+
+    def _ticks_diff(a, b):
+        return a - b
 
 
 #----------------------------------------------------------------------------
@@ -33,51 +56,285 @@ class Color(object):
 #                               font handling
 #----------------------------------------------------------------------------
 
+# v2 font files (bdffont.py --format 2) hold the glyphs of a sparse set of
+# codes. A header of 8 bytes: 0 (never the width of v1), the version, the
+# kind (F or G), the width, the height, flags and the glyphs (2 bytes), then
+# the codes of the glyphs in order (2 bytes each), the offsets of their
+# records (glyphs+1, 4 bytes each) and the records. A code not in the file is
+# blank. The codes are kept in RAM and binary searched, the offsets are read
+# with the record when the file is streamed.
+V2_HEADER_b = 8
+V2_PACKED = 0x01		# GCF strokes of 2 bytes, a nibble a value
+
+def _find(codes, code):
+    lo = 0
+    hi = len(codes)
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if codes[mid] < code:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < len(codes) and codes[lo] == code:
+        return lo
+    return -1
+
 class _FontBase(object):
 
     FONTDIR = 'fonts/'
     FONTNUM = 128
     PIXELSIZE_b = 2
 
-class FixedColorFont(_FontBase):
-
-    def __init__(self, fontfile='misaki_7x4.fcf'):
-        path = self.FONTDIR + fontfile
-        with open(path, 'rb') as f:
-            wh = array.array('B', (0, 0))
-            f.readinto(wh)
+    # cache_size: bytes of the glyph cache, the file is kept open and glyphs
+    # are read on demand. 0 loads the whole font. None is config font_cache.
+    def _open(self, fontfile, cache_size, kind):
+        if cache_size is None:
+            cache_size = FONT_CACHE
+        f = open(self.FONTDIR + fontfile, 'rb')
+        wh = array.array('B', (0, 0))
+        f.readinto(wh)
+        self.version = 1
+        if wh[0] == 0:
+            self._open_v2(f, wh[1], kind)
+        else:
             self.WIDTH = wh[0]
             self.HEIGHT = wh[1]
-            self._fontunit_b = self.WIDTH * self.HEIGHT * self.PIXELSIZE_b
+        if cache_size:
+            self._file = f
+            self._cache = _GlyphCache(cache_size)
+        else:
+            self._file = None
+            self._cache = None
+        return f
+
+    def _open_v2(self, f, version, kind):
+        header = array.array('B', range(V2_HEADER_b - 2))
+        f.readinto(header)
+        if version != 2 or header[0] != ord(kind):
+            f.close()
+            raise ValueError('not a v2 %sCF font' % kind)
+        self.version = 2
+        self.WIDTH = header[1]
+        self.HEIGHT = header[2]
+        self._flags = header[3]
+        count = header[4] | (header[5] << 8)
+        self._codes = array.array('H', range(count))
+        f.readinto(self._codes)
+        self._offsets_pos = V2_HEADER_b + count * 2
+        self._data_offset = self._offsets_pos + (count + 1) * 4
+        self._offsets = None
+        self._span_buf = array.array('I', (0, 0))
+
+    # loads the offsets and the records of a v2 font
+    def _load_v2(self, f):
+        self._offsets = array.array('I', range(len(self._codes) + 1))
+        f.readinto(self._offsets)
+        self._data = memoryview(bytearray(self._offsets[-1]))
+        f.readinto(self._data)
+
+    # the record of a v2 glyph: (begin, end) in the records
+    def _span(self, i):
+        if self._offsets:
+            return (self._offsets[i], self._offsets[i+1])
+        span = self._span_buf
+        f = self._file
+        f.seek(self._offsets_pos + i * 4)
+        f.readinto(span)
+        return (span[0], span[1])
+
+    def _read_v2(self, obeg, buf):
+        f = self._file
+        f.seek(self._data_offset + obeg)
+        f.readinto(buf)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+# LRU of glyph records up to budget bytes (at least one record is kept)
+class _GlyphCache(object):
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._glyphs = {}		# code: [last use, buffer]
+        self._clock = 0
+
+    def get(self, code):
+        ent = self._glyphs.get(code)
+        if ent is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        ent[0] = self._clock
+        return ent[1]
+
+    # a buffer of size bytes for code. The least recently used records are
+    # evicted to the budget, and an evicted buffer of the size is reused.
+    def alloc(self, code, size):
+        glyphs = self._glyphs
+        buf = None
+        while glyphs and self.size + size > self.budget:
+            victim = min(glyphs, key=lambda k: glyphs[k][0])
+            old = glyphs.pop(victim)[1]
+            self.size -= len(old)
+            if len(old) == size:
+                buf = old
+        if buf is None:
+            buf = memoryview(bytearray(size))
+        self._clock += 1
+        glyphs[code] = [self._clock, buf]
+        self.size += size
+        return buf
+
+    def clear(self):
+        self._glyphs = {}
+        self.size = 0
+
+# An FCF record of v2 is the runs of pixels, a byte each, of the background
+# and the foreground alternately from the background. The background after
+# the last run is not recorded. The runs are expanded with the current
+# colors, so change_color costs nothing but the cache.
+
+class FixedColorFont(_FontBase):
+
+    def __init__(self, fontfile='misaki_7x4.fcf', cache_size=None):
+        f = self._open(fontfile, cache_size, 'F')
+        self._fontunit_b = self.WIDTH * self.HEIGHT * self.PIXELSIZE_b
+        self._colors = None
+        if self.version == 2:
+            self._init_v2(f)
+            return
+        if self._cache:
+            self.pixels = self._pixels_stream
+            return
+        with f:
             size = self._fontunit_b * self.FONTNUM
             self._fontarray = memoryview(array.array('B', (0 for _ in range(size))))
             f.readinto(self._fontarray)
 
+    def _init_v2(self, f):
+        self._set_spans(b'\xff\xff', b'\x00\x00')
+        self.pixels = self._pixels_v2
+        if self._cache:
+            # runs of a record, at most a run a pixel and the first one
+            self._runs = memoryview(bytearray(self.WIDTH * self.HEIGHT + 1))
+            return
+        with f:
+            self._load_v2(f)
+        self._pixbuf = memoryview(bytearray(self._fontunit_b))
+
+    # a glyph of the background and of the foreground pixels, the runs are
+    # copied from them
+    def _set_spans(self, fg_pixel, bg_pixel):
+        n = self.WIDTH * self.HEIGHT
+        self._spans = (memoryview(bytearray(bg_pixel * n)),
+                       memoryview(bytearray(fg_pixel * n)))
+
+    # the pixel of the background of the glyphs
+    @property
+    def bg_pixel(self):
+        if self._colors:
+            return bytes(self._colors[1])
+        return b'\x00\x00'
+
+    def _recolor(self, fa):
+        fg_pixel, bg_pixel = self._colors
+        for i in range(0, len(fa), 2):
+            if fa[i]:
+                fa[i:i+2] = fg_pixel
+            else:
+                fa[i:i+2] = bg_pixel
+
     def change_color(self, fg_pixel, bg_pixel):
         if fg_pixel or bg_pixel:
-            fa = self._fontarray
-            for i in range(0, size, 2):
-                if fa[i]:
-                    fa[i:i+2] = fg_pixel
-                else:
-                    fa[i:i+2] = bg_pixel
+            self._colors = (fg_pixel, bg_pixel)
+            if self.version == 2:
+                self._set_spans(fg_pixel, bg_pixel)
+                if self._cache:
+                    self._cache.clear()
+            elif self._cache:
+                self._cache.clear()	# recolored on the next read
+            else:
+                self._recolor(self._fontarray)
 
     def pixels(self, c):
         fbeg = self._fontunit_b * ord(c)
         fend = fbeg + self._fontunit_b
         return (self._fontarray[fbeg:fend], self._fontunit_b)
 
+    def _pixels_stream(self, c):
+        code = ord(c)
+        buf = self._cache.get(code)
+        if buf is None:
+            unit = self._fontunit_b
+            buf = self._cache.alloc(code, unit)
+            f = self._file
+            f.seek(2 + unit * code)
+            f.readinto(buf)
+            if self._colors:
+                self._recolor(buf)
+        return (buf, self._fontunit_b)
+
+    # the pixels of a v2 glyph, expanded into the cache or, loaded, into a
+    # buffer reused by the next call
+    def _pixels_v2(self, c):
+        unit = self._fontunit_b
+        code = ord(c)
+        cache = self._cache
+        if cache:
+            buf = cache.get(code)
+            if buf is not None:
+                return (buf, unit)
+        i = _find(self._codes, code)
+        if i < 0:
+            return (self._spans[0][:unit], unit)
+        obeg, oend = self._span(i)
+        if cache:
+            runs = self._runs[:oend-obeg]
+            self._read_v2(obeg, runs)
+            buf = cache.alloc(code, unit)
+        else:
+            runs = self._data[obeg:oend]
+            buf = self._pixbuf
+        spans = self._spans
+        o = 0
+        on = 0
+        for run in runs:
+            run *= 2
+            if run:
+                buf[o:o+run] = spans[on][:run]
+                o += run
+            on ^= 1
+        if o < unit:
+            buf[o:unit] = spans[0][:unit-o]
+        return (buf, unit)
+
+# A glyph of GCF is strokes of 4 bytes, c_beg, r_beg, c_end and r_end: a line,
+# or a filled rectangle when both the columns and the rows differ. A packed
+# stroke of v2 is 2 bytes, c_beg << 4 | r_beg and c_end << 4 | r_end.
+
 class GraphicCompositFont(_FontBase):
 
-    def __init__(self, fontfile='mplus_10x5.gcf'):
-        path = self.FONTDIR + fontfile
-        with open(path, 'rb') as f:
-            wh = array.array('B', (0, 0))
-            f.readinto(wh)
-            self.WIDTH = wh[0]
-            self.HEIGHT = wh[1]
-            self._index = array.array('H', range(self.FONTNUM + 1))
-            f.readinto(self._index)
+    def __init__(self, fontfile='mplus_10x5.gcf', cache_size=None):
+        f = self._open(fontfile, cache_size, 'G')
+        if self.version == 2:
+            self.get_line = self._get_line_v2
+            if not self._cache:
+                with f:
+                    self._load_v2(f)
+            return
+        self._index = array.array('H', range(self.FONTNUM + 1))
+        f.readinto(self._index)
+        if self._cache:
+            self._data_offset = 2 + len(self._index) * 2
+            self.get_line = self._get_line_stream
+            return
+        with f:
             dsize = self._index[-1]
             self._data = memoryview(array.array('B', (0 for _ in range(dsize))))
             f.readinto(self._data)
@@ -90,23 +347,68 @@ class GraphicCompositFont(_FontBase):
             yield self._data[obeg:omid]
             obeg = omid
 
+    def _get_line_stream(self, c):
+        code = ord(c)
+        data = self._cache.get(code)
+        if data is None:
+            obeg = self._index[code]
+            data = self._cache.alloc(code, self._index[code+1] - obeg)
+            f = self._file
+            f.seek(self._data_offset + obeg)
+            f.readinto(data)
+        obeg = 0
+        oend = len(data)
+        while obeg < oend:
+            omid = obeg + 4
+            yield data[obeg:omid]
+            obeg = omid
+
+    def _get_line_v2(self, c):
+        code = ord(c)
+        cache = self._cache
+        data = cache.get(code) if cache else None
+        if data is None:
+            i = _find(self._codes, code)
+            if i < 0:
+                return
+            obeg, oend = self._span(i)
+            if cache:
+                data = cache.alloc(code, oend - obeg)
+                self._read_v2(obeg, data)
+            else:
+                data = self._data[obeg:oend]
+        if self._flags & V2_PACKED:
+            for i in range(0, len(data), 2):
+                beg = data[i]
+                end = data[i+1]
+                yield (beg >> 4, beg & 0x0f, end >> 4, end & 0x0f)
+            return
+        obeg = 0
+        oend = len(data)
+        while obeg < oend:
+            omid = obeg + 4
+            yield data[obeg:omid]
+            obeg = omid
+
 
 #----------------------------------------------------------------------------
 #                                   image
 #----------------------------------------------------------------------------
 
+# pixel_b: bytes of a pixel, 2 for 65k and 1 for 256 colors (img2mp65k -f)
+
 class Image(object):
 
-    def __init__(self, img_file=None, w=None, h=None):
+    def __init__(self, img_file=None, w=None, h=None, pixel_b=2):
         if img_file:
             size = array.array('B', (0, 0))
             with open(img_file, 'rb') as f:
                 f.readinto(size)
                 w, h = size
-                imgbuf = array.array('B', range(w * h * 2))
+                imgbuf = array.array('B', (0 for _ in range(w * h * pixel_b)))
                 f.readinto(imgbuf)
         else:
-            imgbuf = array.array('B', (0 for _ in range(w * h * 2)))
+            imgbuf = array.array('B', (0 for _ in range(w * h * pixel_b)))
             self.append = imgbuf.append
             self.extend = imgbuf.extend
         self.w = w
@@ -118,20 +420,30 @@ class Image(object):
 #                               adaptor base
 #----------------------------------------------------------------------------
 
+class _NoBatch(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_no_batch = _NoBatch()
+
 class AdaptorBase(object):
 
+    GCF_FILES = ('mplus_10x5.gcf', 'mplus_12x5.gcf')
+
+    hw_scroll = False			# set_start_line is supported
+
     def __new__(cls, *, use_fcf, use_gcf):
         self = super().__new__(cls)
 
-        # fonts
-        if use_fcf:
-            self.fcf = FixedColorFont()
-        if use_gcf:
-            self.gcf_list = [
-                GraphicCompositFont('mplus_10x5.gcf'),
-                GraphicCompositFont('mplus_12x5.gcf')
-            ]
-            self.gcf = self.gcf_list[0]
+        # fonts: loaded on the first use (see fcf, gcf)
+        self._use_fcf = use_fcf
+        self._fcf = None
+        self._gcf_fonts = [None] * len(self.GCF_FILES) if use_gcf else []
+        self._gcf = None
         
         # colors: public properties
         self.line_color = Color(0, 0, 0)	# RGB
@@ -182,6 +494,32 @@ class AdaptorBase(object):
     def fcf_change_color(self, fg_pixel, bg_pixel):
         raise NotImplementedError()
 
+    @property
+    def fcf(self):
+        if self._fcf is None and self._use_fcf:
+            self._fcf = FixedColorFont()
+        return self._fcf
+
+    def _gcf_font(self, i):
+        font = self._gcf_fonts[i]
+        if font is None:
+            font = self._gcf_fonts[i] = GraphicCompositFont(self.GCF_FILES[i])
+        return font
+
+    @property
+    def gcf_list(self):
+        return [self._gcf_font(i) for i in range(len(self._gcf_fonts))]
+
+    @property
+    def gcf(self):
+        if self._gcf is None and self._gcf_fonts:
+            self._gcf = self._gcf_font(0)
+        return self._gcf
+
+    @gcf.setter
+    def gcf(self, font):
+        self._gcf = font
+
     @property
     def fcf_size(self):
         return (self.fcf.WIDTH, self.fcf.HEIGHT)
@@ -192,11 +530,11 @@ class AdaptorBase(object):
 
     @property
     def gcf_index(self):
-        return self.gcf_list.index(self.gcf)
+        return self._gcf_fonts.index(self.gcf)
 
     @gcf_index.setter
     def gcf_index(self, i):
-        self.gcf = self.gcf_list[i]
+        self.gcf = self._gcf_font(i)
 
     def fcf_put(self, col, row, chars, spacing=0):
         raise NotImplementedError()
@@ -204,6 +542,18 @@ class AdaptorBase(object):
     def gcf_put(self, col, row, chars, spacing=0):
         raise NotImplementedError()
 
+    # send what is drawn to the display (when drawing is buffered)
+    def flush(self):
+        pass
+
+    # a context in which the drawing is sent at once (when supported)
+    def batch(self):
+        return _no_batch
+
+    # the RAM row shown on the top of the display
+    def set_start_line(self, row):
+        raise NotImplementedError()
+
 class DummyAdaptor(AdaptorBase):
 
     def __new__(cls):
@@ -280,9 +630,36 @@ class DummyAdaptor(AdaptorBase):
 #                        text display area (use fcf)
 #----------------------------------------------------------------------------
 
+# With line_buffer (config text_line_buffer), a line is drawn when it's done
+# or on refresh, as a band of the columns of its text in a window and a
+# burst of pixels, and a scroll of several lines is one copy. putline
+# refreshes unless in hold(), so a burst of lines in a hold is a refresh
+# and the lines scrolled out in it are never drawn.
+#
+# With hw_scroll (config text_hw_scroll) too and a board of the whole
+# display, the display start line scrolls it instead of copies: the lines
+# are drawn in the RAM rows of a ring and the rows under the last line
+# (the display height is not a multiple of the line) are cleared. The
+# other drawings on the display scroll with it.
+
+class _ImagePart(object):		# w, h and buf as Image, for draw_image
+
+    def __init__(self, w):
+        self.w = w
+        self.h = 0
+        self.buf = None
+
+# With line_buffer (None: config.text_line_buffer, off by default) a line is
+# drawn at once at putline or refresh, where putc of the character board
+# draws each character as it comes. A putline within refresh_ms (None:
+# config.text_refresh_ms) of the last refresh is not drawn yet: the lines
+# of a burst (e.g. log lines of the admin service) are drawn at once by the
+# next putline after it, refresh() or the end of hold(). Nothing is drawn
+# but by the caller's thread.
 class TextBoard(object):
 
-    def __init__(self, disp, col_beg, row_beg, col_end, row_end, ch_spacing=0, line_spacing=0):
+    def __init__(self, disp, col_beg, row_beg, col_end, row_end, ch_spacing=0, line_spacing=0,
+                 line_buffer=None, hw_scroll=None, refresh_ms=None):
         self._disp = disp
         self._area = (col_beg, row_beg, col_end, row_end)
         self._fw, self._fh = disp.fcf_size
@@ -296,6 +673,15 @@ class TextBoard(object):
         self._crow = 0
         self._linefeed = False
 
+        if line_buffer is None:
+            line_buffer = TEXT_LINE_BUFFER
+        if hw_scroll is None:
+            hw_scroll = TEXT_HW_SCROLL
+        if refresh_ms is None:
+            refresh_ms = TEXT_REFRESH_MS
+        if line_buffer:
+            self._init_line_buffer(hw_scroll, refresh_ms)
+
         global text_board
         text_board = self
 
@@ -330,5 +716,192 @@ class TextBoard(object):
         for c in msg:
             self.putc(c)
         self.putc('\n')
+        self._disp.flush()
+
+    def hold(self):
+        return _no_batch
+
+    def refresh(self):
+        pass
+
+    # line buffer
+
+    def _init_line_buffer(self, hw_scroll, refresh_ms):
+        col_beg, row_beg, col_end, row_end = self._area
+        disp = self._disp
+        w = col_end - col_beg + 1
+        self._line_mv = memoryview(bytearray(w * self._fh * 2))
+        self._bg = None
+        self._blank = None
+        self._part = _ImagePart(w)
+        self._widths = [w] * self._nrow	# columns which may be drawn in a row
+        self._index = 0			# of the current line from the first
+        self._first = 0			# the index of the line on the top
+        self._text = []			# of the current line
+        self._lines = {}		# index: text, to be drawn
+        self._held = 0
+        self._hold = _Hold(self)
+        self._refresh_ms = refresh_ms
+        self._refreshed = None		# ticks of the last refresh
+        self._lock = _thread.allocate_lock()	# putline of several threads
+        self._hw_scroll = False
+        if hw_scroll and disp.hw_scroll and self._area == (
+                (0, 0) + tuple(v - 1 for v in disp.display_size)):
+            self._hw_scroll = True
+            self._start = 0		# RAM row of the top
+            disp.set_start_line(0)
+        self.putc = self._putc_locked
+        self.putline = self._putline_line
+        self.hold = self._hold_line
+        self.refresh = self._refresh
+
+    def _putc_line(self, c):
+        if c == '\n':
+            self._linefeed = True
+            return
+        text = self._text
+        if len(text) == self._ncol:
+            self._linefeed = True
+        if self._linefeed:
+            self._linefeed = False
+            self._index += 1
+            text = self._text = []
+            lines = self._lines
+            for i in [i for i in lines if i <= self._index - self._nrow]:
+                del lines[i]		# scrolled out before drawn
+        text.append(c)
+        self._lines[self._index] = text
+
+    def _putc_locked(self, c):
+        with self._lock:
+            self._putc_line(c)
+
+    def _putline_line(self, msg):
+        with self._lock:
+            for c in msg:
+                self._putc_line(c)
+            self._putc_line('\n')
+            if self._held:
+                return
+            if (self._refreshed is None or
+                    _ticks_diff(_ticks_ms(), self._refreshed) >= self._refresh_ms):
+                self._refresh_locked()
+
+    def _hold_line(self):
+        return self._hold
+
+    def _refresh(self):
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        disp = self._disp
+        nrow = self._nrow
+        first = max(0, self._index - nrow + 1)
+        shift = first - self._first
+        lines = self._lines
+        with disp.batch():
+            if 0 < shift < nrow:
+                self._scroll(shift)
+            for i in range(first, first + nrow):
+                if i in lines or i >= self._first + nrow:
+                    self._draw_line(i - first, ''.join(lines.get(i, ())))
+            self._lines = {}
+            self._first = first
+            disp.flush()
+            if self._hw_scroll:
+                disp.set_start_line(self._start)
+        self._refreshed = _ticks_ms()
+
+    def _scroll(self, n):
+        col_beg, row_beg, col_end, row_end = self._area
+        disp = self._disp
+        nrow = self._nrow
+        rows = n * self._fh
+        widths = self._widths
+        if self._hw_scroll:
+            height = row_end + 1
+            self._start = (self._start + rows) % height
+            tail = nrow * self._fh
+            if tail < height:		# the rows under the last line
+                for beg, end in self._ram_rows(tail, height - tail):
+                    disp.clear(col_beg, beg, col_end, end)
+            # the rows of the top come to the bottom, not aligned to lines
+            self._widths = widths[n:] + [col_end - col_beg + 1] * n
+            return
+        bottom = row_beg + nrow * self._fh - 1
+        disp.copy(col_beg, row_beg + rows, col_end, bottom, col_beg, row_beg)
+        self._widths = widths[n:] + widths[nrow-n:]	# the bottom is left
+
+    # (begin, end) RAM rows of n rows from row of the board, two when they
+    # wrap in the ring of the hardware scroll
+    def _ram_rows(self, row, n):
+        if not self._hw_scroll:
+            beg = self._area[1] + row
+            return ((beg, beg + n - 1),)
+        height = self._area[3] + 1
+        beg = (self._start + row) % height
+        m = min(n, height - beg)
+        if m < n:
+            return ((beg, beg + m - 1), (0, n - m - 1))
+        return ((beg, beg + m - 1),)
+
+    # the columns of the text are sent, and the rest of what was drawn in
+    # the row is cleared (unless the background is not black)
+    def _draw_line(self, row, text):
+        col_beg, _, col_end, _ = self._area
+        disp = self._disp
+        fcf = disp.fcf
+        pixels = fcf.pixels
+        fh = self._fh
+        lb = self._line_mv
+        bg = fcf.bg_pixel
+        if self._bg != bg:
+            self._bg = bg
+            self._blank = memoryview(bg * (len(lb) // 2))
+        width = col_end - col_beg + 1
+        tw = min(len(text) * self._fw, width)
+        if bg != b'\x00\x00':
+            tw = width
+        y = row * fh
+        if tw:
+            w = tw * 2
+            lb[:w*fh] = self._blank[:w*fh]
+            gw = fcf.WIDTH * 2
+            x = 0
+            for c in text:
+                g = pixels(c)[0]
+                o = x
+                for r in range(0, fcf.HEIGHT * gw, gw):
+                    lb[o:o+gw] = g[r:r+gw]
+                    o += w
+                x += self._fw * 2
+            part = self._part
+            part.w = tw
+            o = 0
+            for beg, end in self._ram_rows(y, fh):
+                part.h = end - beg + 1
+                part.buf = lb[o:o + part.h * w]
+                disp.draw_image(col_beg, beg, part)
+                o += part.h * w
+        if self._widths[row] > tw:
+            for beg, end in self._ram_rows(y, fh):
+                disp.clear(col_beg + tw, beg, col_beg + self._widths[row] - 1, end)
+        self._widths[row] = tw
+
+class _Hold(object):
+
+    def __init__(self, board):
+        self._board = board
+
+    def __enter__(self):
+        self._board._held += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        board = self._board
+        board._held -= 1
+        if not board._held:
+            board._refresh()
 
-TextBoard(DummyAdaptor(), 0, 0, 32, 32)
+TextBoard(DummyAdaptor(), 0, 0, 32, 32, line_buffer=False)
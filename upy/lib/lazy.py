@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# Lazy import. A module proxy imports the module on the first access of an
+# attribute, so that a module which may not be used on a boot costs nothing
+# until it is.
+#
+#   import lazy
+#   ssd1331 = lazy.module('ssd1331')
+#   ...
+#   driver = ssd1331.vspi()		# ssd1331 is imported here
+#
+# importer imports a module by name. bootprof.install replaces it to record
+# the imports.
+
+import sys
+
+# Built-in modules of MicroPython are not in sys.modules, so the module is
+# taken from the package returned by __import__.
+def _import(name):
+    mod = __import__(name)
+    for attr in name.split('.')[1:]:
+        mod = getattr(mod, attr)
+    return mod
+
+importer = _import
+
+class _LazyModule(object):
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        mod = self._module
+        if mod is None:
+            mod = self._module = importer(self._name)
+        return getattr(mod, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module else 'not loaded'
+        return "<lazy module '%s' (%s)>" % (self._name, state)
+
+def module(name):
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    return _LazyModule(name)
@@ -9,14 +9,17 @@ import sys
 #                        machine dependent functions
 #----------------------------------------------------------------------------
 
+_on_micropython = (sys.implementation.name == 'micropython')
+
 #### thread
 import _thread
 
 def _thread_start(func, args, **kwargs):
     if hasattr(_thread, 'CPU_CORES'):
+        cpu_id = kwargs.get('cpu_id', _thread.CPU_CORES-1)
         cur = _thread.stack_size()
         _thread.stack_size(1024*12)
-        ret =  _thread.start_new_thread(func, args, cpu_id=_thread.CPU_CORES-1)
+        ret =  _thread.start_new_thread(func, args, cpu_id=cpu_id)
         _thread.stack_size(cur)
         return ret
     else:
@@ -25,19 +28,151 @@ def _thread_start(func, args, **kwargs):
 def _thread_getlock():
     return _thread.allocate_lock()
 
+# bounded queue with one producer and one consumer, built on _thread locks.
+class _Queue(object):
+    def __init__(self, maxsize):
+        self._items = []
+        self._maxsize = maxsize
+        self._lock = _thread_getlock()
+        self._not_empty = _thread_getlock()
+        self._not_empty.acquire()
+        self._not_full = _thread_getlock()
+        self._not_full.acquire()
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _wakeup(lock):
+        if lock.locked():
+            lock.release()
+
+    def put(self, item):
+        while True:
+            with self._lock:
+                if len(self._items) < self._maxsize:
+                    self._items.append(item)
+                    self._wakeup(self._not_empty)
+                    return
+            self._not_full.acquire()		# block until get
+
+    def get(self):
+        while True:
+            with self._lock:
+                if self._items:
+                    item = self._items.pop(0)
+                    self._wakeup(self._not_full)
+                    return item
+            self._not_empty.acquire()		# block until put
+
 #### poll
 try:
     import mpoll
 except:
     import select as mpoll
+    if not hasattr(mpoll.poll(), 'ipoll'):
+        # CPython: select.poll has no ipoll and returns fd numbers, so wrap
+        # it to look like mpoll. Timeout is short as mpoll does, because
+        # sockets registered while polling must be picked up. _fobjs is
+        # locked as other threads register and unregister while polling.
+        import select
+
+        class mpoll(object):
+            POLLIN = select.POLLIN
+
+            class poll(object):
+                def __init__(self):
+                    self._poll = select.poll()
+                    self._fobjs = {}
+                    self._lock = _thread_getlock()
+
+                def register(self, fobj, flag=select.POLLIN):
+                    with self._lock:
+                        self._fobjs[fobj.fileno()] = fobj
+                        self._poll.register(fobj, flag)
+
+                def unregister(self, fobj):
+                    with self._lock:
+                        self._fobjs.pop(fobj.fileno(), None)
+                        self._poll.unregister(fobj)
+
+                def ipoll(self, timeout=20):
+                    events = self._poll.poll(timeout)
+                    with self._lock:
+                        fobjs = self._fobjs
+                        return [(fobjs[fd], flag) for fd, flag in events
+                                if fd in fobjs]
 
 #### socket.read
-def _recvall(sock, n):
-    return sock.read(n)
-        
+if _on_micropython:
+    def _recvall(sock, n):
+        return sock.read(n)
+else:
+    def _recvall(sock, n):
+        data = b''
+        while len(data) < n:
+            s = sock.recv(n - len(data))
+            if not s:
+                break
+            data += s
+        return data
+
+#### socket.readinto
+if _on_micropython:
+    def _recvinto(sock, mv):
+        n = len(mv)
+        i = 0
+        while i < n:
+            r = sock.readinto(mv[i:])
+            if not r:
+                break
+            i += r
+        return i
+else:
+    def _recvinto(sock, mv):
+        n = len(mv)
+        i = 0
+        while i < n:
+            r = sock.recv_into(mv[i:])
+            if not r:
+                break
+            i += r
+        return i
+
+#### config
+try:
+    from config.mipc import config as _config
+except ImportError:
+    from configobj import empty_config as _config
+
 #### print exception
-def _print_exception(e):
-    sys.print_exception(e)
+if _on_micropython:
+    def _print_exception(e):
+        sys.print_exception(e)
+else:
+    import traceback
+    def _print_exception(e):
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+#### json
+import json
+if _on_micropython:
+    _json_dumps = json.dumps
+else:
+    def _json_dumps(msg):
+        return json.dumps(msg).encode()
+_json_loads = json.loads
+
+#### compression (zlib format). MicroPython can only decompress.
+try:
+    import zlib as _zlib
+except ImportError:
+    try:
+        import uzlib as _zlib
+    except ImportError:
+        _zlib = None
+_inflate = getattr(_zlib, 'decompress', None)
+_deflate = getattr(_zlib, 'compress', None)
 
 
 #----------------------------------------------------------------------------
@@ -62,7 +197,182 @@ class ProtocolError(PortError):
 class RemoteHandlerError(PortError):
     pass
 
+
+#----------------------------------------------------------------------------
+#                     binary codec (subset of MessagePack)
+#----------------------------------------------------------------------------
+
+# Supported types: None, bool, int (64bit), float, str, bytes/bytearray,
+# list/tuple (decoded as list) and dict. The only extension type is
+# _EXT_DEFLATE, zlib compressed bytes. _mpk_pack compresses bytes objects of
+# deflate_min bytes or more if it saves 1/8 at least. bytearray and
+# memoryview are never compressed, so that data known to be incompressible
+# can be passed as them to save the try.
+
+_EXT_DEFLATE = 1
+
+def _mpk_pack_len(buf, n, fix, fix_max, code16, code32):
+    if n <= fix_max:
+        buf.append(fix | n)
+    elif n < 0x10000:
+        buf.extend(struct.pack('>BH', code16, n))
+    else:
+        buf.extend(struct.pack('>BI', code32, n))
+
+def _mpk_pack_bin(buf, obj, deflate_min):
+    n = len(obj)
+    if deflate_min and n >= deflate_min and isinstance(obj, bytes):
+        z = _deflate(obj)
+        m = len(z)
+        if m < n - (n >> 3):
+            if m < 0x100:
+                buf.extend(struct.pack('>BBb', 0xc7, m, _EXT_DEFLATE))
+            elif m < 0x10000:
+                buf.extend(struct.pack('>BHb', 0xc8, m, _EXT_DEFLATE))
+            else:
+                buf.extend(struct.pack('>BIb', 0xc9, m, _EXT_DEFLATE))
+            buf.extend(z)
+            return
+    if n < 0x100:
+        buf.append(0xc4)
+        buf.append(n)
+    else:
+        _mpk_pack_len(buf, n, 0, -1, 0xc5, 0xc6)
+    buf.extend(obj)
+
+def _mpk_pack(buf, obj, deflate_min=0):
+    if obj is None:
+        buf.append(0xc0)
+    elif obj is False:
+        buf.append(0xc2)
+    elif obj is True:
+        buf.append(0xc3)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            buf.append(obj)
+        elif -0x20 <= obj < 0:
+            buf.append(obj & 0xff)
+        elif obj >= 0:
+            if obj < 0x100:
+                buf.append(0xcc)
+                buf.append(obj)
+            elif obj < 0x10000:
+                buf.extend(struct.pack('>BH', 0xcd, obj))
+            elif obj < 0x100000000:
+                buf.extend(struct.pack('>BI', 0xce, obj))
+            else:
+                buf.extend(struct.pack('>BQ', 0xcf, obj))
+        elif obj >= -0x80:
+            buf.extend(struct.pack('>Bb', 0xd0, obj))
+        elif obj >= -0x8000:
+            buf.extend(struct.pack('>Bh', 0xd1, obj))
+        elif obj >= -0x80000000:
+            buf.extend(struct.pack('>Bi', 0xd2, obj))
+        else:
+            buf.extend(struct.pack('>Bq', 0xd3, obj))
+    elif isinstance(obj, float):
+        buf.extend(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, str):
+        obj = obj.encode('utf-8')
+        n = len(obj)
+        if 31 < n < 0x100:
+            buf.append(0xd9)
+            buf.append(n)
+        else:
+            _mpk_pack_len(buf, n, 0xa0, 31, 0xda, 0xdb)
+        buf.extend(obj)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        _mpk_pack_bin(buf, obj, deflate_min)
+    elif isinstance(obj, (list, tuple)):
+        _mpk_pack_len(buf, len(obj), 0x90, 15, 0xdc, 0xdd)
+        for v in obj:
+            _mpk_pack(buf, v, deflate_min)
+    elif isinstance(obj, dict):
+        _mpk_pack_len(buf, len(obj), 0x80, 15, 0xde, 0xdf)
+        for k, v in obj.items():
+            _mpk_pack(buf, k)
+            _mpk_pack(buf, v, deflate_min)
+    else:
+        raise TypeError('%s is not packable' % type(obj).__name__)
+
+def _mpk_dumps(obj, deflate_min=0):
+    buf = bytearray()
+    _mpk_pack(buf, obj, deflate_min)
+    return buf
+
+# code: (struct format, size, kind)
+#   kind 0:value, 1:str, 2:bytes, 3:array, 4:map, 5:ext
+_MPK_CODES = {
+    0xc4: ('>B', 1, 2), 0xc5: ('>H', 2, 2), 0xc6: ('>I', 4, 2),
+    0xc7: ('>B', 1, 5), 0xc8: ('>H', 2, 5), 0xc9: ('>I', 4, 5),
+    0xca: ('>f', 4, 0), 0xcb: ('>d', 8, 0),
+    0xcc: ('>B', 1, 0), 0xcd: ('>H', 2, 0), 0xce: ('>I', 4, 0), 0xcf: ('>Q', 8, 0),
+    0xd0: ('>b', 1, 0), 0xd1: ('>h', 2, 0), 0xd2: ('>i', 4, 0), 0xd3: ('>q', 8, 0),
+    0xd9: ('>B', 1, 1), 0xda: ('>H', 2, 1), 0xdb: ('>I', 4, 1),
+    0xdc: ('>H', 2, 3), 0xdd: ('>I', 4, 3),
+    0xde: ('>H', 2, 4), 0xdf: ('>I', 4, 4),
+}
+
+def _mpk_unpack(data, i):
+    c = data[i]
+    i += 1
+    if c < 0x80:
+        return c, i
+    if c >= 0xe0:
+        return c - 0x100, i
+    if c < 0x90:
+        n, kind = c & 0x0f, 4
+    elif c < 0xa0:
+        n, kind = c & 0x0f, 3
+    elif c < 0xc0:
+        n, kind = c & 0x1f, 1
+    elif c == 0xc0:
+        return None, i
+    elif c == 0xc2:
+        return False, i
+    elif c == 0xc3:
+        return True, i
+    elif c in _MPK_CODES:
+        fmt, size, kind = _MPK_CODES[c]
+        n, = struct.unpack_from(fmt, data, i)
+        i += size
+        if kind == 0:
+            return n, i
+    else:
+        raise ProtocolError('unsupported type code: 0x%02x' % c)
+    if kind == 1:
+        return str(data[i:i+n], 'utf-8'), i+n
+    if kind == 2:
+        return bytes(data[i:i+n]), i+n
+    if kind == 5:
+        if data[i] != _EXT_DEFLATE or _inflate is None:
+            raise ProtocolError('unsupported extension type: %d' % data[i])
+        return _inflate(bytes(data[i+1:i+1+n])), i+1+n
+    if kind == 3:
+        v = []
+        for _ in range(n):
+            o, i = _mpk_unpack(data, i)
+            v.append(o)
+        return v, i
+    v = {}
+    for _ in range(n):
+        k, i = _mpk_unpack(data, i)
+        v[k], i = _mpk_unpack(data, i)
+    return v, i
+
+def _mpk_loads(data):
+    obj, _ = _mpk_unpack(data, 0)
+    return obj
+
+
+#----------------------------------------------------------------------------
+#
+#----------------------------------------------------------------------------
+
 class PackerBase(object):
+    NAME = None
+    ACCEPTS = ()		# packer names which unpack can decode
+
     def pack(self, msg):
         raise NotImplementedError()
     def unpack(self, sock):
@@ -71,6 +381,14 @@ class PackerBase(object):
         return self
 
 class DumpPackerBase(PackerBase):
+
+    # RECV_BUFSIZE > 0 makes unpack read a frame into a reusable buffer of
+    # the packer (i.e. per port) instead of allocating it for each message.
+    # The buffer grows when a larger frame arrives. loads receives a
+    # memoryview of the buffer, so it must not keep a reference to it.
+    RECV_BUFSIZE = 0
+    _recv_mv = None
+
     @staticmethod
     def dumps(msg):
         raise NotImplementedError()
@@ -84,7 +402,32 @@ class DumpPackerBase(PackerBase):
         n = len(data)
         return struct.pack('<i', n)+data, n+4
 
+    def _recv_buffer(self, n):
+        mv = self._recv_mv
+        if mv is None or len(mv) < n:
+            size = self.RECV_BUFSIZE
+            while size < n:
+                size *= 2
+            mv = self._recv_mv = memoryview(bytearray(size))
+            self._recv_hdr = mv[:4]
+        return mv
+
+    def _unpack_into(self, sock):
+        self._recv_buffer(4)
+        n = _recvinto(sock, self._recv_hdr)
+        if n == 0:
+            raise SocketClosed()
+        if n != 4:
+            raise SocketUnexpectedClosed()
+        n, = struct.unpack('<i', self._recv_hdr)
+        data = self._recv_buffer(n)[:n]
+        if _recvinto(sock, data) != n:
+            raise SocketUnexpectedClosed()
+        return self.loads(data)
+
     def unpack(self, sock):
+        if self.RECV_BUFSIZE:
+            return self._unpack_into(sock)
         size_str = _recvall(sock, 4)
         if not size_str:
             raise SocketClosed()
@@ -97,9 +440,36 @@ class DumpPackerBase(PackerBase):
         return self.loads(data)
 
 class JSONPacker(DumpPackerBase):
-    import json
-    dumps = staticmethod(json.dumps)
-    loads = staticmethod(json.loads)
+    NAME = 'json'
+    ACCEPTS = ('json',)
+    dumps = staticmethod(_json_dumps)
+    loads = staticmethod(_json_loads)
+
+def _msg_loads(packer, data):
+    # A JSON message is always a list, so it begins with '[' (0x5b). That is
+    # a positive fixint in MessagePack and never begins a message, so the
+    # message packers can talk with peers which don't negotiate the packer.
+    # They reply in the same format as the last received message.
+    if data[0] == 0x5b:
+        packer.recv_json = True
+        return _json_loads(bytes(data))
+    packer.recv_json = False
+    return _mpk_loads(data)
+
+class MsgPacker(DumpPackerBase):
+    NAME = 'msgpack'
+    ACCEPTS = ('msgpack', 'json')
+    RECV_BUFSIZE = 512
+    recv_json = False
+    deflate_min = 0			# see IOPort.set_deflate
+
+    def dumps(self, msg):
+        if self.recv_json:
+            return _json_dumps(msg)
+        return _mpk_dumps(msg, self.deflate_min)
+
+    def loads(self, data):
+        return _msg_loads(self, data)
 
 class UDPDumpPackerBase(DumpPackerBase):
 
@@ -119,17 +489,76 @@ class UDPDumpPackerBase(DumpPackerBase):
         return self.loads(data)
 
 class UDPJSONPacker(UDPDumpPackerBase):
-    import json
-    dumps = staticmethod(json.dumps)
-    loads = staticmethod(json.loads)
+    NAME = 'json'
+    ACCEPTS = ('json',)
+    dumps = staticmethod(_json_dumps)
+    loads = staticmethod(_json_loads)
+
+class UDPMsgPacker(UDPDumpPackerBase):
+    NAME = 'msgpack'
+    ACCEPTS = ('msgpack', 'json')
+    recv_json = False
+    deflate_min = 0
+
+    def dumps(self, msg):
+        if self.recv_json:
+            return _json_dumps(msg)
+        return _mpk_dumps(msg, self.deflate_min)
+
+    def loads(self, data):
+        return _msg_loads(self, data)
+
+# name: (TCP packer, UDP packer)
+_packers = {
+    'json': (JSONPacker, UDPJSONPacker),
+    'msgpack': (MsgPacker, UDPMsgPacker),
+}
+# offered by a client on negotiation, in order of preference.
+packer_names = ['msgpack', 'json']
 
 
 #----------------------------------------------------------------------------
 #
 #----------------------------------------------------------------------------
 
+# Pipelining: when the peer agreed on 'msgid' in the negotiation, a request
+# may be tagged with a message ID as [msgid, name, args...] and the reply
+# comes back tagged with the same ID as [msgid, name_reply, status, value].
+# Replies may arrive out of order, so a port keeps the replies which are
+# not waited for yet.
+
+class Future(object):
+
+    def __init__(self, port, msgid, name, reply=None):
+        self._port = port
+        self._msgid = msgid
+        self._name = name
+        self._reply = reply
+
+    def done(self):
+        if self._reply is None:
+            self._reply = self._port._replies.pop(self._msgid, None)
+        return self._reply is not None
+
+    def result(self):
+        if self._reply is None:
+            self._reply = self._port._wait_reply(self._msgid)
+        ev, status, value = self._reply
+        expect = self._name + '_reply'
+        if ev != expect:
+            raise ProtocolError('%s is expected, but %s is received.' % (expect, ev))
+        if status:
+            return value
+        raise RemoteHandlerError('Exception happen on remote:\n' + value)
+
+# bytes in messages to a peer which can decompress them are compressed from
+# this size (0: never). See IOPort.set_deflate.
+DEFLATE_MIN = _config.get('deflate_min', 256)
+
 class IOPort(object):
     acceptable = False
+    asynchronous = False
+    buffered = False		# True: recv returns a message without reading
 
     def __init__(self, sock=None, packer=None):
         if packer is None:
@@ -140,6 +569,11 @@ class IOPort(object):
         self._lock = _thread_getlock()
         self._event = None
         self._autoreply_names = set()
+        self._pipelining = False
+        self._msgid = 0
+        self._replies = {}
+        self.peer_inflate = False
+        self._inflate_hosts = {}	# (UDP server) host: deflate_min
         if isinstance(packer, UDPDumpPackerBase):
             self.send = self._send_udp
 
@@ -149,10 +583,51 @@ class IOPort(object):
         self.socket = sock
         return self				# for method chain
 
-    def negotiate(self):
-        self._autoreply_names = set(self.send(['mipc_negotiate']).result())
+    def negotiate(self, packers=None):
+        msg = ['mipc_negotiate']
+        if packers:
+            msg.append(list(packers))
+            if _inflate:
+                msg.append({'inflate': True})
+        ret = self.send(msg).result()
+        if isinstance(ret, dict):		# peer supports the negotiation
+            if ret['packer']:
+                self.set_packer(ret['packer'])
+            self._pipelining = ret.get('msgid', False)
+            self.set_deflate(ret.get('inflate', False))
+            ret = ret['names']
+        self._autoreply_names = set(ret)
         return self				# for method chain
 
+    # Negotiated state of the port. It can be given to another port to the
+    # same peer by set_negotiation instead of the negotiation round trip.
+    def negotiation(self):
+        return (list(self._autoreply_names), self._packer.NAME, self._pipelining,
+                self.peer_inflate)
+
+    def set_negotiation(self, state):
+        names, packer, pipelining, inflate = state
+        if packer != self._packer.NAME:
+            self.set_packer(packer)
+        self._pipelining = pipelining
+        self.set_deflate(inflate)
+        self._autoreply_names = set(names)
+        return self				# for method chain
+
+    # Compress bytes of DEFLATE_MIN or more in messages to the peer, which
+    # has told it can decompress them. This side must have a compressor and
+    # a msgpack packer, MicroPython only decompresses.
+    def set_deflate(self, peer_inflate):
+        self.peer_inflate = peer_inflate
+        self._packer.deflate_min = DEFLATE_MIN if peer_inflate and _deflate else 0
+
+    def set_packer(self, name):
+        tcp_packer, udp_packer = _packers[name]
+        if isinstance(self._packer, UDPDumpPackerBase):
+            self._packer = udp_packer()
+        else:
+            self._packer = tcp_packer()
+
     def recv(self):
         return self._packer.unpack(self.socket)
 
@@ -174,6 +649,19 @@ class IOPort(object):
                 self.socket.send(data)
         return self
 
+    def _sendto(self, data, addr):
+        with self._lock:
+            self.socket.sendto(data, addr)
+
+    # raw data transfer on the connection (e.g. streaming file transfer)
+
+    def recv_into(self, mv):
+        return _recvinto(self.socket, mv)
+
+    def send_raw(self, data):
+        with self._lock:
+            self.socket.sendall(data)
+
     def close(self):
         if self.socket:
             self.socket.close()
@@ -188,6 +676,40 @@ class IOPort(object):
             return value
         raise RemoteHandlerError('Exception happen on remote:\n' + value)
 
+    def _wait_reply(self, msgid):
+        replies = self._replies
+        while msgid not in replies:
+            msg = self.recv()
+            if not isinstance(msg[0], int):
+                raise ProtocolError('reply without message ID: %s' % msg[0])
+            replies[msg[0]] = msg[1:]
+        return replies.pop(msgid)
+
+    # Send a request of autoreply method without waiting for the reply and
+    # return a Future. If the peer doesn't support pipelining, the reply is
+    # waited for here and the Future is already done.
+    def submit(self, name, *args):
+        if not self._pipelining:
+            msg = [name]
+            msg.extend(args)
+            return Future(self, None, name, self.send(msg).recv())
+        self._msgid += 1
+        msg = [self._msgid, name]
+        msg.extend(args)
+        self.send(msg)
+        return Future(self, self._msgid, name)
+
+    # Call name with each args in args_iter keeping up to window requests
+    # outstanding, and yield the results in order.
+    def imap(self, name, args_iter, window=8):
+        futures = []
+        for args in args_iter:
+            futures.append(self.submit(name, *args))
+            if len(futures) >= window:
+                yield futures.pop(0).result()
+        for future in futures:
+            yield future.result()
+
     def __getattr__(self, name):
         def _send(*args):
             msg = [name]
@@ -199,21 +721,26 @@ class IOPort(object):
         return _send
 
 def client(addr, packer=None):
-    return IOPort(packer=packer).connect(addr).negotiate()
+    packers = None if packer else packer_names
+    return IOPort(packer=packer).connect(addr).negotiate(packers)
 
-def udp_client(addr, packer=None):
+def udp_client(addr, packer=None, negotiation=None):
+    packers = None if packer else packer_names
     if packer is None:
         packer = UDPJSONPacker()
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.connect(addr)
     sock.settimeout(5.0)	# TODO
-    return IOPort(sock=sock, packer=packer).negotiate()
+    port = IOPort(sock=sock, packer=packer)
+    if negotiation:
+        return port.set_negotiation(negotiation)
+    return port.negotiate(packers)
 
 def udp_server(addr, packer=None):
     if isinstance(addr, int):
         addr = ('0.0.0.0', addr)
     if packer is None:
-        packer = UDPJSONPacker()
+        packer = UDPMsgPacker()
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind(addr)
     sock.settimeout(5.0)	# TODO
@@ -232,16 +759,74 @@ class AcceptablePort(object):
         iosocket, _ = self.socket.accept()
         packer = self._packer
         return IOPort(sock=iosocket,
-                      packer=(packer() if packer else None))
+                      packer=(packer() if packer else MsgPacker()))
 
     def close(self):
         if self.socket:
             self.socket.close()
             self.socket = None
 
+# port proxy which tags sending messages with the message ID.
+class _TaggedPort(object):
+
+    def __init__(self, port, msgid):
+        self._port = port
+        self._msgid = msgid
+
+    def send(self, msg):
+        tagged = [self._msgid]
+        tagged.extend(msg)
+        return self._port.send(tagged)
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+# port proxy of a UDP port for a peer. Replies go to the address where the
+# request came from, encoded in kind of the request, so that requests of
+# several peers can be handled at the same time. Messages of the same peer
+# keep the order on workers (see _ServiceManager._worker_queue).
+class _PeerPort(object):
+
+    def __init__(self, port, packer):
+        self._port = port
+        self._packer = packer.__class__()
+        self._packer.recv_json = getattr(packer, 'recv_json', False)
+        self._addr = packer.recv_addr
+        self._packer.deflate_min = port._inflate_hosts.get(self._addr[0], 0)
+        self.peer = (port, self._addr)
+
+    # The capability is kept per host, as ports of a client may skip the
+    # negotiation by IOPort.set_negotiation.
+    def set_deflate(self, peer_inflate):
+        deflate_min = DEFLATE_MIN if peer_inflate and _deflate else 0
+        self._port._inflate_hosts[self._addr[0]] = deflate_min
+        self._packer.deflate_min = deflate_min
+
+    def send(self, msg):
+        data, n = self._packer.pack(msg)
+        self._port._sendto(data, self._addr)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+# A handler may be a coroutine when it is served by amipc. Its reply is sent
+# after it finished on the event loop.
+def _is_coroutine(obj):
+    return hasattr(obj, 'send') and hasattr(obj, 'throw')
+
+async def _async_reply(port, reply, coro):
+    try:
+        ret = await coro
+        port.send([reply, True, ret])
+    except Exception as e:
+        port.send([reply, False, str(e)])
+        _print_exception(e)
+
 class _AutoReply(object):
     def __init__(self):
         self._autoreply_names = set()
+        self._worker_names = set()
 
     def __contains__(self, item):
         return item in self._autoreply
@@ -251,12 +836,18 @@ class _AutoReply(object):
             self._autoreply_names.update(target._autoreply_names)
             target._autoreply_names = self._autoreply_names
             self._autoreply_names = set()
+            self._worker_names.update(target._worker_names)
+            target._worker_names = self._worker_names
+            self._worker_names = set()
             return target
         else:
             def wrapper(svc_self, port, msg):	# args: self, port, msg
                 reply = msg[0] + '_reply'
                 try:
                     ret = target(svc_self, *msg[1:])
+                    if port.asynchronous and _is_coroutine(ret):
+                        port.schedule(_async_reply(port, reply, ret))
+                        return
                     port.send([reply, True, ret])
                 except Exception as e:
                     port.send([reply, False, str(e)])
@@ -271,9 +862,22 @@ class _AutoReply(object):
             ret = target(svc_self, *msg[1:])
         return wrapper
 
+    # Handler decorated by worker is run on the worker pool of the manager
+    # (if it is started). It must be applied before autoreply/noreply:
+    #
+    #   @mipc.autoreply
+    #   @mipc.worker
+    #   def put_data(self, data):
+    #
+    # and the class must be decorated by autoreply to collect the names.
+    def decorator_worker(self, target):
+        self._worker_names.add(target.__name__)
+        return target
+
 _AutoReply = _AutoReply()
 autoreply =_AutoReply.decorator_autoreply
 noreply = _AutoReply.decorator_noreply
+worker = _AutoReply.decorator_worker
 
 ######## MicroPython don't support metaclasses. ###
 ####class _ServiceMeta(type):
@@ -286,6 +890,7 @@ class ServiceBase(object):
     ####__metaclass__ = _ServiceMeta
 
     _autoreply_names = set()
+    _worker_names = set()
 
     def __call__(self, port):
         return self
@@ -293,10 +898,25 @@ class ServiceBase(object):
     # mipc_ prefixed methods are reserved for internal.
 
     def mipc_negotiate(self, port, msg):
-        port.send(['mipc_negotiate_reply', True, list(self._autoreply_names)])
+        ret = list(self._autoreply_names)
+        if len(msg) > 1:			# packers offered by the peer
+            packer = None
+            accepts = port._packer.ACCEPTS
+            for name in msg[1]:
+                if name in accepts:
+                    packer = name
+                    break
+            ret = {'names': ret, 'packer': packer, 'msgid': True,
+                   'inflate': _inflate is not None}
+            port.set_deflate(len(msg) > 2 and msg[2].get('inflate', False))
+        port.send(['mipc_negotiate_reply', True, ret])
 
     def mipc_received(self, port, msg):
         name = msg[0]
+        if isinstance(name, int):		# tagged with message ID
+            port = _TaggedPort(port, name)
+            msg = msg[1:]
+            name = msg[0]
         if hasattr(self, name):
             getattr(self, name)(port, msg)
         else:
@@ -316,34 +936,139 @@ class ServiceBase(object):
     def on_exception(self, port):
         pass
 
+# The poll thread and the workers of config.mipc are started when the first
+# port is registered, so that importing mipc costs no threads.
 class _ServiceManager(object):
     def __init__(self):
         self._poll = mpoll.poll()
         self._ports = {}
+        self._suspended = {}		# fd: entry of _ports taken by suspend
+        self._ports_lock = _thread_getlock()
         self.ip_address = '0.0.0.0'
+        self._queues = []
+        self._pending = {}		# port: [number of jobs, queue]
+        self._pending_lock = _thread_getlock()
+        self._started = False
+
+    def _start(self):
+        with self._pending_lock:
+            if self._started:
+                return
+            self._started = True
+        if _config.workers:
+            self.start_workers(_config.workers, _config.worker_queue or 4)
         _thread_start(self.loop, ())
 
+    # Start n worker threads for handlers decorated by worker. Each worker
+    # has a queue of queue_size jobs. When it is full, the poll thread waits
+    # for a free slot, so that peers are pushed back by the flow control.
+    # Requests on a UDP port are handled with a _PeerPort per peer.
+    def start_workers(self, n, queue_size=4):
+        cores = getattr(_thread, 'CPU_CORES', 0)
+        for i in range(n):
+            queue = _Queue(queue_size)
+            self._queues.append(queue)
+            if cores:
+                _thread_start(self._worker_loop, (queue,), cpu_id=i % cores)
+            else:
+                _thread_start(self._worker_loop, (queue,))
+
     def register_server(self, addr, service_object, packer=None):
         if isinstance(addr, int):
             addr = (self.ip_address, addr)
         port = AcceptablePort(addr, packer=packer)
         self.register(port, service_object)
 
+    # _ports and the poll registration change together under _ports_lock,
+    # as workers suspend and resume ports while the poll thread runs.
     def register(self, port, service_object):
+        if not self._started:
+            self._start()
         fd = port.socket.fileno()
-        self._poll.register(port.socket, mpoll.POLLIN)
-        self._ports[fd] = (port, service_object)
+        with self._ports_lock:
+            self._ports[fd] = (port, service_object)
+            self._poll.register(port.socket, mpoll.POLLIN)
 
     def unregister(self, port):
         fd = port.socket.fileno()
-        self._poll.unregister(port.socket)
-        if fd in self._ports:
-            del self._ports[fd]
+        with self._ports_lock:
+            if self._ports.pop(fd, None):
+                self._poll.unregister(port.socket)
+            else:
+                self._suspended.pop(fd, None)
+
+    # Stop polling port while a handler reads raw data from it. Pass the
+    # returned value to resume. A port unregistered (closed) meanwhile is
+    # not polled again.
+    def suspend(self, port):
+        fd = port.socket.fileno()
+        with self._ports_lock:
+            entry = self._ports.pop(fd, None)
+            if entry:
+                self._poll.unregister(port.socket)
+                self._suspended[fd] = entry
+        return entry
+
+    def resume(self, entry):
+        if not entry:
+            return
+        port = entry[0]
+        fd = port.socket.fileno()
+        with self._ports_lock:
+            if self._suspended.get(fd) is entry:
+                del self._suspended[fd]
+                self._ports[fd] = entry
+                self._poll.register(port.socket, mpoll.POLLIN)
+
+    # Return the queue of the worker which handles msg (None: closing the
+    # port) or None to handle it on the poll thread. While any job of the
+    # port (or the peer of a UDP port) is pending, all following messages
+    # go to the same worker to keep the order of them.
+    def _worker_queue(self, port, service_object, msg):
+        if not self._queues:
+            return None
+        key = port.peer if isinstance(port, _PeerPort) else port
+        with self._pending_lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                if msg is None:
+                    return None
+                name = msg[1] if isinstance(msg[0], int) else msg[0]
+                if name not in service_object._worker_names:
+                    return None
+                queue = self._queues[0]
+                for q in self._queues:
+                    if len(q) < len(queue):
+                        queue = q
+                pending = self._pending[key] = [0, queue]
+            pending[0] += 1
+            return pending[1]
+
+    def _worker_loop(self, queue):
+        while True:
+            port, func, arg = queue.get()
+            try:
+                func(port, arg)
+            except Exception as e:
+                _print_exception(e)
+            key = port.peer if isinstance(port, _PeerPort) else port
+            with self._pending_lock:
+                pending = self._pending[key]
+                pending[0] -= 1
+                if pending[0] == 0:
+                    del self._pending[key]
+
+    @staticmethod
+    def _close_port(port, on_close):
+        on_close(port)
+        port.close()
 
     def _inner_loop(self):
         for fobj, flag in self._poll.ipoll():
-            fd = fobj.fileno()
-            port, service_object = self._ports[fd]
+            entry = self._ports.get(fobj.fileno())
+            if entry is None:		# unregistered by another thread
+                continue
+            port, service_object = entry
             if port.acceptable:
                 newport = None
                 try:
@@ -357,18 +1082,31 @@ class _ServiceManager(object):
                         self.unregister(newport)
                         newport.close()
             else:
+                on_close = None
                 try:
                     msg = port.recv()
-                    service_object.mipc_received(port, msg)
+                    while msg is not None:	# None: no message yet (rudp)
+                        peer = port
+                        if isinstance(port._packer, UDPDumpPackerBase):
+                            peer = _PeerPort(port, port._packer)
+                        queue = self._worker_queue(peer, service_object, msg)
+                        if queue is None:
+                            service_object.mipc_received(peer, msg)
+                        else:
+                            queue.put((peer, service_object.mipc_received, msg))
+                        msg = port.recv() if port.buffered else None
                 except SocketClosed as e:
-                    self.unregister(port)
-                    service_object.on_disconnected(port)
-                    port.close()
+                    on_close = service_object.on_disconnected
                 except Exception as e:
                     _print_exception(e)
+                    on_close = service_object.on_exception
+                if on_close:
                     self.unregister(port)
-                    service_object.on_exception(port)
-                    port.close()
+                    queue = self._worker_queue(port, service_object, None)
+                    if queue is None:
+                        self._close_port(port, on_close)
+                    else:
+                        queue.put((port, self._close_port, on_close))
 
     def loop(self):
         while True:
@@ -376,5 +1114,7 @@ class _ServiceManager(object):
                 self._inner_loop()
             except KeyboardInterrupt:
                 pass
+            except Exception as e:
+                _print_exception(e)
 
 manager = _ServiceManager()
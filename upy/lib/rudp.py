@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+# Reliable datagram port for mipc.
+#
+# A message is sent as datagrams of at most DGRAM_SIZE bytes, each with a
+# header
+#
+#   flags:B  sid:I  seq:I  ack:I  sack:I
+#
+# sid identifies a client session. seq numbers the datagrams of a side
+# (from 1), ack is the next seq expected from the peer and bit i of sack
+# tells that seq ack+1+i has been received (selective ack). A DATA datagram
+# carries a fragment of a message, MORE is set on all fragments but the
+# last one. Received data is acknowledged at once, on a datagram being sent
+# anyway if there is one. Up to WINDOW datagrams are unacknowledged, later
+# ones wait in a queue. Duplicates are dropped and messages are delivered
+# in order.
+#
+# The side waiting for a message (client) drives the timers: an
+# unacknowledged datagram is retransmitted when its RTO is expired (RTT is
+# estimated as RFC 6298, backed off per retransmission), and when nothing is
+# unacknowledged a PROBE is sent so that the peer acknowledges and resends
+# its datagrams lost on the way back. A server only reacts to datagrams, so
+# it runs on the poll thread of mipc.manager as other ports.
+#
+#   port = rudp.client(('192.168.0.10', 2002))		# IOPort
+#   mipc.manager.register(rudp.server(2002), VSRfsService(root))
+
+import socket
+import struct
+import time
+
+import mipc
+
+
+#----------------------------------------------------------------------------
+#                        machine dependent functions
+#----------------------------------------------------------------------------
+
+#### milliseconds timer
+if hasattr(time, 'ticks_ms'):
+    _ticks_ms = time.ticks_ms
+    _ticks_diff = time.ticks_diff
+else:
+    def _ticks_ms():
+        return int(time.time() * 1000)
+
+    def _ticks_diff(a, b):
+        return a - b
+
+#### session ID
+try:
+    from urandom import getrandbits as _getrandbits
+except ImportError:
+    from random import getrandbits as _getrandbits
+
+
+#----------------------------------------------------------------------------
+#                                 channel
+#----------------------------------------------------------------------------
+
+DGRAM_SIZE = mipc.UDPDumpPackerBase.MAXLEN
+WINDOW = 8
+RTO_INIT = 500			# ms
+RTO_MIN = 20
+RTO_MAX = 4000
+MAX_SILENT = 6			# timeouts without any datagram from the peer
+
+_HEADER = '>BIIII'
+_HEADER_SIZE = 17
+_PAYLOAD_SIZE = DGRAM_SIZE - _HEADER_SIZE
+
+_DATA = 0x01
+_MORE = 0x02
+_PROBE = 0x04
+_FIN = 0x08
+
+# State of a session with a peer.
+class _Channel(object):
+
+    def __init__(self, sock, addr, sid):
+        self._sock = sock
+        self._addr = addr
+        self.sid = sid
+        self._seq = 1			# seq of the next datagram
+        self._unacked = {}		# seq: [flags, payload, sent ticks, count]
+        self._queue = []		# (seq, flags, payload) out of the window
+        self._expect = 1		# next seq from the peer
+        self._received = {}		# seq: (flags, payload) out of order
+        self._fragments = []
+        self._srtt = 0
+        self._rttvar = 0
+        self._rto = RTO_INIT
+        self._silent = 0
+        self._probe_at = None
+        self.last_recv = _ticks_ms()
+        self.n_sent = 0
+        self.n_retransmit = 0
+
+    def _send(self, flags, seq, payload=b''):
+        ack = self._expect
+        sack = 0
+        for s in self._received:
+            if s - ack - 1 < 32:
+                sack |= 1 << (s - ack - 1)
+        header = struct.pack(_HEADER, flags, self.sid, seq, ack, sack)
+        self._sock.sendto(header + payload, self._addr)
+        self.n_sent += 1
+
+    def _transmit(self, now):
+        n = 0
+        while self._queue and len(self._unacked) < WINDOW:
+            seq, flags, payload = self._queue.pop(0)
+            self._unacked[seq] = [flags, payload, now, 1]
+            self._send(flags, seq, payload)
+            n += 1
+        return n
+
+    def _retransmit(self, seq, ent, now):
+        ent[2] = now
+        ent[3] += 1
+        self._send(ent[0], seq, ent[1])
+        self.n_retransmit += 1
+
+    def _rtt_sample(self, rtt):
+        if not self._srtt:
+            self._srtt = rtt
+            self._rttvar = rtt // 2
+        else:
+            self._rttvar += (abs(self._srtt - rtt) - self._rttvar) // 4
+            self._srtt += (rtt - self._srtt) // 8
+        self._rto = min(max(self._srtt + 4 * self._rttvar, RTO_MIN), RTO_MAX)
+
+    # Drop datagrams acknowledged by the peer, and retransmit ones which
+    # are not while later ones are (lost on the way). A datagram is fast
+    # retransmitted after SRTT, again after RTO.
+    def _on_ack(self, ack, sack, now):
+        unacked = self._unacked
+        top = 0
+        for seq in list(unacked):
+            if seq < ack or (seq > ack and seq - ack - 1 < 32 and
+                             (sack >> (seq - ack - 1)) & 1):
+                ent = unacked.pop(seq)
+                if ent[3] == 1:		# Karn's algorithm
+                    self._rtt_sample(_ticks_diff(now, ent[2]))
+                if seq > top:
+                    top = seq
+        n = 0
+        for seq, ent in unacked.items():
+            wait = self._srtt if ent[3] == 1 else self._rto
+            if seq < top and _ticks_diff(now, ent[2]) >= wait:
+                self._retransmit(seq, ent, now)
+                n += 1
+        return n
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def send_message(self, data):
+        mv = memoryview(data)
+        for i in range(0, max(len(mv), 1), _PAYLOAD_SIZE):
+            payload = bytes(mv[i:i + _PAYLOAD_SIZE])
+            flags = _DATA | (_MORE if i + _PAYLOAD_SIZE < len(mv) else 0)
+            self._queue.append((self._seq, flags, payload))
+            self._seq += 1
+        self._transmit(_ticks_ms())
+
+    def close(self):
+        self._send(_FIN, 0)
+
+    # Process a datagram from the peer and return the list of messages
+    # completed by it. None is returned for FIN.
+    def on_datagram(self, data, now):
+        flags, sid, seq, ack, sack = struct.unpack_from(_HEADER, data)
+        self.last_recv = now
+        self._silent = 0
+        self._probe_at = None
+        if flags & _FIN:
+            return None
+        n = self._on_ack(ack, sack, now)
+        msgs = []
+        if flags & _DATA:
+            if seq >= self._expect and seq not in self._received:
+                self._received[seq] = (flags, data[_HEADER_SIZE:])
+                while self._expect in self._received:
+                    f, payload = self._received.pop(self._expect)
+                    self._expect += 1
+                    self._fragments.append(payload)
+                    if not f & _MORE:
+                        msgs.append(b''.join(self._fragments))
+                        self._fragments = []
+        if flags & _PROBE:
+            for s, ent in self._unacked.items():
+                if _ticks_diff(now, ent[2]) >= self._srtt:
+                    self._retransmit(s, ent, now)
+                    n += 1
+        n += self._transmit(now)
+        if flags & (_DATA | _PROBE) and not n:
+            self._send(0, 0)		# ack only
+        return msgs
+
+    # milliseconds until the next timer of a waiting side
+    def timeout(self, now):
+        if self._unacked:
+            t = None
+            for ent in self._unacked.values():
+                d = min(self._rto << (ent[3] - 1), RTO_MAX) - _ticks_diff(now, ent[2])
+                if t is None or d < t:
+                    t = d
+            return t
+        if self._probe_at is None:
+            self._probe_at = now
+        return min(self._rto << self._silent, RTO_MAX) - _ticks_diff(now, self._probe_at)
+
+    def on_timeout(self, now):
+        self._silent += 1
+        if self._silent > MAX_SILENT:
+            raise mipc.PortError('no response from %s' % (self._addr,))
+        if self._unacked:
+            for seq, ent in self._unacked.items():
+                if _ticks_diff(now, ent[2]) >= min(self._rto << (ent[3] - 1), RTO_MAX):
+                    self._retransmit(seq, ent, now)
+        else:
+            self._send(_PROBE, 0)
+            self._probe_at = now
+
+
+#----------------------------------------------------------------------------
+#                                  port
+#----------------------------------------------------------------------------
+
+# Messages are not limited by a datagram. MAXLEN limits a message.
+class ReliableMsgPacker(mipc.UDPMsgPacker):
+    MAXLEN = 16 * 1024
+    ACCEPTS = ('msgpack',)
+
+class ReliableUDPPort(mipc.IOPort):
+
+    MAX_CHANNELS = 64
+
+    def __init__(self, sock, addr=None):
+        mipc.IOPort.__init__(self, sock=sock, packer=ReliableMsgPacker())
+        self._ready = []		# (addr, message data)
+        self._channels = {}		# (server) addr: _Channel
+        self._channel = None		# (client)
+        if addr:
+            self._channel = _Channel(sock, addr, _getrandbits(32) or 1)
+
+    @property
+    def buffered(self):
+        return bool(self._ready)
+
+    def set_packer(self, name):
+        if name != self._packer.NAME:
+            raise mipc.PortError('%s is not supported.' % name)
+
+    def _send_udp(self, msg):
+        self._event = msg[0]
+        data, n = self._packer.pack(msg)
+        self._sendto(data, self._packer.recv_addr)
+        return self
+
+    def _sendto(self, data, addr):
+        ch = self._channel
+        with self._lock:
+            if ch is None:
+                ch = self._channels.get(addr)
+                if ch is None:
+                    return		# peer has gone
+            ch.send_message(data)
+        if self._channel:
+            while ch.queued:		# wait for the window
+                self._pump()
+
+    def recv(self):
+        while not self._ready:
+            if self._channel is None:
+                self._recv_datagram()
+                if not self._ready:
+                    return None
+            else:
+                self._pump()
+        addr, data = self._ready.pop(0)
+        self._packer.recv_addr = addr
+        return self._packer.loads(data)
+
+    def _recv_datagram(self):
+        data, addr = self.socket.recvfrom(DGRAM_SIZE)
+        if len(data) < _HEADER_SIZE:
+            return
+        now = _ticks_ms()
+        with self._lock:
+            ch = self._channel
+            if ch is None:
+                ch = self._server_channel(data, addr)
+            elif struct.unpack_from('>I', data, 1)[0] != ch.sid:
+                return
+            msgs = ch.on_datagram(data, now)
+            if msgs is None:
+                self._channels.pop(addr, None)
+                return
+        for msg in msgs:
+            self._ready.append((addr, msg))
+
+    def _server_channel(self, data, addr):
+        sid = struct.unpack_from('>I', data, 1)[0]
+        ch = self._channels.get(addr)
+        if ch is None or ch.sid != sid:	# new session
+            if len(self._channels) >= self.MAX_CHANNELS:
+                old = min(self._channels.items(), key=lambda kv: kv[1].last_recv)
+                del self._channels[old[0]]
+            ch = self._channels[addr] = _Channel(self.socket, addr, sid)
+        return ch
+
+    # Receive a datagram or handle a timer (client).
+    def _pump(self):
+        ch = self._channel
+        t = ch.timeout(_ticks_ms())
+        if t <= 0:
+            with self._lock:
+                ch.on_timeout(_ticks_ms())
+            return
+        self.socket.settimeout(t / 1000)
+        try:
+            self._recv_datagram()
+        except OSError:		# timeout
+            pass
+
+    def close(self):
+        if self.socket and self._channel:
+            try:
+                self._channel.close()
+            except OSError:
+                pass
+        mipc.IOPort.close(self)
+
+def client(addr, negotiation=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = [ai[-1] for ai in socket.getaddrinfo(addr[0], addr[1])
+            if ai[0] == socket.AF_INET][0]
+    port = ReliableUDPPort(sock, addr)
+    if negotiation:
+        return port.set_negotiation(negotiation)
+    return port.negotiate([ReliableMsgPacker.NAME])
+
+def server(addr):
+    if isinstance(addr, int):
+        addr = ('0.0.0.0', addr)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(addr)
+    return ReliableUDPPort(sock)
@@ -4,6 +4,7 @@ import spi
 import sys
 import time
 from display import *
+from display import _no_batch
 from config.ssd1331 import config
 
 
@@ -11,8 +12,31 @@ from config.ssd1331 import config
 #                              display driver
 #----------------------------------------------------------------------------
 
+# A batch of the driver (with driver.batch(): ...) keeps CS low and queues
+# the commands in a buffer, which is written when pixels are sent (D/C
+# changes), the buffer is full or the batch ends. Batches nest.
+
+class _Batch(object):
+
+    def __init__(self, driver):
+        self._driver = driver
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._driver._begin_batch()
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            self._driver._end_batch()
+
 class SSD1331(object):
 
+    QUEUE_b = 256		# command bytes of a batch written at once
+
     WIDTH = 96
     HEIGHT = 64
 
@@ -38,6 +62,16 @@ class SSD1331(object):
             self._disp_sw = machine.Pin(36, machine.Pin.IN, machine.Pin.PULL_DOWN)
             self._disp_sw.irq(self._toggle_display, machine.Pin.IRQ_FALLING)
         self._RMCD = 0
+        self.fill_enabled = False
+        self.reverse_in_copy = False
+
+        # command batch
+        self.batching = config.get('batch', True)
+        self._batch = _Batch(self)
+        self._queue = bytearray(self.QUEUE_b)
+        self._queue_mv = memoryview(self._queue)
+        self._queued = 0
+        self._dc_level = None
 
         # for performance
         self._spi_write = self._spi.write
@@ -71,6 +105,47 @@ class SSD1331(object):
         self._spi_write(memoryview(buf)[:size])
         self._cs_value(1)
 
+    def batch(self):
+        if self.batching:
+            return self._batch
+        return _no_batch
+
+    def _begin_batch(self):
+        self._cs_value(0)
+        self._dc_level = None
+        self.command = self._queue_command
+        self.send_pixels = self._queue_pixels
+
+    def _end_batch(self):
+        self._write_queue()
+        self.command = self._command
+        self.send_pixels = self._send_pixels
+        self._cs_value(1)
+
+    def _write_queue(self):
+        n = self._queued
+        if n:
+            if self._dc_level != 0:
+                self._dc_level = 0
+                self._dc_value(0)
+            self._spi_write(self._queue_mv[:n])
+            self._queued = 0
+
+    def _queue_command(self, buf, size):
+        n = self._queued
+        if n + size > self.QUEUE_b:
+            self._write_queue()
+            n = 0
+        self._queue_mv[n:n+size] = memoryview(buf)[:size]
+        self._queued = n + size
+
+    def _queue_pixels(self, buf, size):
+        self._write_queue()
+        if self._dc_level != 1:
+            self._dc_level = 1
+            self._dc_value(1)
+        self._spi_write(memoryview(buf)[:size])
+
     # support methods
 
     def _pixel_256(self, r, g, b):
@@ -138,7 +213,18 @@ class SSD1331(object):
         b[1] = start
         b[2] = end
         self.command(b, 3)
-        
+
+    # column and row addresses in a command
+    def set_window(self, col_start, row_start, col_end, row_end):
+        b = self._buf
+        b[0] = 0x15
+        b[1] = col_start
+        b[2] = col_end
+        b[3] = 0x75
+        b[4] = row_start
+        b[5] = row_end
+        self.command(b, 6)
+
     def set_contrast_A(self, contrast=128):
         b = self._buf
         b[0] = 0x81
@@ -386,6 +472,8 @@ class SSD1331(object):
         self.command(b, 5)
 
     def enable_fill(self, enable_fill=True, enable_reverse_in_copy=False):
+        self.fill_enabled = bool(enable_fill)
+        self.reverse_in_copy = bool(enable_reverse_in_copy)
         b = self._buf
         b[0] = 0x26
         b[1] = (int(bool(enable_reverse_in_copy))<<4)|int(bool(enable_fill))
@@ -442,13 +530,260 @@ def vspi(pinnum_dc=None, pinnum_rst=None, pinnum_cs=None):
     return disp
 
 
+#----------------------------------------------------------------------------
+#                               framebuffer
+#----------------------------------------------------------------------------
+
+# RAM image of the display in 65k colors (color_format 1, 2 bytes a pixel).
+# Drawing is done in the memory, and the changed columns of each row are
+# tracked (lines mark only the pixels which change). flush groups the rows
+# into rectangles, and sends each by a window command and its rows in as few
+# writes as the scratch buffer allows (a full width rectangle is a write).
+
+# Lines drawn by line(rgb=...) since the last flush are kept while nothing
+# else was drawn, and flush sends them as draw line commands when that is
+# fewer bytes than the pixels of the dirty rectangles: the pixels of sparse
+# lines (e.g. the sweeps of a radar) span thin, tall rectangles.
+class FrameBuffer(object):
+
+    MERGE_SLACK = 32		# pixels to send more to save a window command
+    SCRATCH_b = 1024		# rows of a narrow rectangle
+    WINDOW_b = 6		# column and row address commands
+    LINE_b = 8			# a draw line command
+
+    def __init__(self, driver):
+        if len(driver.pixel(0, 0, 0)) != 2:
+            raise ValueError('framebuffer needs color_format 1')
+        self._driver = driver
+        self.WIDTH = driver.WIDTH
+        self.HEIGHT = driver.HEIGHT
+        self._stride = self.WIDTH * 2
+        self.buf = bytearray(self._stride * self.HEIGHT)
+        self._scratch = None
+        # changed columns of the rows, from _dirty_beg to _dirty_end
+        self._dirty_beg = array.array('h', (self.WIDTH for _ in range(self.HEIGHT)))
+        self._dirty_end = array.array('h', (-1 for _ in range(self.HEIGHT)))
+        self._lines = []	# draw line arguments, or None
+
+    def _clip(self, col_start, row_start, col_end, row_end):
+        if col_start > col_end:
+            col_start, col_end = col_end, col_start
+        if row_start > row_end:
+            row_start, row_end = row_end, row_start
+        col_start = max(col_start, 0)
+        row_start = max(row_start, 0)
+        col_end = min(col_end, self.WIDTH - 1)
+        row_end = min(row_end, self.HEIGHT - 1)
+        if col_start > col_end or row_start > row_end:
+            return None
+        return (col_start, row_start, col_end, row_end)
+
+    def mark_dirty(self, col_start, row_start, col_end, row_end):
+        self._lines = None
+        self._mark_dirty(col_start, row_start, col_end, row_end)
+
+    def _mark_dirty(self, col_start, row_start, col_end, row_end):
+        beg = self._dirty_beg
+        end = self._dirty_end
+        for r in range(row_start, row_end + 1):
+            if col_start < beg[r]:
+                beg[r] = col_start
+            if col_end > end[r]:
+                end[r] = col_end
+
+    # rectangles to send: a row is added to the rectangle above while the
+    # pixels sent more than changed are up to MERGE_SLACK
+    def dirty_rects(self):
+        beg = self._dirty_beg
+        end = self._dirty_end
+        rects = []
+        rect = None
+        for r in range(self.HEIGHT):
+            b, e = beg[r], end[r]
+            if e < 0:
+                continue
+            if rect is not None:
+                c0, r0, c1, r1 = rect
+                u0 = min(c0, b)
+                u1 = max(c1, e)
+                if (u1 - u0 + 1) * (r - r0 + 1) - changed - (e - b + 1) <= self.MERGE_SLACK:
+                    rect = (u0, r0, u1, r)
+                    changed += e - b + 1
+                    continue
+                rects.append(rect)
+            rect = (b, r, e, r)
+            changed = e - b + 1
+        if rect is not None:
+            rects.append(rect)
+        return rects
+
+    def flush(self):
+        driver = self._driver
+        rects = self.dirty_rects()
+        lines = self._lines
+        with driver.batch():
+            if lines and len(lines) * self.LINE_b < sum(
+                    self.WINDOW_b + (c1 - c0 + 1) * (r1 - r0 + 1) * 2
+                    for c0, r0, c1, r1 in rects):
+                draw_line = driver.draw_line
+                for args in lines:
+                    draw_line(*args)
+            else:
+                self._send_rects(driver, rects)
+        beg = self._dirty_beg
+        end = self._dirty_end
+        for r in range(self.HEIGHT):
+            beg[r] = self.WIDTH
+            end[r] = -1
+        self._lines = []
+
+    def _send_rects(self, driver, rects):
+        send_pixels = driver.send_pixels
+        stride = self._stride
+        mv = memoryview(self.buf)
+        for c0, r0, c1, r1 in rects:
+            driver.set_window(c0, r0, c1, r1)
+            if c0 == 0 and c1 == self.WIDTH - 1:
+                send_pixels(mv[r0 * stride:(r1 + 1) * stride],
+                            (r1 - r0 + 1) * stride)
+                continue
+            if self._scratch is None:
+                self._scratch = bytearray(self.SCRATCH_b)
+            scratch = self._scratch
+            w = (c1 - c0 + 1) * 2
+            limit = len(scratch) - w
+            n = 0
+            for r in range(r0, r1 + 1):
+                o = r * stride + c0 * 2
+                scratch[n:n+w] = mv[o:o+w]
+                n += w
+                if n > limit:
+                    send_pixels(scratch, n)
+                    n = 0
+            if n:
+                send_pixels(scratch, n)
+
+    # drawing in the memory: pixel is 2 bytes of the driver's pixel()
+
+    def fill(self, col_start, row_start, col_end, row_end, pixel, dirty=True):
+        self._lines = None
+        self._fill(col_start, row_start, col_end, row_end, pixel, dirty)
+
+    def _fill(self, col_start, row_start, col_end, row_end, pixel, dirty):
+        area = self._clip(col_start, row_start, col_end, row_end)
+        if area is None:
+            return
+        c0, r0, c1, r1 = area
+        buf = self.buf
+        stride = self._stride
+        span = bytes(pixel) * (c1 - c0 + 1)
+        w = len(span)
+        o = r0 * stride + c0 * 2
+        for _ in range(r1 - r0 + 1):
+            buf[o:o+w] = span
+            o += stride
+        if dirty:
+            self._mark_dirty(c0, r0, c1, r1)
+
+    # rgb: the color of the draw line command to send it by (see flush)
+    def line(self, col_start, row_start, col_end, row_end, pixel, rgb=None):
+        lines = self._lines
+        if lines is not None:
+            area = (min(col_start, col_end), min(row_start, row_end),
+                    max(col_start, col_end), max(row_start, row_end))
+            if rgb and self._clip(*area) == area:
+                lines.append((col_start, row_start, col_end, row_end) + rgb)
+            else:
+                self._lines = None	# out of the display
+        if col_start == col_end or row_start == row_end:
+            return self._fill(col_start, row_start, col_end, row_end, pixel, True)
+        hi, lo = pixel[0], pixel[1]
+        buf = self.buf
+        stride = self._stride
+        beg = self._dirty_beg
+        end = self._dirty_end
+        w, h = self.WIDTH, self.HEIGHT
+        c, r = col_start, row_start
+        dc = abs(col_end - c)
+        dr = -abs(row_end - r)
+        sc = 1 if c < col_end else -1
+        sr = 1 if r < row_end else -1
+        err = dc + dr
+        while True:
+            if 0 <= c < w and 0 <= r < h:
+                o = r * stride + c * 2
+                if buf[o] != hi or buf[o+1] != lo:
+                    buf[o] = hi
+                    buf[o+1] = lo
+                    if c < beg[r]:
+                        beg[r] = c
+                    if c > end[r]:
+                        end[r] = c
+            if c == col_end and r == row_end:
+                break
+            e2 = 2 * err
+            if e2 >= dr:
+                err += dr
+                c += sc
+            if e2 <= dc:
+                err += dc
+                r += sr
+
+    def rect(self, col_start, row_start, col_end, row_end, line_pixel,
+             fill_pixel=None):
+        if fill_pixel is not None:
+            self.fill(col_start, row_start, col_end, row_end, fill_pixel)
+        self.fill(col_start, row_start, col_end, row_start, line_pixel)
+        self.fill(col_start, row_end, col_end, row_end, line_pixel)
+        self.fill(col_start, row_start, col_start, row_end, line_pixel)
+        self.fill(col_end, row_start, col_end, row_end, line_pixel)
+
+    # w x h pixels of src (rows of w*2 bytes) at col, row
+    def blit(self, col, row, w, h, src):
+        area = self._clip(col, row, col + w - 1, row + h - 1)
+        if area is None:
+            return
+        c0, r0, c1, r1 = area
+        buf = self.buf
+        stride = self._stride
+        n = (c1 - c0 + 1) * 2
+        s = (r0 - row) * w * 2 + (c0 - col) * 2
+        o = r0 * stride + c0 * 2
+        for _ in range(r1 - r0 + 1):
+            buf[o:o+n] = src[s:s+n]
+            s += w * 2
+            o += stride
+        self.mark_dirty(c0, r0, c1, r1)
+
+    # copy in the memory, for the copy command of the display
+    def copy(self, col_start, row_start, col_end, row_end,
+             new_col_start, new_row_start):
+        self._lines = None
+        buf = self.buf
+        stride = self._stride
+        n = (col_end - col_start + 1) * 2
+        rows = range(row_end - row_start + 1)
+        if new_row_start > row_start:
+            rows = reversed(rows)
+        for i in rows:
+            s = (row_start + i) * stride + col_start * 2
+            o = (new_row_start + i) * stride + new_col_start * 2
+            buf[o:o+n] = buf[s:s+n]
+
+
 #----------------------------------------------------------------------------
 #                              display adaptor
 #----------------------------------------------------------------------------
 
+# With framebuffer (None: config.framebuffer), drawing is done in a
+# FrameBuffer and sent by flush. clear and copy are done both by the display
+# commands and in the memory, so that they send nothing more.
+
 class Adaptor(AdaptorBase):
 
-    def __new__(cls, driver, fcf=False, gcf=False):
+    hw_scroll = True
+
+    def __new__(cls, driver, fcf=False, gcf=False, framebuffer=None):
         if sys.implementation.name == 'micropython':
             # Whene super class is not object, super().__new__ seems to be
             # bound method in the MicroPython.
@@ -467,6 +802,21 @@ class Adaptor(AdaptorBase):
         self.pixel = driver.pixel
         self.clear = driver.clear
         self.copy = driver.copy
+        self.batch = driver.batch
+
+        if framebuffer is None:
+            framebuffer = config.framebuffer
+        self._fb = None
+        if framebuffer:
+            self._fb = FrameBuffer(driver)
+            self.clear = self._fb_clear
+            self.copy = self._fb_copy
+            self.flush = self._fb.flush
+            self.draw_image = self._fb_draw_image
+            self.draw_line = self._fb_draw_line
+            self.draw_rect = self._fb_draw_rect
+            self.fcf_put = self._fb_fcf_put
+            self.gcf_put = self._fb_gcf_put
 
         return self
 
@@ -480,11 +830,15 @@ class Adaptor(AdaptorBase):
     def display_off(self):
         self._driver.set_display_off()
 
+    def set_start_line(self, row):
+        self._driver.set_display_start_line(row)
+
     def draw_image(self, col, row, img):
         driver = self._driver
-        driver.set_column_address(start=col, end=col+img.w-1)
-        driver.set_row_address(start=row)
-        driver.send_pixels(img.buf, len(img.buf))
+        with driver.batch():
+            driver.set_column_address(start=col, end=col+img.w-1)
+            driver.set_row_address(start=row)
+            driver.send_pixels(img.buf, len(img.buf))
 
     def draw_line(self,
                   col_start, row_start,
@@ -501,18 +855,13 @@ class Adaptor(AdaptorBase):
                   col_end, row_end,
                   line_color=None,
                   fill_color=None):
-        def listing():
-            if line_color is None:
-                line_color = self.line_color
-            for c in line_color.rgb:
-                yield c
-            if fill_color is None:
-                fill_color = self.fill_color
-            for c in fill_color.rgb:
-                yield c
+        if line_color is None:
+            line_color = self.line_color
+        if fill_color is None:
+            fill_color = self.fill_color
         return self._driver.draw_rectangle(col_start, row_start,
                                            col_end, row_end,
-                                           *listing())
+                                           *(line_color.rgb + fill_color.rgb))
 
     def fcf_change_color(self, fg_pixel, bg_pixel):
         return self.fcf.change_color(fg_pixel, bg_pixel)
@@ -526,13 +875,14 @@ class Adaptor(AdaptorBase):
         driver = self._driver
         set_column_address = driver.set_column_address
         set_row_address = driver.set_row_address
-        send_pixels = driver.send_pixels
 
-        for c in chars:
-            set_column_address(start=col, end=col+w-1)
-            set_row_address(start=row, end=row+h-1)
-            send_pixels(*pixels(c))
-            col += w
+        with driver.batch():
+            send_pixels = driver.send_pixels	# of the batch
+            for c in chars:
+                set_column_address(start=col, end=col+w-1)
+                set_row_address(start=row, end=row+h-1)
+                send_pixels(*pixels(c))
+                col += w
         return col
 
     def gcf_put(self, col, row, chars, fg_color=None, spacing=0):
@@ -543,21 +893,119 @@ class Adaptor(AdaptorBase):
         get_line = gcf.get_line
         draw_line = driver.draw_line
 
-        if self.gcf_bg_color:
-            r, g, b = self.gcf_bg_color.rgb
-            driver.draw_rectangle(col, row,
-                                  col+(w*len(chars))-1, row+gcf.HEIGHT-1,
-                                  r, g, b, r, g, b)
+        with driver.batch():
+            if self.gcf_bg_color:
+                r, g, b = self.gcf_bg_color.rgb
+                driver.draw_rectangle(col, row,
+                                      col+(w*len(chars))-1, row+gcf.HEIGHT-1,
+                                      r, g, b, r, g, b)
+
+            if fg_color:
+                r, g, b = fg_color.rgb
+            else:
+                r, g, b = self.gcf_fg_color.rgb
+
+            # filled rectangle strokes turn the fill on, which is restored
+            # for draw_rect of others
+            fill_enabled = driver.fill_enabled
+            try:
+                for c in chars:
+                    for c_beg, r_beg, c_end, r_end in get_line(c):
+                        if c_beg != c_end and r_beg != r_end:
+                            # a filled rectangle stroke
+                            if not driver.fill_enabled:
+                                driver.enable_fill(True, driver.reverse_in_copy)
+                            driver.draw_rectangle(col+c_beg, row+r_beg,
+                                                  col+c_end, row+r_end,
+                                                  r, g, b, r, g, b)
+                        else:
+                            draw_line(col+c_beg, row+r_beg,
+                                      col+c_end, row+r_end,
+                                      r, g, b)
+                    col += w
+            finally:
+                if driver.fill_enabled != fill_enabled:
+                    driver.enable_fill(fill_enabled, driver.reverse_in_copy)
+        return col
 
-        if fg_color:
-            r, g, b = fg_color.rgb
-        else:
-            r, g, b = self.gcf_fg_color.rgb
+    # framebuffer mode
+
+    def _fb_pixel(self, color):
+        return bytes(self._driver.pixel(*color.rgb))
+
+    def _fb_clear(self,
+                  col_start=0, row_start=0,
+                  col_end=95, row_end=63):
+        self._fb.fill(col_start, row_start, col_end, row_end, b'\0\0', False)
+        self._driver.clear(col_start, row_start, col_end, row_end)
+
+    def _fb_copy(self,
+                 col_start, row_start,
+                 col_end, row_end,
+                 new_col_start, new_row_start):
+        self._fb.flush()		# the display copies what it shows
+        self._driver.copy(col_start, row_start, col_end, row_end,
+                          new_col_start, new_row_start)
+        self._fb.copy(col_start, row_start, col_end, row_end,
+                      new_col_start, new_row_start)
+
+    def _fb_draw_image(self, col, row, img):
+        self._fb.blit(col, row, img.w, img.h, img.buf)
+
+    def _fb_draw_line(self,
+                      col_start, row_start,
+                      col_end, row_end,
+                      line_color=None):
+        if line_color is None:
+            line_color = self.line_color
+        self._fb.line(col_start, row_start, col_end, row_end,
+                      self._fb_pixel(line_color), line_color.rgb)
+
+    def _fb_draw_rect(self,
+                      col_start, row_start,
+                      col_end, row_end,
+                      line_color=None,
+                      fill_color=None):
+        if line_color is None:
+            line_color = self.line_color
+        fill_pixel = None
+        if self._driver.fill_enabled:
+            if fill_color is None:
+                fill_color = self.fill_color
+            fill_pixel = self._fb_pixel(fill_color)
+        self._fb.rect(col_start, row_start, col_end, row_end,
+                      self._fb_pixel(line_color), fill_pixel)
+
+    def _fb_fcf_put(self, col, row, chars, spacing=0):
+        fcf = self.fcf
+        w = fcf.WIDTH + spacing
+        fw = fcf.WIDTH
+        h = fcf.HEIGHT
+        pixels = fcf.pixels
+        blit = self._fb.blit
+        for c in chars:
+            blit(col, row, fw, h, pixels(c)[0])
+            col += w
+        return col
+
+    def _fb_gcf_put(self, col, row, chars, fg_color=None, spacing=0):
+        gcf = self.gcf
+        w = gcf.WIDTH + spacing
+        fb = self._fb
+        get_line = gcf.get_line
+
+        if self.gcf_bg_color:
+            fb.fill(col, row, col+(w*len(chars))-1, row+gcf.HEIGHT-1,
+                    self._fb_pixel(self.gcf_bg_color))
 
+        pixel = self._fb_pixel(fg_color or self.gcf_fg_color)
+        line = fb.line
+        fill = fb.fill
         for c in chars:
             for c_beg, r_beg, c_end, r_end in get_line(c):
-                draw_line(col+c_beg, row+r_beg,
-                          col+c_end, row+r_end,
-                          r, g, b)
+                if c_beg != c_end and r_beg != r_end:
+                    fill(col+c_beg, row+r_beg, col+c_end, row+r_end, pixel)
+                else:
+                    line(col+c_beg, row+r_beg, col+c_end, row+r_end, pixel)
             col += w
         return col
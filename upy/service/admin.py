@@ -1,23 +1,69 @@
 import binascii
 import os
+import struct
 import _thread
-import machine
 
 import mipc
 from config.service_admin import config
 
+try:
+    import uhashlib as hashlib
+except ImportError:
+    try:
+        import hashlib
+    except ImportError:
+        hashlib = None
+
+try:
+    import uzlib as zlib
+except ImportError:
+    try:
+        import zlib
+    except ImportError:
+        zlib = None
+
+_STREAM_BUFSIZE = 1024
+_HASH_NAME = 'sha256' if hashlib else 'crc32'
+
+# hex digest of the file, read through buf
+def _file_digest(path, buf):
+    h = hashlib.sha256() if hashlib else None
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            if h:
+                h.update(buf[:n])
+            else:
+                crc = binascii.crc32(buf[:n], crc)
+    if h:
+        return str(binascii.hexlify(h.digest()), 'ascii')
+    return '%08x' % crc
+
 
 @mipc.autoreply
 class AdminService(mipc.ServiceBase):
 
     def __init__(self):
         from display import text_board
+        self._board = text_board
         self._logger = text_board.putline
 
+    # the log lines of a session which wait for a refresh (TextBoard)
+    def on_disconnected(self, port):
+        self._board.refresh()
+
+    def on_exception(self, port):
+        self._board.refresh()
+
     def reset(self, port, msg):
+        import machine
         machine.reset()
 
     @mipc.autoreply
+    @mipc.worker
     def put(self, path, data):
         data = binascii.unhexlify(data)
         with open(path, 'wb') as f:
@@ -31,12 +77,14 @@ class AdminService(mipc.ServiceBase):
         print('put', self._path, 'begin')
 
     @mipc.autoreply
+    @mipc.worker
     def put_data(self, data):
         data = binascii.unhexlify(data)
         self._fobj.write(data)
         print('put', self._path, 'data')
 
     @mipc.autoreply
+    @mipc.worker
     def put_end(self):
         self._fobj.close()
         print('put', self._path, 'end')
@@ -51,6 +99,7 @@ class AdminService(mipc.ServiceBase):
         print('get', self._path, 'begin')
 
     @mipc.autoreply
+    @mipc.worker
     def get_data(self):
         data = self._fobj.read(2048)
         if data:
@@ -62,6 +111,142 @@ class AdminService(mipc.ServiceBase):
         print('get', self._path, 'data')
         return data
 
+    # Streaming transfer
+    #
+    # put_stream(path, size, offset) and get_stream(path, offset) reply
+    # twice. Between the replies, the file data from offset is sent as raw
+    # bytes on the connection through a fixed buffer, and the 2nd reply has
+    # CRC32 of the data. A put with offset > 0 resumes the file of that size.
+    #
+    #   put: -> put_stream, <- reply(None), -> raw data, <- reply(crc)
+    #   get: -> get_stream, <- reply(size), <- raw data, <- reply(crc)
+    #
+    # put_stream(path, size, offset, 'deflate') receives the data as frames
+    # of a compressed size (4 bytes, big endian) and a zlib stream of a chunk.
+    # The CRC is of the decompressed data. The device cannot compress, so
+    # get_stream is always raw.
+
+    @mipc.worker
+    def put_stream(self, port, msg):
+        path, size, offset = msg[1:4]
+        codec = msg[4] if len(msg) > 4 else None
+        reply = 'put_stream_reply'
+        entry = mipc.manager.suspend(port)
+        try:
+            try:
+                if codec not in (None, 'deflate') or (codec and zlib is None):
+                    raise Exception('%s is not supported.' % codec)
+                if offset:
+                    if os.stat(path)[6] != offset:
+                        raise Exception('%s is not %d bytes.' % (path, offset))
+                    f = open(path, 'ab')
+                else:
+                    f = open(path, 'wb')
+            except Exception as e:
+                port.send([reply, False, str(e)])
+                return
+            print('put', path, 'stream', offset, size, codec or '')
+            port.send([reply, True, None])
+            with f:
+                if codec:
+                    crc = self._recv_deflate(port, f, size - offset)
+                else:
+                    crc = self._recv_raw(port, f, size - offset)
+        finally:
+            mipc.manager.resume(entry)
+        port.send([reply, True, crc])
+        self._logger('%s ... OK' % path)
+
+    @staticmethod
+    def _recv_raw(port, f, rest):
+        crc = 0
+        buf = memoryview(bytearray(_STREAM_BUFSIZE))
+        while rest:
+            mv = buf[:rest] if rest < len(buf) else buf
+            if port.recv_into(mv) != len(mv):
+                raise mipc.SocketUnexpectedClosed()
+            f.write(mv)
+            crc = binascii.crc32(mv, crc)
+            rest -= len(mv)
+        return crc
+
+    @staticmethod
+    def _recv_deflate(port, f, rest):
+        crc = 0
+        hdr = memoryview(bytearray(4))
+        buf = memoryview(bytearray(_STREAM_BUFSIZE))
+        while rest > 0:
+            if port.recv_into(hdr) != 4:
+                raise mipc.SocketUnexpectedClosed()
+            n, = struct.unpack('>I', hdr)
+            if n > len(buf):
+                buf = memoryview(bytearray(n))
+            mv = buf[:n]
+            if port.recv_into(mv) != n:
+                raise mipc.SocketUnexpectedClosed()
+            data = zlib.decompress(mv)
+            f.write(data)
+            crc = binascii.crc32(data, crc)
+            rest -= len(data)
+        return crc
+
+    @mipc.worker
+    def get_stream(self, port, msg):
+        path, offset = msg[1:]
+        reply = 'get_stream_reply'
+        try:
+            size = os.stat(path)[6]
+            f = open(path, 'rb')
+        except Exception as e:
+            port.send([reply, False, str(e)])
+            return
+        print('get', path, 'stream', offset, size)
+        port.send([reply, True, size])
+        crc = 0
+        buf = memoryview(bytearray(_STREAM_BUFSIZE))
+        with f:
+            f.seek(offset)
+            rest = size - offset
+            while rest:
+                mv = buf[:rest] if rest < len(buf) else buf
+                if f.readinto(mv) != len(mv):
+                    raise Exception('%s is truncated.' % path)
+                port.send_raw(mv)
+                crc = binascii.crc32(mv, crc)
+                rest -= len(mv)
+        port.send([reply, True, crc])
+
+    @mipc.autoreply
+    def filesize(self, path):
+        try:
+            return os.stat(path)[6]
+        except OSError:
+            return -1
+
+    # Return directories and files under path (relative to it) with size and
+    # hex digest of files for espadm sync. Files are hashed one by one
+    # through a fixed buffer.
+    @mipc.autoreply
+    @mipc.worker
+    def manifest(self, path):
+        buf = memoryview(bytearray(_STREAM_BUFSIZE))
+        dirs = []
+        files = []
+        def scan(rel):
+            top = (path + '/' + rel) if path else rel
+            for name in (os.listdir(top) if top else os.listdir()):
+                rname = (rel + '/' + name) if rel else name
+                fpath = (top + '/' + name) if top else name
+                st = os.stat(fpath)
+                if st[0] & 0x4000:
+                    dirs.append(rname)
+                    scan(rname)
+                else:
+                    files.append([rname, st[6], _file_digest(fpath, buf)])
+        scan('')
+        self._logger('manifest %s' % path)
+        return {'hash': _HASH_NAME, 'dirs': dirs, 'files': files}
+
     @mipc.autoreply
     def mkdir(self, path):
         os.mkdir(path)
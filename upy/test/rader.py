@@ -110,6 +110,7 @@ class Drawer(object):
 
         for y, xb, xe in h_lines():
             draw_line(xb, y, xe, y, RADER_BG_RGB)
+        self._disp.flush()
 
     def set_range(self, min_cm, max_cm):
         self._range_min_cm = min_cm
@@ -119,6 +120,8 @@ class Drawer(object):
         origin_x, origin_y = DISP_W//2, DISP_H-1
         radius = (DISP_W//2 - 1) * 1.414
         draw_line = self._disp.draw_line
+        flush = self._disp.flush
+        batch = self._driver.batch
         min_cm = self._range_min_cm
         max_cm = self._range_max_cm
         r_unit = radius / max_cm
@@ -133,17 +136,19 @@ class Drawer(object):
             else:
                 obj_x = obj_y = None
             points.append((obj_x, obj_y, edge_x, edge_y))
-            px, py = None, None
-            for i, (_, _, ex, ey) in enumerate(points):
-                if ex is not None:
-                    draw_line(ex, ey, origin_x, origin_y, RADER_SENSOR_RGB[i])
-                if px is not None:
-                    draw_line((px+ex)//2, (py+ey)//2, origin_x, origin_y, RADER_SENSOR_RGB[i])
-                px, py = ex, ey
-            for i, (ox, oy, _, _) in enumerate(points):
-                if ox is not None:
-                    draw_line(ox, oy, ox, oy, RADER_OBJECT_RGB[i])
-            points.pop(0)
+            with batch():
+                px, py = None, None
+                for i, (_, _, ex, ey) in enumerate(points):
+                    if ex is not None:
+                        draw_line(ex, ey, origin_x, origin_y, RADER_SENSOR_RGB[i])
+                    if px is not None:
+                        draw_line((px+ex)//2, (py+ey)//2, origin_x, origin_y, RADER_SENSOR_RGB[i])
+                    px, py = ex, ey
+                for i, (ox, oy, _, _) in enumerate(points):
+                    if ox is not None:
+                        draw_line(ox, oy, ox, oy, RADER_OBJECT_RGB[i])
+                points.pop(0)
+                flush()
 
         return update
 
@@ -1,6 +1,7 @@
 import genstream
 import mipc
 import os
+import time
 
 def debug(f):
     def wrapper(*args, **kwargs):
@@ -8,19 +9,185 @@ def debug(f):
         return f(*args, **kwargs)
     return wrapper
 
+try:
+    from config.vsrfs import config as _config
+except ImportError:
+    from configobj import empty_config as _config
+
 _UNIT_SIZE = mipc.UDPDumpPackerBase.MAXLEN // 2
 _MAX_SIZE = 2 * 1024 * 1024
 
+# f_read/f_write data size of a request: a datagram, or up to 4 datagrams
+# on the reliable port (rudp) which fragments messages. Binary data of
+# msgpack has a small overhead, JSON strings may be escaped.
+def _unit_size(port):
+    if port._packer.NAME == 'msgpack':
+        maxlen = min(port._packer.MAXLEN, 4 * mipc.UDPDumpPackerBase.MAXLEN)
+        return maxlen - 64
+    return _UNIT_SIZE
+
+def _udp_client(addr, negotiation=None):
+    if _config.reliable:
+        import rudp
+        return rudp.client(addr, negotiation=negotiation)
+    return mipc.udp_client(addr, negotiation=negotiation)
+
+_negotiations = {}	# server address: negotiated state of a port
+
+# Idle ports to a server kept for files. A new port takes the negotiated
+# state of the mount instead of a negotiation round trip.
+class _PortPool(object):
+
+    def __init__(self, addr, size):
+        self._addr = addr
+        self._size = size
+        self._ports = []
+
+    def get(self):
+        if self._ports:
+            return self._ports.pop()
+        return _udp_client(self._addr, _negotiations.get(self._addr))
+
+    def put(self, port):
+        if len(self._ports) < self._size:
+            self._ports.append(port)
+        else:
+            port.close()
+
+    def close(self):
+        for port in self._ports:
+            port.close()
+        self._ports = []
+
+# LRU cache of file blocks keyed by (file handle, block number), bounded by
+# the total size of cached blocks. It is shared by files of a mount.
+class _BlockCache(object):
+
+    def __init__(self, size):
+        self._size = size
+        self._used = 0
+        self._blocks = {}
+        self._lru = []		# keys, least recently used first
+
+    def get(self, key):
+        data = self._blocks.get(key)
+        if data is not None and self._lru[-1] != key:
+            self._lru.remove(key)
+            self._lru.append(key)
+        return data
+
+    def put(self, key, data):
+        self.discard(key)
+        self._blocks[key] = data
+        self._lru.append(key)
+        self._used += len(data)
+        while self._used > self._size and len(self._lru) > 1:
+            self.discard(self._lru[0])
+
+    def discard(self, key):
+        data = self._blocks.pop(key, None)
+        if data is not None:
+            self._lru.remove(key)
+            self._used -= len(data)
+
+    def discard_file(self, oh):
+        for key in [key for key in self._lru if key[0] == oh]:
+            self.discard(key)
+
 class VSRfsFile(genstream.genstream):
 
-    def __init__(self, addr, path, mode):
-        self._port = mipc.udp_client(addr)
-        oh, abspath = self._port.f_open(path, mode)
+    def __init__(self, pool, path, mode, cache=None, on_close=None):
+        self._port = None
+        port = pool.get()
+        try:
+            oh, abspath = port.f_open(path, mode)
+        except mipc.RemoteHandlerError:
+            pool.put(port)		# replied, so the port can be reused
+            raise
+        except:
+            port.close()		# a late reply may come, don't reuse it
+            raise
+        self._pool = pool
+        self._port = port
+        self._on_close = on_close
         self._pos = 0
         self._oh = oh
         self._abspath = path
+        self._cache = cache
+        self._block_size = _config.get('block_size', 1024)
+        self._unit = _unit_size(self._port)
+        self._next_block = 0	# block after the last fetched ones
+        self._wbuf = None	# write-behind buffer (memoryview)
+        self._wlen = 0
+        self._wpos = 0		# file position of the buffer
+        self._wfutures = []
+
+    # Fetch block n, and following blocks when reading sequentially. Blocks
+    # are read by f_read of a datagram size, pipelined up to window requests.
+    def _fetch(self, n):
+        bs = self._block_size
+        count = 1
+        if n == self._next_block:
+            count += _config.get('readahead', 2)
+        reqs = []
+        pos = n * bs
+        while pos < (n + count) * bs:
+            size = min(self._unit, bs - pos % bs)
+            reqs.append((pos, size))
+            pos += size
+        reqs.reverse()
+        window = _config.get('window', 4)
+        futures = []
+        pieces = []
+        eof = False
+        while reqs or futures:
+            while reqs and not eof and len(futures) < window:
+                pos, size = reqs.pop()
+                futures.append((self._port.submit('f_read', self._oh, pos, size), size))
+            if not futures:
+                break
+            future, size = futures.pop(0)
+            pos, data = future.result()
+            if eof:
+                continue		# drain replies after EOF
+            pieces.append(data)
+            if pos % bs == 0 or len(data) < size:
+                self._cache.put((self._oh, n), b''.join(pieces))
+                pieces = []
+                n += 1
+                eof = len(data) < size
+        self._next_block = n
+
+    # cached block at the current position and the offset in it
+    def _peek(self):
+        bs = self._block_size
+        n = self._pos // bs
+        key = (self._oh, n)
+        data = self._cache.get(key)
+        if data is None:
+            self._fetch(n)
+            data = self._cache.get(key) or b''
+        return data, self._pos - n * bs
 
     def read(self, size=None):
+        if self._wlen or self._wfutures:
+            self._flush_write()
+        if self._cache is None:
+            return self._read_direct(size)
+        if size is None or size < 0:
+            size = _MAX_SIZE
+        chunks = []
+        while size > 0:
+            data, i = self._peek()
+            data = data[i:i + size]
+            if not data:
+                break
+            chunks.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b''.join(chunks)
+
+    def _read_direct(self, size):
         def _read_by_unit(size):
             while size > 0:
                 r = _UNIT_SIZE if size > _UNIT_SIZE else size
@@ -34,7 +201,7 @@ class VSRfsFile(genstream.genstream):
         else:
             if size is None:
                 size = _MAX_SIZE
-            data = ''.join(_read_by_unit(size))
+            data = b''.join(_read_by_unit(size))
         return data
 
     def readinto(self, buf):
@@ -44,8 +211,26 @@ class VSRfsFile(genstream.genstream):
         return len(data)
 
     def readline(self, size=-1):
-        self._pos, data = self._port.f_readline(self._oh, self._pos, size)
-        return data
+        if self._wlen or self._wfutures:
+            self._flush_write()
+        if self._cache is None:
+            self._pos, data = self._port.f_readline(self._oh, self._pos, size)
+            return data
+        chunks = []
+        while size != 0:
+            data, i = self._peek()
+            if i >= len(data):
+                break
+            j = data.find(b'\n', i)
+            j = len(data) if j < 0 else j + 1
+            if 0 < size < j - i:
+                j = i + size
+            chunks.append(data[i:j])
+            self._pos += j - i
+            size -= j - i
+            if data[j - 1] == 0x0a:
+                break
+        return b''.join(chunks)
 
     def readlines(self, b):
         ls = []
@@ -55,38 +240,91 @@ class VSRfsFile(genstream.genstream):
                 return ls
             ls.append(s)
 
+    # Writes are coalesced in a buffer of a datagram size, and sent by
+    # f_write pipelined up to window requests. Data larger than the buffer
+    # is sent by slices of it without copy. Buffered data is sent on flush,
+    # seek, read and close.
     def write(self, data):
-        size = len(data)
-        if size < _UNIT_SIZE:
-            self._pos, n = self._port.f_write(self._oh, self._pos, data)
-        else:
-            n = 0
-            while size > 0:
-                r = _UNIT_SIZE if size > _UNIT_SIZE else size
-                self._pos, r = self._port.f_write(self._oh, self._pos, r)
-                size -= r
-                n += r
+        if self._cache is not None:
+            self._cache.discard_file(self._oh)
+            self._next_block = -1
+        unit = self._unit
+        if self._wbuf is None:
+            self._wbuf = memoryview(bytearray(unit))
+        if not self._wlen:
+            self._wpos = self._pos
+        mv = memoryview(data)
+        n = len(mv)
+        i = 0
+        while i < n:
+            if not self._wlen and n - i >= unit:
+                self._send_write(self._wpos, mv[i:i + unit])
+                self._wpos += unit
+                i += unit
+                continue
+            r = min(unit - self._wlen, n - i)
+            self._wbuf[self._wlen:self._wlen + r] = mv[i:i + r]
+            self._wlen += r
+            i += r
+            if self._wlen == unit:
+                self._send_write(self._wpos, self._wbuf)
+                self._wpos += unit
+                self._wlen = 0
+        self._pos += n
         return n
 
+    def _send_write(self, pos, data):
+        futures = self._wfutures
+        futures.append(self._port.submit('f_write', self._oh, pos, data))
+        if len(futures) >= _config.get('window', 4):
+            futures.pop(0).result()
+
+    def _flush_write(self):
+        if self._wlen:
+            self._send_write(self._wpos, self._wbuf[:self._wlen])
+            self._wpos += self._wlen
+            self._wlen = 0
+        futures = self._wfutures
+        while futures:
+            futures.pop(0).result()
+
     def seek(self, offset, whence=0):
-        self._pos = self._port.f_seek(self._oh, offset, whence)
+        self._flush_write()
+        if self._cache is not None and whence != 2:
+            self._pos = offset + (self._pos if whence == 1 else 0)
+        else:
+            self._pos = self._port.f_seek(self._oh, offset, whence)
         return self._pos
 
     def tell(self):
-        self._pos
+        return self._pos
 
     def flush(self):
-        self._pos = self._port.f_flush(self._oh)
+        self._flush_write()
+        self._port.f_flush(self._oh)
 
     def close(self):
         if self._port:
-            self._port.f_close(self._oh)
-            self._port.close()
-            self._port = None
+            if self._cache is not None:
+                self._cache.discard_file(self._oh)
+            port = self._port
+            try:
+                try:
+                    self._flush_write()
+                finally:
+                    port.f_close(self._oh)
+                self._pool.put(port)
+            except:
+                port.close()
+                raise
+            finally:
+                self._port = None
+                if self._on_close:
+                    self._on_close()
 
     def __iter__(self):
         while True:
-            self._pos, data = self._port.f_readline(self._oh, self._pos, 0)
+            data = self.readline()
             if not data:
                 return
             yield data
@@ -100,63 +338,150 @@ class VSRfsFile(genstream.genstream):
     def __del__(self):
         self.close()
 
+_S_IFDIR = 0x4000
+_NO_STAT = (0,) * 10		# stat of a missing path (as vsrfsd)
+
+def _normpath(path):
+    names = []
+    for name in path.split('/'):
+        if name == '..':
+            if names:
+                names.pop()
+        elif name and name != '.':
+            names.append(name)
+    return '/' + '/'.join(names)
+
+def _split(path):
+    i = path.rindex('/')
+    return (path[:i] or '/'), path[i+1:]
+
 class VSRfs(object):
 
     def __init__(self, addr):
         self._addr = addr	# (host, port)
         self._port = None
         self._cwd = '/'
+        self._cache = None
+        if _config.get('block_size', 1024):
+            self._cache = _BlockCache(_config.get('cache_size', 8192))
+        self._ttl = _config.get('stat_ttl', 2)
+        self._dirs = {}		# path: [expire, version, {name: stat} or None]
+        self._pool = _PortPool(addr, _config.get('ports', 4))
+        self._prefer_mpy = _config.get('prefer_mpy', True)
+        self._mpy_cache = _config.mpy_cache
 
     def _fullpath(self, path):
         if not path:
             return self._cwd
         if path[0] == '/':
-            return path
-        return self._cwd + '/' + path
+            return _normpath(path)
+        return _normpath(self._cwd + '/' + path)
+
+    # Entries of directory path as {name: stat}, or None if it's missing.
+    # A listing is used for stat_ttl seconds, then revalidated by its version
+    # (a hash of the names, sizes and mtimes on the server), for which
+    # listdir_stat sends no entries if nothing has changed.
+    def _listdir(self, path):
+        now = time.time()
+        ent = self._dirs.get(path)
+        if ent and now < ent[0]:
+            return ent[2]
+        version = ent[1] if ent and ent[2] is not None else None
+        try:
+            version, entries, start = self._port.listdir_stat(path, 0, version)
+        except mipc.RemoteHandlerError:
+            entries = None		# missing (or not a directory)
+        else:
+            if entries is None:		# unchanged
+                entries = ent[2]
+            else:
+                stats = {}
+                while True:
+                    for name, mode, ino, size, mtime in entries:
+                        stats[name] = (mode, ino, 0, 0, 0, 0, size, mtime, mtime, mtime)
+                    if start is None:
+                        break
+                    _, entries, start = self._port.listdir_stat(path, start)
+                entries = stats
+        if self._ttl:
+            self._dirs[path] = [now + self._ttl, version, entries]
+        return entries
+
+    def _invalidate(self, path):
+        self._dirs.pop(_split(path)[0], None)
+        self._dirs.pop(path, None)
 
     def mount(self, dev, mount_point):
-        self._port = mipc.udp_client(self._addr)
+        self._port = _udp_client(self._addr)
+        _negotiations[self._addr] = self._port.negotiation()
+        if self._mpy_cache:
+            try:
+                os.mkdir(self._mpy_cache)
+            except OSError:
+                pass
 
     def umount(self):
         self._port.close()
         self._port = None
+        self._pool.close()
+        self._dirs = {}
 
     def chdir(self, path):
         path = self._fullpath(path)
-        self._cwd = self._port.check_chdir(path)
+        if not self.stat(path)[0] & _S_IFDIR:
+            raise OSError(20)		# ENOTDIR
+        self._cwd = path
 
     def getcwd(self):
         return self._cwd
 
     def ilistdir(self, path):
-        port = mipc.udp_client(self._addr)
-        oh = self._port.ilistdir(path)
-        while True:
-            v = port.ilistdir_next(oh)
-            if not v:
-                return
-            yield v
+        entries = self._listdir(self._fullpath(path))
+        if entries is None:
+            raise OSError(2)		# ENOENT
+        for name, st in entries.items():
+            yield (name, st[0], st[1], st[6])
 
     def mkdir(self, path):
         path = self._fullpath(path)
+        self._invalidate(path)
         self._port.mkdir(path)
 
     def remove(self, path):
         path = self._fullpath(path)
+        self._invalidate(path)
         self._port.remove(path)
 
     def rename(self, path1, path2):
         path1 = self._fullpath(path1)
         path2 = self._fullpath(path2)
+        self._invalidate(path1)
+        self._invalidate(path2)
         self._port.rename(path1, path2)
 
     def rmdir(self, path):
         path = self._fullpath(path)
+        self._invalidate(path)
         self._port.rmdir(path)
 
+    # stat from the listing of the parent directory, which also answers for
+    # missing paths (MicroPython's import stats many candidates). With
+    # prefer_mpy, X.py is missing if there is X.mpy (vsrfsd -m compiles
+    # it), as import tries X.py first.
     def stat(self, path):
         path = self._fullpath(path)
-        return tuple(self._port.stat(path))
+        if path == '/' or not self._ttl:
+            if (self._prefer_mpy and path.endswith('.py') and
+                    self._port.stat(path[:-3] + '.mpy')[0]):
+                return _NO_STAT
+            return tuple(self._port.stat(path))
+        parent, name = _split(path)
+        entries = self._listdir(parent)
+        if entries is None:
+            return _NO_STAT
+        if self._prefer_mpy and name.endswith('.py') and name[:-3] + '.mpy' in entries:
+            return _NO_STAT
+        return entries.get(name, _NO_STAT)
 
     def statvfs(self, path):
         path = self._fullpath(path)
@@ -164,7 +489,47 @@ class VSRfs(object):
 
     def open(self, path, mode='r', *args, **kwargs):
         path = self._fullpath(path)
-        return VSRfsFile(self._addr, path, mode)
+        on_close = None
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            self._invalidate(path)
+            on_close = lambda: self._invalidate(path)
+        elif self._mpy_cache and path.endswith('.mpy'):
+            st = self._port.stat(path)		# fresh, not of the listing
+            if st[0]:
+                return self._open_mpy(path, st[8], mode)
+        return VSRfsFile(self._pool, path, mode, self._cache, on_close)
+
+    # A fetched .mpy is kept in mpy_cache of the local file system, named by
+    # its path and the server mtime, so that an unchanged module is loaded
+    # from the flash without fetching it. The mtime is of a stat request on
+    # open, as a listing may be up to stat_ttl seconds old.
+    def _open_mpy(self, path, mtime, mode):
+        name = path[1:].replace('/', '%')
+        cpath = '%s/%s.%d' % (self._mpy_cache, name, mtime)
+        try:
+            return open(cpath, mode)
+        except OSError:
+            pass
+        for cname in os.listdir(self._mpy_cache):	# other versions, stale tmps
+            base = cname[:-4] if cname.endswith('.tmp') else cname
+            if base[:base.rfind('.')] == name:
+                os.remove(self._mpy_cache + '/' + cname)
+        try:
+            with VSRfsFile(self._pool, path, 'rb', self._cache) as f:
+                with open(cpath + '.tmp', 'wb') as out:
+                    while True:
+                        data = f.read(1024)
+                        if not data:
+                            break
+                        out.write(data)
+        except:
+            try:
+                os.remove(cpath + '.tmp')
+            except OSError:
+                pass
+            raise
+        os.rename(cpath + '.tmp', cpath)
+        return open(cpath, mode)
 
 def test():
     import sys